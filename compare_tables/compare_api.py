@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+程序内调用接口：输入为工作簿字节 / 文件对象 / DataFrame，输出为结果表与可选的 xlsx 字节，
+不经过临时文件，也不向标准输出打印（处理信息收集在结果的 log 中）。
+
+    index = ScanIndex.from_workbooks([scan_bytes])        # 建立一次，多次比对复用（比对只读，可多线程共用）
+    result = index.compare(pkg_bytes, name="CA操作分表.xlsx")
+    result["compare"], result["unreport"], result["near_miss"]   # 比较结果 / 未预报结果 / 近似匹配建议
+    result["report_xlsx"], result["backfill_xlsx"]              # 合并报告与回填结果的 xlsx 字节
+    summary, summary_xlsx = index.batch_summary([result, ...], as_xlsx=True)
+
+结果字典的结果字段与 process_full_workflow 的返回值一致（name / compare / unreport / near_miss / summary /
+matched_scans / scan_matched）；不写文件，因此没有 merged_report_file / report_files / backfill_file / backfill_ok，
+改为 report_xlsx / backfill_xlsx（未生成时为 None），另加处理信息 log。报告与回填内容与命令行导出的文件相同。
+"""
+
+import io
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from compare_table_v3 import (
+    EXCEL_MAX_DATA_ROWS,
+    build_batch_summary,
+    build_near_miss_index,
+    build_pkg_keys,
+    build_scan_index,
+    classify_results,
+    collect_matched_scans,
+    container_name,
+    compare_scan_to_pkg,
+    compare_tables,
+    export_backfill_to_original,
+    export_batch_summary,
+    export_merged_with_colors,
+    filter_valid_boxes,
+    find_match_pairs,
+    find_reverse_matches,
+    prepare_scan_data,
+    preprocess_pkg_list,
+    suggest_near_misses,
+    summarize_compare_result,
+)
+
+WorkbookSource = Union[bytes, bytearray, memoryview, io.IOBase, str, Path]
+
+
+class _ThreadOutput:
+    """
+    按线程转发标准输出：正在捕获的线程写入各自的缓冲，其他线程照常输出。
+    write 以外的属性（buffer、fileno、encoding 等）都取自原来的标准输出
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.local = threading.local()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.target).write(text)
+
+    def flush(self):
+        self.target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+_OUTPUT_LOCK = threading.Lock()
+# 正在进行的捕获数与安装的转发对象：第一个捕获开始时替换 sys.stdout，最后一个结束时恢复
+_capture_count = 0
+_router: Optional[_ThreadOutput] = None
+
+
+@contextmanager
+def captured_output():
+    """捕获当前线程的 print 输出（不影响其他线程），返回收集输出的 StringIO；所有捕获结束后恢复 sys.stdout"""
+    global _capture_count, _router
+    with _OUTPUT_LOCK:
+        if _capture_count == 0:
+            _router = _ThreadOutput(sys.stdout)
+            sys.stdout = _router
+        _capture_count += 1
+        router = _router
+    buffer = io.StringIO()
+    previous = getattr(router.local, "buffer", None)
+    router.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        router.local.buffer = previous
+        with _OUTPUT_LOCK:
+            _capture_count -= 1
+            if _capture_count == 0:
+                # 期间被其他代码替换过的 sys.stdout 保持不变
+                if sys.stdout is router:
+                    sys.stdout = router.target
+                _router = None
+
+
+def _workbook_bytes(source: WorkbookSource) -> bytes:
+    """工作簿内容：字节原样返回，文件对象读出全部内容，路径读取文件"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        return source.read()
+    return Path(source).read_bytes()
+
+
+def _xlsx_bytes(write) -> bytes:
+    buffer = io.BytesIO()
+    write(buffer)
+    return buffer.getvalue()
+
+
+class ScanIndex:
+    """
+    预处理后的扫描数据及其条码索引（正向、逆向、近似条码），建立一次后在多次比对间复用。
+    比对只读取索引，同一个 ScanIndex 可在多个线程中同时使用。
+    """
+
+    def __init__(self, df_scan: pd.DataFrame):
+        self.df_scan = df_scan
+        self.forward_index = build_scan_index(df_scan)
+        self.reverse_index = build_scan_index(df_scan, min_length=1)
+        self.near_miss_index = build_near_miss_index(df_scan)
+
+    def __len__(self) -> int:
+        return len(self.df_scan)
+
+    @classmethod
+    def from_frames(cls, scan_lists: Iterable[pd.DataFrame], containers=None) -> "ScanIndex":
+        """由原始扫描表（pd.read_excel 读出的扫描工作表）建立；多个表按文件夹方式合并处理"""
+        with captured_output():
+            return cls(prepare_scan_data(list(scan_lists), containers))
+
+    @classmethod
+    def from_workbooks(cls, sources: Union[WorkbookSource, Iterable[WorkbookSource]], containers=None) -> "ScanIndex":
+        """由扫描数据工作簿（字节、文件对象或路径，可为多个）建立"""
+        if isinstance(sources, (bytes, bytearray, memoryview, str, Path)) or hasattr(sources, "read"):
+            sources = [sources]
+        scan_lists = [pd.read_excel(io.BytesIO(_workbook_bytes(source))) for source in sources]
+        return cls.from_frames(scan_lists, containers)
+
+    def compare(self, pkg: Union[WorkbookSource, pd.DataFrame], name: str, report: bool = True,
+                backfill: bool = True, fill_mode: str = "cells",
+                max_rows: int = EXCEL_MAX_DATA_ROWS) -> dict:
+        """
+        比对一个操作分表。pkg 为操作分表工作簿（字节、文件对象或路径），或已预处理的包裹清单
+        （preprocess_pkg_list 的结果，此时没有原始工作簿，不生成回填结果）。
+        name 为操作分表文件名（如 "CA操作分表.xlsx"），用于得到箱号与结果名称；
+        pkg 为工作簿时必须能从 name 得到箱号（"操作分表" 之前的部分非空），否则抛出 ValueError。
+        report / backfill 控制是否生成合并报告与回填结果的 xlsx 字节；超出 max_rows 的结果在报告内分为多个工作表。
+        """
+        with captured_output() as log:
+            workbook = None
+            if isinstance(pkg, pd.DataFrame):
+                df_pkg = pkg
+            else:
+                if not container_name(name):
+                    raise ValueError(f"无法从操作分表文件名得到箱号: {name!r}（应为 <箱号>操作分表.xlsx）")
+                workbook = _workbook_bytes(pkg)
+                df_pkg = preprocess_pkg_list(io.BytesIO(workbook), name)
+
+            keys = build_pkg_keys(df_pkg)
+            df_compare = compare_tables(self.df_scan, df_pkg, find_match_pairs(keys, self.forward_index))
+            df_near_miss = suggest_near_misses(df_compare, self.df_scan, self.near_miss_index)
+            first_match = find_reverse_matches(keys, self.reverse_index, len(self.df_scan))
+            df_unreport = filter_valid_boxes(compare_scan_to_pkg(self.df_scan, df_pkg, first_match))
+            classify_results(df_compare, df_unreport)
+
+            report_xlsx = None
+            if report:
+                report_xlsx = _xlsx_bytes(lambda buffer: export_merged_with_colors(
+                    df_compare, df_unreport, buffer, df_near_miss, fill_mode=fill_mode, max_rows=max_rows))
+            backfill_xlsx = None
+            if backfill and workbook is not None:
+                backfill_xlsx = _xlsx_bytes(lambda buffer: export_backfill_to_original(
+                    io.BytesIO(workbook), df_compare, buffer))
+
+        result_name = Path(name).stem
+        return {
+            "name": result_name,
+            "compare": df_compare,
+            "unreport": df_unreport,
+            "near_miss": df_near_miss,
+            "summary": summarize_compare_result(result_name, df_compare),
+            "matched_scans": collect_matched_scans(result_name, df_compare),
+            "scan_matched": first_match >= 0,
+            "report_xlsx": report_xlsx,
+            "backfill_xlsx": backfill_xlsx,
+            "log": log.getvalue(),
+        }
+
+    def batch_summary(self, results: List[dict], as_xlsx: bool = False) -> Tuple[dict, Optional[bytes]]:
+        """由多次 compare 的结果生成批次汇总（同命令行的 批次汇总.xlsx），as_xlsx 时同时返回 xlsx 字节"""
+        scan_matched = np.zeros(len(self.df_scan), dtype=bool)
+        for result in results:
+            scan_matched |= result["scan_matched"]
+        summary = build_batch_summary([result["summary"] for result in results], self.df_scan, scan_matched,
+                                      [result["matched_scans"] for result in results])
+        summary_xlsx = None
+        if as_xlsx:
+            with captured_output():
+                summary_xlsx = _xlsx_bytes(lambda buffer: export_batch_summary(summary, buffer))
+        return summary, summary_xlsx
+
+
+def compare_workbooks(scan_sources: Union[WorkbookSource, Iterable[WorkbookSource]],
+                      pkg: Union[WorkbookSource, pd.DataFrame], name: str, **options) -> dict:
+    """一次性比对：建立扫描索引后比对一个操作分表（多次比对请持有 ScanIndex 复用索引）"""
+    return ScanIndex.from_workbooks(scan_sources).compare(pkg, name, **options)
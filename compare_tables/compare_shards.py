@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+按箱号分片处理操作分表，用于多机/多进程跑批。
+
+    plan   按箱号把操作分表及相关扫描划分为若干分片（每个分片一个目录 + manifest.json）
+    run    独立执行一个分片（可拷贝到其他机器运行），每个文件的处理与 process_full_workflow 相同
+    merge  合并各分片结果，生成批次汇总（含跨文件重复扫描与全局未匹配扫描）
+    local  在本机用多个进程依次完成 plan -> run -> merge
+
+每个分片携带的扫描数据 = 与分片内包裹条码匹配的扫描 + 这些扫描所在箱号及分片箱号的全部扫描，
+因此正向比对、逆向比对及其箱号筛选结果与整批运行一致；近似条码建议只在分片扫描数据内查找，可能少于整批运行。
+
+重新 plan 会清除分片目录中旧的分片；merge 只合并当前计划（plan.json）中的分片，
+并拒绝不属于当前计划、或结果早于 manifest 的分片。
+"""
+
+import argparse
+import json
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from compare_table_v3 import (
+    DEFAULT_OUTPUT_DIR,
+    build_batch_summary,
+    build_near_miss_index,
+    build_pkg_keys,
+    build_scan_index,
+    container_name,
+    export_batch_summary,
+    find_match_pairs,
+    list_pkg_files,
+    load_scan_data,
+    preprocess_pkg_list,
+    process_full_workflow,
+)
+
+MANIFEST_NAME = "manifest.json"
+PLAN_NAME = "plan.json"
+SCANS_FULL_NAME = "scans_full.pkl"
+
+
+def clear_shard_dir(shard_dir: Path):
+    """删除上次计划留下的分片目录、计划文件与扫描数据，避免合并时混入旧分片或旧结果"""
+    for path in shard_dir.glob("shard_*"):
+        if path.is_dir():
+            shutil.rmtree(path)
+    for name in (PLAN_NAME, SCANS_FULL_NAME):
+        (shard_dir / name).unlink(missing_ok=True)
+
+
+def relevant_scan_positions(df_scan: pd.DataFrame, pkg_frames: List[pd.DataFrame],
+                            containers: List[str], scan_index: Dict[int, Dict[str, List[int]]]) -> np.ndarray:
+    """
+    计算与一组操作分表相关的扫描行位置：条码命中任一包裹的扫描，加上命中扫描所在箱号与分片箱号的全部扫描
+    """
+    hit_positions = set()
+    for df_pkg in pkg_frames:
+        pairs = find_match_pairs(build_pkg_keys(df_pkg), scan_index)
+        hit_positions.update(pairs["scan_pos"].tolist())
+
+    boxes = set(containers)
+    if "箱号" in df_scan.columns:
+        scan_boxes = df_scan["箱号"].to_numpy(dtype=object)
+        boxes.update(scan_boxes[sorted(hit_positions)].tolist())
+        in_boxes = np.flatnonzero(df_scan["箱号"].isin(boxes).to_numpy())
+        hit_positions.update(in_boxes.tolist())
+
+    return np.array(sorted(hit_positions), dtype=np.int64)
+
+
+def plan_shards(table_a: str, table_b: str, n_shards: int, shard_dir: Path) -> List[Path]:
+    """
+    生成分片：同一箱号的文件归入同一分片，按包裹行数贪心均衡各分片负载。返回各分片 manifest 路径。
+    """
+    shard_dir = Path(shard_dir)
+    df_scan = load_scan_data(Path(table_a))
+    if df_scan is None:
+        print("错误: 无法加载扫描数据，无法生成分片。")
+        return []
+
+    table_b_path = Path(table_b)
+    pkg_files = list_pkg_files(table_b_path) if table_b_path.is_dir() else [table_b_path]
+    if not pkg_files:
+        print("错误: 没有找到操作分表")
+        return []
+
+    groups: Dict[str, List[int]] = {}
+    for order, pkg_file in enumerate(pkg_files):
+        groups.setdefault(container_name(pkg_file), []).append(order)
+
+    # 逆向比对不限制条码长度，按最短长度建立索引才能覆盖所有可能命中的扫描
+    scan_index = build_scan_index(df_scan, min_length=1)
+    container_positions = {}
+    container_weight = {}
+    for container, orders in groups.items():
+        frames = []
+        for order in orders:
+            try:
+                frames.append(preprocess_pkg_list(str(pkg_files[order])))
+            except Exception as e:
+                print(f"  警告: 预处理失败 {pkg_files[order].name} - {e}")
+        container_positions[container] = relevant_scan_positions(df_scan, frames, [container], scan_index)
+        container_weight[container] = sum(len(f) for f in frames) + 1
+
+    n_shards = max(1, min(n_shards, len(groups)))
+    shards = [{"containers": [], "weight": 0} for _ in range(n_shards)]
+    for container in sorted(groups, key=lambda c: -container_weight[c]):
+        target = min(shards, key=lambda shard: shard["weight"])
+        target["containers"].append(container)
+        target["weight"] += container_weight[container]
+
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    clear_shard_dir(shard_dir)
+    df_scan.to_pickle(shard_dir / SCANS_FULL_NAME)
+    plan_id = uuid.uuid4().hex
+
+    manifests = []
+    for shard_id, shard in enumerate(shards):
+        path = shard_dir / f"shard_{shard_id:03d}"
+        (path / "pkg").mkdir(parents=True, exist_ok=True)
+
+        orders = sorted(order for container in shard["containers"] for order in groups[container])
+        pkg_entries = []
+        for order in orders:
+            shutil.copy2(pkg_files[order], path / "pkg" / pkg_files[order].name)
+            pkg_entries.append({"file": f"pkg/{pkg_files[order].name}", "order": order})
+
+        positions = np.unique(np.concatenate(
+            [container_positions[c] for c in shard["containers"]] or [np.array([], dtype=np.int64)]))
+        pd.to_pickle({"scans": df_scan.iloc[positions], "positions": positions}, path / "scans.pkl")
+
+        manifest = {
+            "plan": plan_id,
+            "shard": shard_id,
+            "containers": shard["containers"],
+            "pkg_files": pkg_entries,
+            "scan_file": "scans.pkl",
+            "result_file": "result.pkl",
+        }
+        with open(path / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        manifests.append(path / MANIFEST_NAME)
+        print(f"分片 {shard_id}: {len(shard['containers'])} 个箱号, {len(pkg_entries)} 个文件, "
+              f"{len(positions)} 行扫描数据")
+
+    with open(shard_dir / PLAN_NAME, "w", encoding="utf-8") as f:
+        json.dump({"plan": plan_id, "shards": [str(m.relative_to(shard_dir)) for m in manifests],
+                   "total_files": len(pkg_files)}, f, ensure_ascii=False, indent=2)
+    return manifests
+
+
+def run_shard(manifest_path: str, output_dir: str = None) -> bool:
+    """
+    执行单个分片，将每个文件的统计结果（及处理失败的文件）写入分片目录下的 result.pkl 供 merge 使用。
+    全部文件处理成功时返回 True。
+    """
+    manifest_path = Path(manifest_path)
+    shard_path = manifest_path.parent
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    scan_data = pd.read_pickle(shard_path / manifest["scan_file"])
+    df_scan = scan_data["scans"]
+    positions = scan_data["positions"]
+    near_miss_index = build_near_miss_index(df_scan)
+
+    file_results = []
+    failed = []
+    matched_positions = []
+    for entry in manifest["pkg_files"]:
+        pkg_file = shard_path / entry["file"]
+        print(f"\n[分片 {manifest['shard']}] 处理文件: {pkg_file.name}")
+        print("-" * 60)
+        result = process_full_workflow(str(pkg_file), df_scan, near_miss_index, output_dir)
+        if result:
+            file_results.append({
+                "order": entry["order"],
+                "summary": result["summary"],
+                "matched_scans": result["matched_scans"],
+            })
+            matched_positions.append(positions[result["scan_matched"]])
+        else:
+            failed.append(entry["file"])
+
+    pd.to_pickle({
+        "plan": manifest.get("plan"),
+        "shard": manifest["shard"],
+        "total": len(manifest["pkg_files"]),
+        "files": file_results,
+        "failed": failed,
+        "matched_positions": np.unique(np.concatenate(matched_positions or [np.array([], dtype=np.int64)])),
+    }, shard_path / manifest["result_file"])
+    print(f"\n分片 {manifest['shard']} 完成: 成功处理 {len(file_results)}/{len(manifest['pkg_files'])} 个文件")
+    if failed:
+        print(f"  失败: {', '.join(failed)}")
+    return not failed
+
+
+def merge_shards(shard_dir: Path, output_dir: Path = None) -> bool:
+    """
+    合并当前计划中各分片的结果，生成与整批运行相同格式的批次汇总。
+    不属于当前计划的分片目录、结果早于 manifest 或来自其他计划的结果都不参与合并。
+    全部文件都有结果时返回 True。
+    """
+    shard_dir = Path(shard_dir)
+    output_dir = Path(output_dir) if output_dir is not None else DEFAULT_OUTPUT_DIR
+    plan_path = shard_dir / PLAN_NAME
+    if not plan_path.exists():
+        print(f"错误: 分片目录中没有分片计划 {PLAN_NAME}，请先执行 plan")
+        return False
+    with open(plan_path, encoding="utf-8") as f:
+        plan = json.load(f)
+    df_scan = pd.read_pickle(shard_dir / SCANS_FULL_NAME)
+
+    planned = {shard_dir / name for name in plan["shards"]}
+    for manifest_path in sorted(set(shard_dir.glob(f"shard_*/{MANIFEST_NAME}")) - planned):
+        print(f"警告: {manifest_path.parent.name} 不属于当前分片计划，已忽略")
+
+    file_results = []
+    failed = []
+    scan_matched = np.zeros(len(df_scan), dtype=bool)
+    for manifest_path in sorted(planned):
+        if not manifest_path.exists():
+            print(f"警告: 分片 {manifest_path.parent.name} 缺少 {MANIFEST_NAME}，已跳过")
+            continue
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("plan") != plan["plan"]:
+            print(f"警告: 分片 {manifest_path.parent.name} 不属于当前分片计划，已跳过")
+            continue
+        result_path = manifest_path.parent / manifest["result_file"]
+        if not result_path.exists():
+            print(f"警告: 分片 {manifest['shard']} 尚无结果，已跳过")
+            continue
+        if result_path.stat().st_mtime < manifest_path.stat().st_mtime:
+            print(f"警告: 分片 {manifest['shard']} 的结果早于分片 manifest（旧结果），已跳过")
+            continue
+        result = pd.read_pickle(result_path)
+        if result.get("plan") != plan["plan"]:
+            print(f"警告: 分片 {manifest['shard']} 的结果来自其他分片计划，已跳过")
+            continue
+        file_results.extend(result["files"])
+        failed.extend(result.get("failed", []))
+        scan_matched[result["matched_positions"]] = True
+    total_files = plan["total_files"]
+
+    file_results.sort(key=lambda item: item["order"])
+    summary = build_batch_summary([item["summary"] for item in file_results], df_scan, scan_matched,
+                                  [item["matched_scans"] for item in file_results])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    export_batch_summary(summary, str(output_dir / "批次汇总.xlsx"))
+    print(f"合并完成: {len(file_results)}/{total_files} 个文件有结果")
+    if failed:
+        print(f"处理失败的文件: {', '.join(failed)}")
+    return len(file_results) == total_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按箱号分片处理操作分表')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    plan_parser = subparsers.add_parser('plan', help='生成分片')
+    local_parser = subparsers.add_parser('local', help='本机多进程执行全部分片并合并')
+    for sub in (plan_parser, local_parser):
+        sub.add_argument('table_a', nargs='?', default='./compare_tables_test/input_scan',
+                         help='表A文件路径或文件夹(扫描数据)')
+        sub.add_argument('table_b', nargs='?', default='./compare_tables_test/input_pkg',
+                         help='表B文件路径或文件夹(包裹清单)')
+        sub.add_argument('--shards', type=int, default=4, help='分片数量')
+        sub.add_argument('--shard-dir', default='./compare_tables_test/shards', help='分片目录')
+    local_parser.add_argument('--workers', type=int, default=4, help='本机并行进程数')
+
+    run_parser = subparsers.add_parser('run', help='执行单个分片')
+    run_parser.add_argument('manifest', help='分片 manifest.json 路径')
+
+    merge_parser = subparsers.add_parser('merge', help='合并分片结果')
+    merge_parser.add_argument('--shard-dir', default='./compare_tables_test/shards', help='分片目录')
+
+    for sub in (local_parser, run_parser, merge_parser):
+        sub.add_argument('--output-dir', default=str(DEFAULT_OUTPUT_DIR), help='报告输出目录')
+
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        plan_shards(args.table_a, args.table_b, args.shards, Path(args.shard_dir))
+    elif args.command == 'run':
+        if not run_shard(args.manifest, args.output_dir):
+            raise SystemExit(1)
+    elif args.command == 'merge':
+        merge_shards(Path(args.shard_dir), Path(args.output_dir))
+    elif args.command == 'local':
+        manifests = plan_shards(args.table_a, args.table_b, args.shards, Path(args.shard_dir))
+        if not manifests:
+            return
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            completed = list(pool.map(run_shard, [str(m) for m in manifests], [args.output_dir] * len(manifests)))
+        if not all(completed):
+            print(f"警告: {completed.count(False)} 个分片有文件处理失败")
+        merge_shards(Path(args.shard_dir), Path(args.output_dir))
+
+
+if __name__ == "__main__":
+    main()
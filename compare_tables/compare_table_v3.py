@@ -2,11 +2,27 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import base64
+import gzip
+import hashlib
+import heapq
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+import numpy as np
 import pandas as pd
-import re
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from openpyxl.formatting.rule import FormulaRule
 from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+
+from progress import BatchProgress
+from scan_store import (build_code_index, column_keys, gather_scan_rows, index_match_pairs, open_scan_store,
+                        publish_scan_store, store_match_pairs)
+from seen_store import SeenStore
 
 # =================================================================================================
 #  Utility Functions (Originally from compare_utils.py)
@@ -51,60 +67,232 @@ def convert_base36(dec_value: int) -> str:
     return base36.upper().zfill(7)
 
 
+BASE36_CHARS = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+
+
+def convert_base36_vectorized(dec_values: pd.Series) -> pd.Series:
+    """
+    convert_base36 的按列版本：空值/负数转换为 "0000000"，不足 7 位左侧补 0。
+    """
+    values = pd.to_numeric(dec_values, errors="coerce")
+    valid = (values.notna() & (values >= 0)).to_numpy()
+    remaining = np.where(valid, values.fillna(0).to_numpy(), 0).astype(np.int64)
+
+    # 11 位十进制数 < 36^8，8 位 36 进制足够；最高位为 0 时截去，与 zfill(7) 一致
+    digits = []
+    for _ in range(8):
+        digits.append(remaining % 36)
+        remaining //= 36
+    text = BASE36_CHARS[digits[6]].astype(object)
+    for d in reversed(digits[:6]):
+        text = text + BASE36_CHARS[d].astype(object)
+    text = np.where(digits[7] == 0, text, BASE36_CHARS[digits[7]].astype(object) + text)
+    text = np.where(valid, text, "0000000")
+    return pd.Series(text, index=dec_values.index, dtype=object)
+
+
+# -------------------------------------------------------------------------------------------------
+#  条码解码器注册表
+#  每种格式声明廉价的长度/前缀条件和按列解码函数；新增格式只需调用 register_barcode_decoder。
+# -------------------------------------------------------------------------------------------------
+
+BARCODE_DECODERS: List[dict] = []
+_DECODE_CACHE: Dict[str, object] = {}
+_DECODE_CACHE_LIMIT = 2_000_000
+
+
+def register_barcode_decoder(name: str, decode: Callable[[pd.Series], pd.Series],
+                             lengths: Optional[Iterable[int]] = None, prefix: str = "",
+                             predicate: Optional[Callable[[pd.Series], pd.Series]] = None):
+    """
+    注册条码解码器。
+    lengths/prefix 用于按 (长度, 前缀) 分桶快速筛选；predicate 为额外的按列判断（返回布尔 Series）；
+    decode 接收满足条件的条码 Series（已去空格），返回同索引的解码结果 Series。
+    按注册顺序匹配，先匹配者生效。
+    """
+    BARCODE_DECODERS.append({
+        "name": name,
+        "lengths": None if lengths is None else set(lengths),
+        "prefix": prefix,
+        "predicate": predicate,
+        "decode": decode,
+    })
+    _DECODE_CACHE.clear()
+
+
+def _decode_c20(texts: pd.Series) -> pd.Series:
+    """情况3：C + 2位数字 + ... ，第6-16位为十进制数转36进制，末4位保留"""
+    dec_part = texts.str.slice(5, 16)
+    dec_value = dec_part.where(dec_part.str.isdigit())
+    base36 = convert_base36_vectorized(dec_value)
+    return "FBA15" + base36 + "U00" + texts.str.slice(16, 20)
+
+
+register_barcode_decoder(
+    "C20",
+    _decode_c20,
+    lengths=[20],
+    prefix="C",
+    predicate=lambda texts: texts.str.slice(1, 3).str.isdigit(),
+)
+
+
+def decode_barcodes(texts: pd.Series) -> pd.Series:
+    """
+    按注册表解码条码，未命中任何解码器的位置为 None。
+    仅对缓存中没有的唯一值按 (长度, 前缀) 分桶解码，重复扫描的同一条码只解码一次。
+    """
+    unique_texts = pd.unique(texts.to_numpy(dtype=object))
+    # 本批次的解码结果单独保存，缓存超出上限被清空时不影响本批次
+    lookup = {t: _DECODE_CACHE[t] for t in unique_texts if t in _DECODE_CACHE}
+    pending = pd.Series([t for t in unique_texts if t not in lookup], dtype=object)
+
+    if len(pending):
+        decoded = pd.Series(None, index=pending.index, dtype=object)
+        for length, bucket in pending.groupby(pending.str.len()):
+            unresolved = pd.Series(True, index=bucket.index)
+            for decoder in BARCODE_DECODERS:
+                if decoder["lengths"] is not None and length not in decoder["lengths"]:
+                    continue
+                mask = unresolved & bucket.str.startswith(decoder["prefix"])
+                if decoder["predicate"] is not None and mask.any():
+                    mask &= decoder["predicate"](bucket[mask]).reindex(bucket.index, fill_value=False)
+                if mask.any():
+                    result = decoder["decode"](bucket[mask])
+                    decoded.loc[result.index] = result.to_numpy(dtype=object)
+                    unresolved &= ~mask
+        lookup.update(zip(pending, decoded))
+        if len(_DECODE_CACHE) + len(pending) > _DECODE_CACHE_LIMIT:
+            _DECODE_CACHE.clear()
+        _DECODE_CACHE.update(zip(pending, decoded))
+
+    return pd.Series([lookup[t] for t in texts], index=texts.index, dtype=object)
+
+
+def clear_decode_cache():
+    _DECODE_CACHE.clear()
+
+
 def process_encoded_data(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[Tuple[int, int, str]]]:
     """
     根据原始 Excel 脚本的逻辑处理 Pandas DataFrame 中的字符串数据。
+    解码规则见条码解码器注册表，结果写入新增的 fba条码 列（未解码的保留原文本）。
     """
     df_processed = df.copy()
     df_processed.reset_index(drop=True, inplace=True)
     text_format_cells: List[Tuple[int, int, str]] = []
     changed_cols = set()
-    
-    target_col_idx = -1
+
+    # 如果找到了'条码'列，仅处理该列；否则处理所有列（后面的列覆盖前面的结果）
     if '条码' in df_processed.columns:
-         target_col_idx = df_processed.columns.get_loc('条码')
+        target_cols = [df_processed.columns.get_loc('条码')]
+    else:
+        target_cols = list(range(len(df_processed.columns)))
 
-    for i, row in enumerate(df_processed.itertuples(index=False)):
-        for j, cell_value in enumerate(row):
-            # 如果找到了'条码'列，仅处理该列；否则处理所有列
-            if target_col_idx != -1 and j != target_col_idx:
-                continue
+    fba_codes = None
+    for j in target_cols:
+        values = df_processed.iloc[:, j]
+        is_str = np.fromiter((isinstance(v, str) for v in values), dtype=bool, count=len(values))
+        if not is_str.any():
+            continue
 
-            if isinstance(cell_value, str):
-                text = cell_value.strip()
-                is_processed = False
-                new_value = None
-                                    
-                # 情况3：20位且以 "C" 开头，且C后面跟2位数字
-                if len(text) == 20 and text.startswith("C") and text[1:3].isdigit():
-                    dec_part = text[5:16]
-                    dec_value = int(dec_part) if dec_part.isdigit() else None
-                    base36 = convert_base36(dec_value)
-                    last_four = text[16:20]
-                    new_value = f"FBA15{base36}U00{last_four}"
-                    is_processed = True
-                    changed_cols.add(j)
-                
-                # 更新处理后的值（不覆盖原值，新增列存放FBA条码）
-                if is_processed and new_value is not None:
-                    df_processed.loc[i, "fba条码"] = new_value
-                else:
-                    df_processed.loc[i, "fba条码"] = text
-                
-                if not is_processed and re.fullmatch(r'\d+', text):
-                    text_format_cells.append((i, j, text))
+        texts = values[is_str].astype(object).str.strip()
+        decoded = decode_barcodes(texts)
+        is_processed = decoded.notna()
+        if is_processed.any():
+            changed_cols.add(j)
+
+        if fba_codes is None:
+            fba_codes = pd.Series(np.nan, index=df_processed.index, dtype=object)
+        fba_codes[texts.index] = decoded.where(is_processed, texts)
+
+        numeric = texts[~is_processed & texts.str.fullmatch(r'\d+')]
+        text_format_cells.extend((i, j, text) for i, text in numeric.items())
+
+    if fba_codes is not None:
+        if "fba条码" in df_processed.columns:
+            fba_codes = fba_codes.where(fba_codes.notna(), df_processed["fba条码"])
+        df_processed["fba条码"] = fba_codes
+    text_format_cells.sort(key=lambda cell: (cell[0], cell[1]))
 
     return df_processed, text_format_cells, changed_cols
 
 
-def preprocess_scan_list(df: pd.DataFrame) -> pd.DataFrame:
-    """按要求预处理：去掉末尾4行，补充缺少两个逗号的行，并按第2/4列去重。"""
+def scan_container_mask(df: pd.DataFrame, containers, other_containers: bool = False) -> pd.Series:
+    """
+    按第2列（"箱号,渠道号,托盘号"）中的箱号筛选扫描行。
+    默认保留箱号属于 containers 的行以及无法解析出箱号的行；other_containers=True 时只保留其他箱号的行。
+    """
+    col2 = df.columns[1]
+    values = df[col2].astype(object)
+    values = values.where(values.notna(), '').astype(str)
+    parsed = values.str.count(',') == 2
+    in_containers = parsed & values.str.split(',', n=1).str[0].isin(set(containers))
+    if other_containers:
+        return parsed & ~in_containers
+    return ~parsed | in_containers
+
+
+# 执行后端：pandas=逐行参考实现；columnar=按列向量化实现（扫描预处理、包裹清单展开与卡派跟踪号替换、正向/逆向匹配），
+# 结果与 pandas 完全一致，匹配阶段按条码长度多线程执行。各步骤只在入口处按 backend 分派到 *_columnar 实现
+BACKENDS = ("pandas", "columnar")
+
+
+def _split_scan_boxes_columnar(df_processed: pd.DataFrame, col2, col4) -> pd.DataFrame:
+    """preprocess_scan_list 逐行循环的按列实现：拆分 "箱号,渠道号,托盘号"，并为不符合格式的行追加条码作为托盘贴扫描的行"""
+    values = df_processed[col2]
+    text = values.astype(object).where(values.notna(), '').astype(str)
+    comma_count = text.str.count(',').to_numpy()
+    split_rows = comma_count == 2
+    short_rows = comma_count < 2
+    extra = df_processed[short_rows].copy()
+
+    # 新列按逐行实现中首次写入的顺序创建：箱号、渠道号、托盘号
+    if split_rows.any():
+        parts = text[split_rows].str.split(',', n=2, expand=True)
+        df_processed.loc[split_rows, "箱号"] = parts[0].to_numpy()
+        df_processed.loc[split_rows, "渠道号"] = parts[1].to_numpy()
+        df_processed.loc[split_rows, "托盘号"] = parts[2].to_numpy()
+    if short_rows.any():
+        df_processed.loc[short_rows, "箱号"] = text[short_rows].to_numpy()
+        # 如果不符合格式，则将第2列的值复制到第4列，因为可能是把条码扫成了箱码
+        extra[col4] = extra[col2]
+        extra["箱号"] = '条码作为托盘贴扫描'
+        df_processed = pd.concat([df_processed, extra.reindex(columns=df_processed.columns)], ignore_index=True)
+    return df_processed
+
+
+def preprocess_scan_list_columnar(df: pd.DataFrame, containers=None, other_containers: bool = False) -> pd.DataFrame:
+    """preprocess_scan_list 的按列实现（columnar 后端），结果相同"""
     if df.empty:
         return df.copy()
 
     df_processed = df.iloc[:-4].copy() if len(df) > 4 else df.copy()
     col2 = df_processed.columns[1]
     col4 = df_processed.columns[3]
+    if containers is not None:
+        df_processed = df_processed[scan_container_mask(df_processed, containers, other_containers)]
+    df_processed = _split_scan_boxes_columnar(df_processed, col2, col4)
+    return df_processed.drop_duplicates(subset=[col2, col4], keep='first')
+
+
+def preprocess_scan_list(df: pd.DataFrame, containers=None, other_containers: bool = False,
+                         backend: str = "pandas") -> pd.DataFrame:
+    """
+    按要求预处理：去掉末尾4行，补充缺少两个逗号的行，并按第2/4列去重。
+    传入 containers 时先按箱号筛选（见 scan_container_mask），只处理相关扫描。
+    backend 见 BACKENDS（columnar 时由 preprocess_scan_list_columnar 处理）。
+    """
+    if backend == "columnar":
+        return preprocess_scan_list_columnar(df, containers, other_containers)
+    if df.empty:
+        return df.copy()
+
+    df_processed = df.iloc[:-4].copy() if len(df) > 4 else df.copy()
+    col2 = df_processed.columns[1]
+    col4 = df_processed.columns[3]
+    if containers is not None:
+        df_processed = df_processed[scan_container_mask(df_processed, containers, other_containers)]
 
     extra_rows = []
     for idx, row in df_processed.iterrows():
@@ -133,11 +321,164 @@ def preprocess_scan_list(df: pd.DataFrame) -> pd.DataFrame:
     return df_processed
 
 
-def preprocess_pkg_list(filename: str) -> pd.DataFrame:
-    """预处理"包裹清单"sheet，将分组列展开为统一五列"""
+def container_name(filename) -> str:
+    """由操作分表文件名得到箱号：文件名中 "操作分表" 之前的部分"""
+    return Path(filename).stem.split("操作分表")[0]
+
+
+def _tracking_table(parcel_list: pd.DataFrame, platform_col: str, track_col: str) -> pd.DataFrame:
+    """包裹列表中的 预报单号 -> 跟踪号 映射（按列）：key, n（同一预报单号的第 n 个跟踪号）, value, size"""
+    pairs = parcel_list[[platform_col, track_col]].dropna()
+    table = pd.DataFrame({"key": pairs[platform_col].astype(str).str.strip().to_numpy(),
+                          "value": pairs[track_col].astype(str).str.strip().to_numpy()})
+    table["n"] = table.groupby("key").cumcount()
+    table["size"] = table.groupby("key")["key"].transform("size")
+    return table
+
+
+def _replace_with_tracking_columnar(forecast: pd.Series, tracking: pd.DataFrame,
+                                    groups: np.ndarray) -> Tuple[pd.Series, np.ndarray]:
+    """
+    卡派跟踪号替换的按列实现：同一分组内预报单号第 k 次出现替换为其第 k 个跟踪号（不足时用最后一个）。
+    groups 为各行所属的渠道分组（出现次数按分组分别计数）。返回 (替换结果, 是否替换)
+    """
+    valid = forecast.notna().to_numpy()
+    keys = forecast[valid].astype(str).str.strip()
+    sizes = tracking.drop_duplicates("key").set_index("key")["size"]
+    hit = keys.isin(sizes.index).to_numpy()
+    keys = keys[hit]
+    occurrence = keys.groupby([np.asarray(groups)[valid][hit], keys.to_numpy()]).cumcount().to_numpy()
+    slot = np.minimum(occurrence, sizes.reindex(keys).to_numpy() - 1)
+    values = tracking.set_index(["key", "n"])["value"]
+    replaced = forecast.astype(object).copy()
+    replaced[keys.index] = values.reindex(pd.MultiIndex.from_arrays([keys.to_numpy(), slot])).to_numpy()
+    replaced_rows = np.zeros(len(forecast), dtype=bool)
+    replaced_rows[np.flatnonzero(valid)[hit]] = True
+    return replaced, replaced_rows
+
+
+def _pkg_group_columns(raw_pkg: pd.DataFrame) -> List[Tuple[int, int, int, int]]:
+    """包裹清单各渠道分组的 (预报单号, 托盘序号, 出库Ref, 破损/不可识别) 列位置（按第 2 行表头识别）"""
+    row2 = raw_pkg.iloc[1]
+    col_pre = [i for i, v in row2.items() if pd.notna(v) and "预报单号" in str(v)]
+    col_tuo = [i for i, v in row2.items() if pd.notna(v) and "托盘序号" in str(v)]
+    col_ref = [i for i, v in row2.items() if pd.notna(v) and "出库" in str(v)]
+    col_bad = [i for i, v in row2.items() if pd.notna(v) and "破损/不可识别" in str(v)]
+    return list(zip(col_pre, col_tuo, col_ref, col_bad))
+
+
+def _pkg_status_columns(row2: pd.Series, idx_pre: int) -> Tuple[int, int]:
+    """回填用的 实际扫描 / 破损 列号（Excel 列号，从 1 开始）：在预报单号列之后 10 列内查找表头"""
+    scan_col = None
+    damaged_col = None
+    for offset in range(10):
+        check_idx = idx_pre + offset
+        if check_idx < len(row2):
+            header = row2.iloc[check_idx]
+            if pd.notna(header):
+                if "实际扫描" in str(header) and scan_col is None:
+                    scan_col = check_idx + 1
+                elif ("破损" in str(header) or "不可识别" in str(header)) and damaged_col is None:
+                    damaged_col = check_idx + 1
+    return scan_col if scan_col else idx_pre + 4, damaged_col if damaged_col else idx_pre + 5
+
+
+def _read_tracking_table(filename) -> Optional[pd.DataFrame]:
+    """读取包裹列表的跟踪号映射（见 _tracking_table）；没有包裹列表或缺少相关列时返回 None"""
+    try:
+        if hasattr(filename, "seek"):
+            filename.seek(0)
+        parcel_list = pd.read_excel(filename, sheet_name="包裹列表", header=0)
+        platform_col = "Platform Order Ref.1\n平台单号1"
+        track_col = "Track Nr.\n跟踪号"
+        if platform_col in parcel_list.columns and track_col in parcel_list.columns:
+            table = _tracking_table(parcel_list, platform_col, track_col)
+            print(f"已建立 {table['key'].nunique()} 个预报单号到 {len(table)} 个跟踪号的映射")
+            return table
+    except Exception as e:
+        print(f"警告: 无法读取包裹列表，卡派渠道预报单号不会被替换: {e}")
+    return None
+
+
+def _merged_dtype(dtypes: List[np.dtype]):
+    """与逐组 concat 相同的结果类型：全部相同时保留，数值类型混合时按 numpy 规则提升，否则为 object"""
+    if len(set(dtypes)) == 1:
+        return dtypes[0]
+    if all(pd.api.types.is_numeric_dtype(d) and not pd.api.types.is_bool_dtype(d) for d in dtypes):
+        return np.result_type(*dtypes)
+    return object
+
+
+def preprocess_pkg_list_columnar(filename, name: str = None) -> pd.DataFrame:
+    """
+    preprocess_pkg_list 的按列实现（columnar 后端）：所有渠道分组的列一次性堆叠为统一五列（不逐组循环、拼接），
+    卡派跟踪号替换按 (分组, 预报单号) 出现次数一次完成。结果与逐组实现相同。
+    """
     raw_pkg = pd.read_excel(filename, sheet_name="包裹清单", header=None)
-    cont_name = Path(filename).stem
-    cont_name = cont_name.split("操作分表")[0]
+    cont_name = container_name(filename if name is None else name)
+    row1 = raw_pkg.iloc[0]
+    row2 = raw_pkg.iloc[1]
+    groups = _pkg_group_columns(raw_pkg)
+    tracking_table = _read_tracking_table(filename)
+    if not groups:
+        return pd.DataFrame(columns=["渠道号", "预报单号", "托盘序号", "出库ref", "破损/不可识别"])
+
+    # (行, 分组, 4 列) -> 按分组依次排列的统一四列，再去掉四列全空的行
+    data = raw_pkg.iloc[2:].to_numpy(dtype=object)
+    n_rows = len(data)
+    cells = data[:, np.array(groups).ravel()].reshape(n_rows, len(groups), 4).transpose(1, 0, 2).reshape(-1, 4)
+    combined_df = pd.DataFrame(cells, columns=["预报单号", "托盘序号", "出库Ref", "破损/不可识别"])
+    keep = combined_df.notna().any(axis=1).to_numpy()
+    group_ids = np.repeat(np.arange(len(groups)), n_rows)[keep]
+    combined_df = combined_df[keep].reset_index(drop=True)
+
+    original_channels = [str(row1.iloc[idx_pre]) for idx_pre, _, _, _ in groups]
+    channels = []
+    for original in original_channels:
+        channel = original.strip()
+        if channel.startswith("CWE-"):
+            channel = channel[4:]
+        if channel.startswith("卡派-"):
+            channel = channel[3:]
+        channels.append(channel)
+    status_cols = np.array([_pkg_status_columns(row2, idx_pre) for idx_pre, _, _, _ in groups], dtype=np.int64)
+
+    kapai_groups = [g for g, original in enumerate(original_channels) if "卡派" in original]
+    if kapai_groups and tracking_table is not None and len(tracking_table):
+        kapai_rows = np.isin(group_ids, kapai_groups)
+        forecast = combined_df["预报单号"]
+        replaced, replaced_rows = _replace_with_tracking_columnar(forecast[kapai_rows], tracking_table,
+                                                                  group_ids[kapai_rows])
+        forecast = forecast.copy()
+        forecast[kapai_rows] = replaced
+        counts = np.bincount(group_ids[kapai_rows][replaced_rows], minlength=len(groups))
+        sizes = np.bincount(group_ids, minlength=len(groups))
+        for g in kapai_groups:
+            print(f"卡派渠道 '{channels[g]}': 已替换 {counts[g]}/{sizes[g]} 个预报单号为跟踪号")
+        # 逐组实现中替换后的列按 Series.apply 推断类型，再与其他分组拼接
+        dtypes = [forecast[group_ids == g].infer_objects().dtype if g in kapai_groups else np.dtype(object)
+                  for g in range(len(groups)) if sizes[g]]
+        combined_df["预报单号"] = forecast.astype(_merged_dtype(dtypes)) if dtypes else forecast
+
+    combined_df.insert(4, '箱号', cont_name)
+    combined_df.insert(5, "渠道号", np.array(channels, dtype=object)[group_ids])
+    combined_df['_excel_row'] = pd.Series(group_ids).groupby(group_ids).cumcount().to_numpy() + 3
+    combined_df['_excel_col_start'] = np.array([idx_pre + 1 for idx_pre, _, _, _ in groups], dtype=np.int64)[group_ids]
+    combined_df['_excel_col_scan'] = status_cols[group_ids, 0]
+    combined_df['_excel_col_damaged'] = status_cols[group_ids, 1]
+    return combined_df
+
+
+def preprocess_pkg_list(filename, name: str = None, backend: str = "pandas") -> pd.DataFrame:
+    """
+    预处理"包裹清单"sheet，将分组列展开为统一五列。
+    filename 也可以是文件对象（如 BytesIO），此时箱号取自 name（操作分表文件名）；
+    backend 见 BACKENDS（columnar 时由 preprocess_pkg_list_columnar 处理）
+    """
+    if backend == "columnar":
+        return preprocess_pkg_list_columnar(filename, name)
+    raw_pkg = pd.read_excel(filename, sheet_name="包裹清单", header=None)
+    cont_name = container_name(filename if name is None else name)
     row2 = raw_pkg.iloc[1]
     col_pre = [i for i, v in row2.items() if pd.notna(v) and "预报单号" in str(v)]
     col_tuo = [i for i, v in row2.items() if pd.notna(v) and "托盘序号" in str(v)]
@@ -148,6 +489,8 @@ def preprocess_pkg_list(filename: str) -> pd.DataFrame:
     # 读取包裹列表用于卡派渠道的跟踪号替换
     tracking_map = {}
     try:
+        if hasattr(filename, "seek"):
+            filename.seek(0)
         parcel_list = pd.read_excel(filename, sheet_name="包裹列表", header=0)
         platform_col = "Platform Order Ref.1\n平台单号1"
         track_col = "Track Nr.\n跟踪号"
@@ -241,77 +584,354 @@ def preprocess_pkg_list(filename: str) -> pd.DataFrame:
     return combined_df
 
 
-def compare_tables(df_a: pd.DataFrame, df_b: pd.DataFrame) -> pd.DataFrame:
+# 匹配循环中每处理这么多个包裹键回调一次进度
+PROGRESS_EVERY = 2048
+
+
+def build_pkg_keys(df: pd.DataFrame) -> pd.Series:
     """
-    比较表格逻辑
+    按列生成包裹清单匹配键：托盘序号 + 预报单号（空值视为空串，去除首尾空格）
     """
-    res = df_b.copy()
-    new_rows = []
-    
-    for _, row in res.iterrows():
-        tuo = row.get("托盘序号")
-        pre = row.get("预报单号")
-        key = f"{'' if pd.isna(tuo) else str(tuo).strip()}{'' if pd.isna(pre) else str(pre).strip()}"
-
-        row_base = row.copy()
-        row_base['条码匹配'] = ''
-        row_base["箱号对齐"] = ""
-        row_base["渠道对齐"] = ""
-        row_base["扫描箱号"] = ""
-        row_base["扫描渠道号"] = ""
-        row_base["扫描托盘号"] = ""
-        row_base['原始扫描序号'] = ''
-
-        if key == "":
-            new_rows.append(row_base)
+    parts = []
+    for col in ("托盘序号", "预报单号"):
+        if col in df.columns:
+            values = df[col].astype(object)
+            parts.append(values.where(values.notna(), '').astype(str).str.strip())
+        else:
+            parts.append(pd.Series('', index=df.index, dtype=object))
+    return parts[0] + parts[1]
+
+
+def build_scan_index(df_scan: pd.DataFrame, min_length: int = 11) -> Dict[int, Dict[str, List[int]]]:
+    """
+    建立条码索引：按 fba条码 长度分桶，记录每个条码对应的扫描行位置。
+    默认仅收录长度 > 10 的条码（正向比对规则），逆向比对可传 min_length=1。
+    """
+    index: Dict[int, Dict[str, List[int]]] = {}
+    if df_scan is None or "fba条码" not in df_scan.columns:
+        return index
+
+    for pos, value in enumerate(df_scan["fba条码"]):
+        if pd.isna(value):
             continue
+        code = str(value).strip()
+        if len(code) >= min_length:
+            index.setdefault(len(code), {}).setdefault(code, []).append(pos)
+    return index
 
-        mask = df_a.get("fba条码").astype(str).apply(lambda x: x != "" and len(x) > 10 and x in key)
-        match_rows = df_a[mask]
-        
-        if match_rows.empty:
-            row_base['条码匹配'] = '否'
-            new_rows.append(row_base)
+
+def find_match_pairs(keys: pd.Series, scan_index: Dict[int, Dict[str, List[int]]],
+                     on_progress: Callable[[int], None] = None) -> pd.DataFrame:
+    """
+    查找正向匹配对：扫描条码是包裹匹配键的子串即视为匹配。
+    返回 (pkg_pos, scan_pos) 两列，按包裹行顺序、同一包裹内按扫描行顺序排列。
+    """
+    pkg_pos: List[int] = []
+    scan_pos: List[int] = []
+
+    for i, key in enumerate(keys):
+        if on_progress is not None and i % PROGRESS_EVERY == 0:
+            on_progress(i)
+        if not key:
             continue
-        
-        for _, match in match_rows.iterrows():
-            current_row = row_base.copy()
-            
-            scan_box = match.get("箱号")
-            scan_channel = match.get("渠道号")
-            scan_pallet = match.get("托盘号")
-            scan_ori = match.get("条码")
-            
-            b_box = row.get("箱号")
-            b_channel = row.get("渠道号")
-
-            same_box = pd.notna(scan_box) and pd.notna(b_box) and str(scan_box) == str(b_box)
-            same_channel = pd.notna(scan_channel) and pd.notna(b_channel) and str(scan_channel) == str(b_channel)
-
-            current_row["箱号对齐"] = "是" if same_box else "否"
-            current_row["渠道对齐"] = "是" if same_channel else "否"
-            current_row["原始扫描序号"] = scan_ori
-
-            if not same_box:
-                if pd.isna(scan_box) or str(scan_box).strip() == "":
-                    current_row["扫描箱号"] = "扫描箱码格式不符"
-                else:
-                    current_row["扫描箱号"] = scan_box
-            if not same_channel:
-                current_row["扫描渠道号"] = scan_channel
-            
-            current_row["扫描托盘号"] = scan_pallet
+        hits = set()
+        for length, bucket in scan_index.items():
+            for k in range(len(key) - length + 1):
+                positions = bucket.get(key[k:k + length])
+                if positions:
+                    hits.update(positions)
+        for pos in sorted(hits):
+            pkg_pos.append(i)
+            scan_pos.append(pos)
+
+    return pd.DataFrame({"pkg_pos": np.array(pkg_pos, dtype=np.int64),
+                         "scan_pos": np.array(scan_pos, dtype=np.int64)})
 
-            new_rows.append(current_row)
 
-    return pd.DataFrame(new_rows)
+def _str_equal(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """逐元素比较：两侧均非空且字符串形式相同"""
+    left_s = pd.Series(left, dtype=object)
+    right_s = pd.Series(right, dtype=object)
+    same = left_s.astype(str).to_numpy() == right_s.astype(str).to_numpy()
+    return same & left_s.notna().to_numpy() & right_s.notna().to_numpy()
 
 
-def load_scan_data(table_a_path: Path) -> pd.DataFrame:
+def compare_tables(df_a: pd.DataFrame, df_b: pd.DataFrame, pairs: pd.DataFrame = None,
+                   on_progress: Callable[[int], None] = None) -> pd.DataFrame:
     """
-    加载并预处理扫描数据
+    比较表格逻辑：由 (包裹行, 扫描行) 匹配对按列拼装比较结果，一对多匹配展开为多行
+    """
+    keys = build_pkg_keys(df_b)
+    if pairs is None:
+        pairs = find_match_pairs(keys, build_scan_index(df_a), on_progress)
+
+    # 未匹配的包裹行保留一行，scan_pos 记为 -1；稳定排序保证行顺序与包裹清单一致
+    matched_pkg = pairs["pkg_pos"].to_numpy(dtype=np.int64)
+    unmatched_pkg = np.setdiff1d(np.arange(len(df_b), dtype=np.int64), matched_pkg)
+    pkg_pos = np.concatenate([matched_pkg, unmatched_pkg])
+    scan_pos = np.concatenate([pairs["scan_pos"].to_numpy(dtype=np.int64),
+                               np.full(len(unmatched_pkg), -1, dtype=np.int64)])
+    order = np.argsort(pkg_pos, kind="stable")
+    pkg_pos = pkg_pos[order]
+    scan_pos = scan_pos[order]
+
+    res = df_b.iloc[pkg_pos].copy()
+    n = len(res)
+    matched = scan_pos >= 0
+    has_key = keys.to_numpy(dtype=object)[pkg_pos] != ''
+
+    def scan_values(col: str) -> np.ndarray:
+        values = np.full(n, None, dtype=object)
+        if df_a is not None and col in df_a.columns:
+            values[matched] = df_a[col].to_numpy(dtype=object)[scan_pos[matched]]
+        return values
+
+    def pkg_values(col: str) -> np.ndarray:
+        if col in res.columns:
+            return res[col].to_numpy(dtype=object)
+        return np.full(n, None, dtype=object)
+
+    scan_box = scan_values("箱号")
+    scan_channel = scan_values("渠道号")
+    scan_pallet = scan_values("托盘号")
+    scan_ori = scan_values("条码")
+
+    same_box = _str_equal(scan_box, pkg_values("箱号"))
+    same_channel = _str_equal(scan_channel, pkg_values("渠道号"))
+
+    box_blank = pd.Series(scan_box, dtype=object)
+    box_blank = (box_blank.isna() | (box_blank.astype(str).str.strip() == "")).to_numpy()
+
+    show_box = matched & ~same_box
+    scan_box_out = np.full(n, '', dtype=object)
+    scan_box_out[show_box] = scan_box[show_box]
+    scan_box_out[show_box & box_blank] = "扫描箱码格式不符"
+
+    show_channel = matched & ~same_channel
+    scan_channel_out = np.full(n, '', dtype=object)
+    scan_channel_out[show_channel] = scan_channel[show_channel]
+
+    scan_pallet_out = np.full(n, '', dtype=object)
+    scan_pallet_out[matched] = scan_pallet[matched]
+    scan_ori_out = np.full(n, '', dtype=object)
+    scan_ori_out[matched] = scan_ori[matched]
+
+    res['条码匹配'] = np.where(has_key & ~matched, '否', '').astype(object)
+    res["箱号对齐"] = np.where(matched, np.where(same_box, "是", "否"), "").astype(object)
+    res["渠道对齐"] = np.where(matched, np.where(same_channel, "是", "否"), "").astype(object)
+    res["扫描箱号"] = scan_box_out
+    res["扫描渠道号"] = scan_channel_out
+    res["扫描托盘号"] = scan_pallet_out
+    res['原始扫描序号'] = scan_ori_out
+    if df_a is not None and HISTORY_DUP_COLUMN in df_a.columns:
+        history_dup = np.full(n, '', dtype=object)
+        history_dup[matched] = scan_values(HISTORY_DUP_COLUMN)[matched]
+        res['扫描历史重复'] = history_dup
+
+    return res
+
+
+def _bounded_levenshtein(a: str, b: str, max_dist: int) -> int:
+    """
+    计算编辑距离（仅计算宽度为 max_dist 的对角带），超过 max_dist 时提前终止并返回 max_dist + 1
+    """
+    len_a, len_b = len(a), len(b)
+    over = max_dist + 1
+    if abs(len_a - len_b) > max_dist:
+        return over
+    prev = [j if j <= max_dist else over for j in range(len_b + 1)]
+    for i in range(1, len_a + 1):
+        ca = a[i - 1]
+        cur = [over] * (len_b + 1)
+        cur[0] = i if i <= max_dist else over
+        row_min = cur[0]
+        for j in range(max(1, i - max_dist), min(len_b, i + max_dist) + 1):
+            value = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < value:
+                value = prev[j] + 1
+            if cur[j - 1] + 1 < value:
+                value = cur[j - 1] + 1
+            cur[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > max_dist:
+            return over
+        prev = cur
+    return prev[len_b] if prev[len_b] <= max_dist else over
+
+
+def _ngrams(text: str, n: int = 3) -> set:
+    return {text[k:k + n] for k in range(len(text) - n + 1)}
+
+
+def build_near_miss_index(df_scan: pd.DataFrame, n: int = 3, stop_ratio: float = 0.002) -> dict:
+    """
+    建立近似条码索引：所有 fba条码 的 n-gram 倒排表。
+    出现在过多条码中的 n-gram（如公共前缀 FBA15）区分度低，不入索引，只记录在 stop_grams 中。
+    """
+    codes: List[str] = []
+    first_row: List[int] = []
+    seen = set()
+    if df_scan is not None and "fba条码" in df_scan.columns:
+        for pos, value in enumerate(df_scan["fba条码"]):
+            if pd.isna(value):
+                continue
+            code = str(value).strip()
+            if code and code not in seen:
+                seen.add(code)
+                first_row.append(pos)
+                codes.append(code)
+
+    postings: Dict[str, List[int]] = {}
+    for code_id, code in enumerate(codes):
+        for gram in _ngrams(code, n):
+            postings.setdefault(gram, []).append(code_id)
+
+    stop_limit = max(500, int(len(codes) * stop_ratio))
+    stop_grams = {gram for gram, ids in postings.items() if len(ids) > stop_limit}
+    postings = {gram: ids for gram, ids in postings.items() if gram not in stop_grams}
+
+    return {"n": n, "codes": codes, "first_row": first_row, "postings": postings, "stop_grams": stop_grams}
+
+
+def _codes_by_length(index: dict) -> Dict[int, np.ndarray]:
+    """近似索引中按长度分组的条码编号，首次使用时建立并缓存在索引中"""
+    by_length = index.get("by_length")
+    if by_length is None:
+        codes = index["codes"]
+        lengths = np.fromiter((len(str(code)) for code in codes), dtype=np.int64, count=len(codes))
+        order = np.argsort(lengths, kind="stable")
+        values, starts = np.unique(lengths[order], return_index=True)
+        by_length = index["by_length"] = dict(zip(values.tolist(), np.split(order, starts[1:])))
+    return by_length
+
+
+def _same_length_candidates(index: dict, length: int, max_dist: int) -> np.ndarray:
+    """长度与 length 相差不超过 max_dist 的条码编号，长度差小的在前"""
+    by_length = _codes_by_length(index)
+    near = sorted(range(length - max_dist, length + max_dist + 1), key=lambda l: abs(l - length))
+    groups = [by_length[l] for l in near if l in by_length]
+    return np.concatenate(groups) if groups else np.empty(0, dtype=np.int64)
+
+
+def lookup_near_misses(query: str, index: dict, max_dist: int = 3, top_n: int = 3,
+                       candidate_limit: int = 20) -> List[Tuple[int, int]]:
+    """
+    查找与 query 最接近的扫描条码，返回 [(条码编号, 编辑距离), ...]，按距离、条码升序；
+    条码编号对应 index["codes"] / index["first_row"] 的下标。
+    query 的 n-gram 都不在索引中（query 过短，或全是公共片段）时，改为逐个校验长度相差不超过 max_dist 的条码。
+    """
+    n = index["n"]
+    codes = index["codes"]
+    grams = _ngrams(query, n)
+    counts: Dict[int, int] = {}
+    indexed_grams = 0
+    for gram in grams:
+        ids = index["postings"].get(gram)
+        if ids is None:
+            continue
+        indexed_grams += 1
+        for code_id in ids:
+            counts[code_id] = counts.get(code_id, 0) + 1
+
+    if counts:
+        candidates = heapq.nlargest(candidate_limit, counts, key=counts.get)
+    elif len(grams) <= max_dist * n or not grams.isdisjoint(index.get("stop_grams", ())):
+        # 距离内的条码与 query 共享的 n-gram 只可能是公共片段（或 query 短到不必共享）
+        candidates = _same_length_candidates(index, len(query), max_dist).tolist()
+        counts = None
+    else:
+        return []
+
+    # 每次编辑最多破坏 query 的 n 个 n-gram，共享数低于下限的候选不可能在距离内；
+    # 候选按共享数降序校验，已找满 top_n 后按当前最差距离收紧下限
+    found: List[Tuple[int, int]] = []
+    limit = max_dist
+    for code_id in candidates:
+        if counts is not None and counts[code_id] < indexed_grams - limit * n:
+            break
+        dist = _bounded_levenshtein(query, str(codes[code_id]), limit)
+        if dist <= limit:
+            found.append((int(code_id), dist))
+            if len(found) >= top_n:
+                found.sort(key=lambda item: (item[1], str(codes[item[0]])))
+                found = found[:top_n]
+                limit = found[-1][1]
+    found.sort(key=lambda item: (item[1], str(codes[item[0]])))
+    return found[:top_n]
+
+
+def take_scan_rows(scan_source, positions) -> pd.DataFrame:
+    """按位置取扫描行；scan_source 可以是扫描 DataFrame，也可以是 open_scan_store 打开的共享存储"""
+    if isinstance(scan_source, pd.DataFrame):
+        return scan_source.iloc[positions]
+    return gather_scan_rows(scan_source, positions)
+
+
+def suggest_near_misses(df_compare: pd.DataFrame, df_scan, index: dict = None,
+                        max_dist: int = 3, top_n: int = 3) -> pd.DataFrame:
+    """
+    为比较结果中的未匹配（红色）行给出近似扫描条码建议，每条建议一行。
+    df_scan 可以是扫描 DataFrame 或共享存储（此时需传入 index）。
+    """
+    columns = ['预报单号', '托盘序号', '箱号', '渠道号', '建议fba条码', '编辑距离',
+               '原始扫描序号', '扫描箱号', '扫描渠道号']
+    if df_compare is None or df_compare.empty or '条码匹配' not in df_compare.columns:
+        return pd.DataFrame(columns=columns)
+
+    red_rows = df_compare[df_compare['条码匹配'] == '否']
+    if red_rows.empty:
+        return pd.DataFrame(columns=columns)
+    if index is None:
+        index = build_near_miss_index(df_scan)
+
+    def column(df: pd.DataFrame, col: str) -> np.ndarray:
+        if col in df.columns:
+            return df[col].to_numpy(dtype=object)
+        return np.full(len(df), None, dtype=object)
+
+    suggestions = []
+    scan_positions = []
+    for pre, tuo, box, channel in zip(column(red_rows, '预报单号'), column(red_rows, '托盘序号'),
+                                      column(red_rows, '箱号'), column(red_rows, '渠道号')):
+        if pd.isna(pre) or not str(pre).strip():
+            continue
+        for code_id, dist in lookup_near_misses(str(pre).strip(), index, max_dist=max_dist, top_n=top_n):
+            suggestions.append([pre, tuo, box, channel, str(index["codes"][code_id]), dist])
+            scan_positions.append(int(index["first_row"][code_id]))
+
+    # 只取出被建议的扫描行
+    scan_rows = take_scan_rows(df_scan, scan_positions)
+    for row, scan_ori, scan_box, scan_channel in zip(suggestions, column(scan_rows, "条码"),
+                                                    column(scan_rows, "箱号"), column(scan_rows, "渠道号")):
+        row.extend([scan_ori, scan_box, scan_channel])
+
+    return pd.DataFrame(suggestions, columns=columns)
+
+
+def prepare_scan_data(scan_lists: List[pd.DataFrame], containers=None, other_containers: bool = False,
+                      backend: str = "pandas") -> pd.DataFrame:
+    """
+    合并已读取的扫描表（原始工作表内容），预处理（清洗/去重）并解码
+    """
+    combined_scan = pd.concat(scan_lists, ignore_index=True)
+    # 1. preprocess (clean/dedupe)
+    preprocessed_combined = preprocess_scan_list(combined_scan, containers, other_containers, backend)
+    # 2. decode
+    preprocessed_scan_df, _, _ = process_encoded_data(preprocessed_combined)
+    return preprocessed_scan_df
+
+
+def load_scan_data(table_a_path: Path, containers=None, other_containers: bool = False,
+                   backend: str = "pandas") -> pd.DataFrame:
+    """
+    加载并预处理扫描数据。
+    传入 containers 时只解码、索引这些箱号（及无法解析箱号）的扫描；other_containers=True 时加载其余箱号的扫描。
     """
     preprocessed_scan_df = None
+    if containers is not None:
+        scope = "其他箱号" if other_containers else f"{len(containers)} 个箱号"
+        print(f"按箱号筛选扫描数据: 仅加载{scope}相关扫描")
     
     if table_a_path.is_dir():
         print(f"检测到扫描数据文件夹: {table_a_path}")
@@ -337,21 +957,14 @@ def load_scan_data(table_a_path: Path) -> pd.DataFrame:
             print("错误: 没有成功读取任何扫描文件")
             return None
         
-        combined_scan = pd.concat(all_scan_data, ignore_index=True)
-        # 1. preprocess (clean/dedupe)
-        preprocessed_combined = preprocess_scan_list(combined_scan)
-        # 2. decode
-        preprocessed_scan_df, _, _ = process_encoded_data(preprocessed_combined)
+        preprocessed_scan_df = prepare_scan_data(all_scan_data, containers, other_containers, backend)
         print(f"扫描数据预处理完成，共 {len(preprocessed_scan_df)} 行\n")
         
     elif table_a_path.exists():
         print(f"使用扫描数据文件: {table_a_path}")
         try:
             scan_list = pd.read_excel(table_a_path)
-            # 1. preprocess
-            preprocessed_list = preprocess_scan_list(scan_list)
-            # 2. decode
-            preprocessed_scan_df, _, _ = process_encoded_data(preprocessed_list)
+            preprocessed_scan_df = prepare_scan_data([scan_list], containers, other_containers, backend)
             print(f"表A预处理完成，共 {len(preprocessed_scan_df)} 行")
         except Exception as e:
             print(f"读取失败: {e}")
@@ -363,56 +976,76 @@ def load_scan_data(table_a_path: Path) -> pd.DataFrame:
     return preprocessed_scan_df
 
 
-def export_with_colors(df: pd.DataFrame, filename: str):
+HISTORY_DUP_COLUMN = '历史重复'
+HISTORY_FIRST_RUN_COLUMN = '历史首次扫描'
+
+
+def _event_text(series: pd.Series) -> pd.Series:
+    """转为文本；整数值的浮点列（读取时因空值变为浮点）按整数输出，保证同一扫描行在不同运行中文本一致"""
+    if pd.api.types.is_float_dtype(series):
+        text = series.astype(str)
+        as_int = series.notna() & (series % 1 == 0)
+        text[as_int] = series[as_int].astype(np.int64).astype(str)
+        return text
+    return series.astype(str)
+
+
+def scan_event_signatures(df_scan: pd.DataFrame) -> np.ndarray:
+    """扫描事件签名：原始扫描表前 4 列（序号/箱码/时间/条码）的哈希，同一条扫描记录在不同运行中签名相同"""
+    original = pd.DataFrame({k: _event_text(df_scan.iloc[:, k]) for k in range(min(4, len(df_scan.columns)))})
+    return pd.util.hash_pandas_object(original, index=False).to_numpy(dtype=np.uint64)
+
+
+def _history_codes(df_scan: pd.DataFrame) -> Tuple[np.ndarray, pd.Series]:
+    """参与历史查重的扫描行位置及其 fba条码"""
+    if 'fba条码' not in df_scan.columns:
+        return np.array([], dtype=np.int64), pd.Series([], dtype=object)
+    fba = df_scan['fba条码']
+    codes = fba[fba.notna()].astype(str).str.strip()
+    codes = codes[codes != '']
+    return df_scan.index.get_indexer(codes.index), codes.reset_index(drop=True)
+
+
+def mark_history_duplicates(df_scan: pd.DataFrame, seen_store: SeenStore, run_label: str = None) -> pd.DataFrame:
     """
-    导出比较结果 excel
+    标记历史重复扫描：fba条码 在之前的运行批次中出现过，且本条扫描不属于该条码首次出现的批次（见 SeenStore.check）。
+    新增 历史重复（是/空）与 历史首次扫描（首次出现的运行批次）两列；run_label 为本次运行的批次名。
+    """
+    res = df_scan.copy()
+    positions, codes = _history_codes(res)
+    duplicate, first_runs = seen_store.check(codes, scan_event_signatures(res)[positions], run_label)
+    flag = np.full(len(res), '', dtype=object)
+    flag[positions[duplicate]] = '是'
+    first_run = np.full(len(res), '', dtype=object)
+    first_run[positions[duplicate]] = first_runs[duplicate]
+    res[HISTORY_DUP_COLUMN] = flag
+    res[HISTORY_FIRST_RUN_COLUMN] = first_run
+    return res
+
+
+def record_seen_scans(df_scan: pd.DataFrame, seen_store: SeenStore, run_label: str) -> int:
+    """把本次加载的扫描记入历史记录并保存，返回新增条码数"""
+    positions, codes = _history_codes(df_scan)
+    added = seen_store.add(codes, scan_event_signatures(df_scan)[positions], run_label)
+    seen_store.save()
+    return added
+
+
+def export_with_colors(df: pd.DataFrame, filename: str, fill_mode: str = "cells"):
+    """
+    导出比较结果 excel（fill_mode 见 FILL_MODES）
     """
     required_cols = ['预报单号', '托盘序号', '出库Ref', '破损/不可识别', '箱号', '渠道号', 
-                     '条码匹配', '箱号对齐', '渠道对齐', '扫描箱号', '扫描渠道号', '扫描托盘号', '原始扫描序号']
+                     '条码匹配', '箱号对齐', '渠道对齐', '扫描箱号', '扫描渠道号', '扫描托盘号', '原始扫描序号',
+                     '扫描历史重复']
     
     available_cols = [col for col in required_cols if col in df.columns]
     export_df = df[available_cols].copy()
     export_df = export_df.reset_index(drop=True)
-    
+    statuses = result_statuses(df, classify_compare_status)
+
     with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-        export_df.to_excel(writer, sheet_name='Sheet1', index=False)
-        worksheet = writer.sheets['Sheet1']
-        
-        red_fill = PatternFill(start_color="F08080", end_color="F08080", fill_type="solid")
-        yellow_fill = PatternFill(start_color="EEFF00", end_color="EEFF00", fill_type="solid")
-        green_fill = PatternFill(start_color="14E01E", end_color="14E01E", fill_type="solid")
-        orange_fill = PatternFill(start_color="FFC000", end_color="FFA500", fill_type="solid")
-        
-        try:
-            original_scan_col = export_df['原始扫描序号'].astype(str).apply(lambda x: x.strip())
-            valid_mask = (original_scan_col != '') & (original_scan_col != 'nan') & (original_scan_col != 'None')
-            valid_series = original_scan_col[valid_mask]
-            duplicates = valid_series[valid_series.duplicated(keep=False)]
-            duplicate_indices = set(duplicates.index)
-        except Exception as e:
-            print(f"查重逻辑出错: {e}")
-            duplicate_indices = set()
-
-        for idx, row in export_df.iterrows():
-            row_num = idx + 2
-            code_match = str(row.get('条码匹配', '')).strip()
-            box_align = str(row.get('箱号对齐', '')).strip()
-            channel_align = str(row.get('渠道对齐', '')).strip()
-            
-            fill_color = None
-            if code_match == '否':
-                fill_color = red_fill
-            elif box_align == '是' and channel_align == '是':
-                fill_color = green_fill
-            elif box_align == '否' or channel_align == '否':
-                fill_color = yellow_fill
-            
-            if idx in duplicate_indices:
-                fill_color = orange_fill
-            
-            if fill_color:
-                for col_idx in range(1, len(available_cols) + 1):
-                    cell = worksheet.cell(row=row_num, column=col_idx).fill = fill_color
+        write_status_sheet(writer, 'Sheet1', export_df, statuses, fill_mode)
     
     print(f"已导出到 {filename}")
 
@@ -420,135 +1053,248 @@ def export_with_colors(df: pd.DataFrame, filename: str):
 def export_backfill_to_original(original_file: str, compared_df: pd.DataFrame, output_filename: str):
     """
     导出回填结果 excel
+    一个包裹行对应多个比较结果行时，与逐行写入相同：每个单元格以最后一个有值（有颜色）的结果为准
     """
     from openpyxl import load_workbook
     
     wb = load_workbook(original_file)
     ws = wb["包裹清单"]
-    
-    red_fill = PatternFill(start_color="F08080", end_color="F08080", fill_type="solid")
-    yellow_fill = PatternFill(start_color="EEFF00", end_color="EEFF00", fill_type="solid")
-    green_fill = PatternFill(start_color="14E01E", end_color="14E01E", fill_type="solid")
-    
-    processed_count = 0
-    filled_color_count = 0
-    
-    for idx, row in compared_df.iterrows():
-        excel_row = row.get('_excel_row')
-        col_scan = row.get('_excel_col_scan')
-        col_damaged = row.get('_excel_col_damaged')
-        
-        if pd.isna(excel_row) or pd.isna(col_scan) or pd.isna(col_damaged):
-            continue
-        
-        excel_row = int(excel_row)
-        col_scan = int(col_scan)
-        col_damaged = int(col_damaged)
-        
-        scan_box = row.get('扫描箱号', '')
-        scan_channel = row.get('扫描渠道号', '')
-        if pd.notna(scan_box) or pd.notna(scan_channel):
-            box_str = str(scan_box) if pd.notna(scan_box) else ''
-            channel_str = str(scan_channel) if pd.notna(scan_channel) else ''
-            if box_str and channel_str:
-                damaged_value = f"{box_str},{channel_str}"
-            elif box_str:
-                damaged_value = box_str
-            elif channel_str:
-                damaged_value = channel_str
-            else:
-                damaged_value = None
-            
-            if damaged_value:
-                ws.cell(row=excel_row, column=col_damaged).value = damaged_value
-        
-        scan_ori = row.get('原始扫描序号', '')
-        if pd.notna(scan_ori) and scan_ori:
-            ws.cell(row=excel_row, column=col_scan).value = str(scan_ori)
-        
-        code_match = str(row.get('条码匹配', '')).strip()
-        box_align = str(row.get('箱号对齐', '')).strip()
-        channel_align = str(row.get('渠道对齐', '')).strip()
-        
-        has_scan_info = pd.notna(row.get('扫描箱号')) or pd.notna(row.get('扫描渠道号')) or pd.notna(row.get('原始扫描序号'))
-        
-        if not has_scan_info:
-            fill_color = None
-        elif code_match == '否':
-            fill_color = red_fill
-        elif box_align == '是' and channel_align == '是':
-            fill_color = green_fill
-        else:
-            fill_color = yellow_fill
-        
-        if fill_color:
-            ws.cell(row=excel_row, column=col_scan).fill = fill_color
-            ws.cell(row=excel_row, column=col_damaged).fill = fill_color
-            filled_color_count += 1
-        
-        processed_count += 1
+
+    def column(col: str) -> pd.Series:
+        if col in compared_df.columns:
+            return compared_df[col].reset_index(drop=True)
+        return pd.Series(np.nan, index=pd.RangeIndex(len(compared_df)), dtype=object)
+
+    cells = pd.DataFrame({
+        'row': column('_excel_row'),
+        'col_scan': column('_excel_col_scan'),
+        'col_damaged': column('_excel_col_damaged'),
+    })
+    valid = cells.notna().all(axis=1).to_numpy()
+    cells = cells[valid].astype(np.int64)
+
+    # 破损/不可识别 列：扫描箱号,扫描渠道号（有值的部分）
+    scan_box = column('扫描箱号')
+    scan_channel = column('扫描渠道号')
+    box_str = scan_box.astype(str).where(scan_box.notna(), '')
+    channel_str = scan_channel.astype(str).where(scan_channel.notna(), '')
+    damaged_value = np.where((box_str != '') & (channel_str != ''), box_str + ',' + channel_str, box_str + channel_str)
+    cells['damaged_value'] = damaged_value[valid]
+
+    # 实际扫描 列：原始扫描序号（有值时）
+    scan_ori = column('原始扫描序号')
+    has_ori = scan_ori.notna() & (scan_ori.astype(str) != '') & ~scan_ori.isin([0, False])
+    cells['scan_value'] = scan_ori.astype(str).where(has_ori, '').to_numpy()[valid]
+    cells['status'] = result_statuses(compared_df, classify_backfill_status, BACKFILL_STATUS_COLUMN).to_numpy()[valid]
+
+    damaged_cells = cells[cells['damaged_value'] != ''].drop_duplicates(['row', 'col_damaged'], keep='last')
+    for row, col, value in zip(damaged_cells['row'], damaged_cells['col_damaged'], damaged_cells['damaged_value']):
+        ws.cell(row=row, column=col).value = value
+    scan_cells = cells[cells['scan_value'] != ''].drop_duplicates(['row', 'col_scan'], keep='last')
+    for row, col, value in zip(scan_cells['row'], scan_cells['col_scan'], scan_cells['scan_value']):
+        ws.cell(row=row, column=col).value = value
+
+    colored = cells[cells['status'] != '']
+    for col_key in ('col_scan', 'col_damaged'):
+        fill_cells = colored.drop_duplicates(['row', col_key], keep='last')
+        for row, col, status in zip(fill_cells['row'], fill_cells[col_key], fill_cells['status']):
+            ws.cell(row=row, column=col).fill = STATUS_FILLS[status]
+
+    processed_count = len(cells)
+    filled_color_count = len(colored)
     
     wb.save(output_filename)
     print(f"  回填统计: 处理 {processed_count} 行, 填充颜色 {filled_color_count} 行")
     print(f"已回填到 {output_filename}")
 
 
-def compare_scan_to_pkg(df_scan: pd.DataFrame, df_pkg: pd.DataFrame) -> pd.DataFrame:
+def find_reverse_matches(keys: pd.Series, scan_index: Dict[int, Dict[str, List[int]]], n_scans: int,
+                         on_progress: Callable[[int], None] = None) -> np.ndarray:
+    """
+    逆向匹配：为每个扫描行找到第一个（按包裹清单顺序）匹配键包含其条码的包裹行位置，未匹配为 -1。
+    scan_index 需用 build_scan_index(df_scan, min_length=1) 建立（逆向比对不限制条码长度）。
+    """
+    first_match = [-1] * n_scans
+    assigned = set()
+    for i, key in enumerate(keys):
+        if on_progress is not None and i % PROGRESS_EVERY == 0:
+            on_progress(i)
+        if not key:
+            continue
+        for length, bucket in scan_index.items():
+            for k in range(len(key) - length + 1):
+                code = key[k:k + length]
+                if code in assigned:
+                    continue
+                positions = bucket.get(code)
+                if positions:
+                    assigned.add(code)
+                    for pos in positions:
+                        first_match[pos] = i
+    return np.array(first_match, dtype=np.int64)
+
+
+def compare_scan_to_pkg(df_scan: pd.DataFrame, df_pkg: pd.DataFrame, first_match: np.ndarray = None,
+                        on_progress: Callable[[int], None] = None) -> pd.DataFrame:
     """
-    逆向比对
+    逆向比对：扫描条码为包裹匹配键的子串即视为匹配，记录第一个匹配的包裹信息
     """
     res = df_scan.copy()
-    
-    res["是否匹配"] = "否"
-    res["预报单号"] = ""
-    res["托盘序号"] = ""
-    res["操作箱号"] = ""
-    res["操作渠道号"] = ""
-    
-    pkg_lookup = []
-    for idx, row in df_pkg.iterrows():
-        tuo = row.get("托盘序号")
-        pre = row.get("预报单号")
-        key = f"{'' if pd.isna(tuo) else str(tuo).strip()}{'' if pd.isna(pre) else str(pre).strip()}"
-        key = key.strip()
-        if key:
-            pkg_lookup.append({
-                "key": key,
-                "预报单号": pre,
-                "托盘序号": tuo,
-                "箱号": row.get("箱号"),
-                "渠道号": row.get("渠道号")
-            })
+    keys = build_pkg_keys(df_pkg)
+    if first_match is None:
+        first_match = find_reverse_matches(keys, build_scan_index(df_scan, min_length=1), len(df_scan),
+                                           on_progress)
+    matched = first_match >= 0
+
+    def pkg_values(col: str) -> np.ndarray:
+        out = np.full(len(res), '', dtype=object)
+        if col in df_pkg.columns:
+            out[matched] = df_pkg[col].to_numpy(dtype=object)[first_match[matched]]
+        else:
+            out[matched] = None
+        return out
+
+    res["是否匹配"] = np.where(matched, "是", "否").astype(object)
+    res["预报单号"] = pkg_values("预报单号")
+    res["托盘序号"] = pkg_values("托盘序号")
+    res["操作箱号"] = pkg_values("箱号")
+    res["操作渠道号"] = pkg_values("渠道号")
 
-    for idx, row in res.iterrows():
-        fba_code = row.get("fba条码")
-        
-        is_matched = False
-        matched_pkg = None
-        
-        if pd.notna(fba_code) and str(fba_code).strip():
-            fba_str = str(fba_code).strip()
-            for item in pkg_lookup:
-                if fba_str in item["key"]:
-                    is_matched = True
-                    matched_pkg = item
-                    break
-        
-        if is_matched and matched_pkg:
-            res.at[idx, "是否匹配"] = "是"
-            res.at[idx, "预报单号"] = matched_pkg["预报单号"]
-            res.at[idx, "托盘序号"] = matched_pkg["托盘序号"]
-            res.at[idx, "操作箱号"] = matched_pkg["箱号"]
-            res.at[idx, "操作渠道号"] = matched_pkg["渠道号"]
-            
     return res
 
 
-def export_unreport_with_colors(df: pd.DataFrame, filename: str):
+# 文件内并行比对时每个任务处理的包裹行数
+MATCH_CHUNK_ROWS = 4096
+
+_WORKER_MATCH_INDEX = None
+
+
+def _init_match_worker(forward_index: Dict[int, Dict[str, List[int]]], reverse_index: Dict[int, Dict[str, List[int]]]):
+    global _WORKER_MATCH_INDEX
+    _WORKER_MATCH_INDEX = (forward_index, reverse_index)
+
+
+def _forward_match_chunk(keys: List[str], start: int) -> Tuple[np.ndarray, np.ndarray]:
+    pairs = find_match_pairs(pd.Series(keys, dtype=object), _WORKER_MATCH_INDEX[0])
+    return pairs["pkg_pos"].to_numpy() + start, pairs["scan_pos"].to_numpy()
+
+
+def _reverse_match_chunk(keys: List[str], n_scans: int) -> Tuple[np.ndarray, np.ndarray]:
+    first_match = find_reverse_matches(pd.Series(keys, dtype=object), _WORKER_MATCH_INDEX[1], n_scans)
+    hits = np.flatnonzero(first_match >= 0)
+    return hits, first_match[hits]
+
+
+def parallel_match(df_scan: pd.DataFrame, df_pkg: pd.DataFrame, workers: int,
+                   chunk_rows: int = MATCH_CHUNK_ROWS,
+                   on_progress: Callable[[int], None] = None) -> Tuple[pd.DataFrame, np.ndarray]:
     """
-    导出未预报结果
+    文件内并行比对：包裹行按 chunk_rows 切分，在进程池中对只读的条码索引（每个进程初始化时传入一次）
+    同时执行正向与逆向匹配，再按包裹行顺序合并。
+    返回 (正向匹配对, 逆向 first_match)，分别可传给 compare_tables / compare_scan_to_pkg，结果与单进程一致。
     """
-    scan_cols = [c for c in df.columns if c not in ["是否匹配", "预报单号", "托盘序号", "操作箱号", "操作渠道号", "_excel_row"]]
+    keys = build_pkg_keys(df_pkg).tolist()
+    forward_index = build_scan_index(df_scan)
+    reverse_index = build_scan_index(df_scan, min_length=1)
+    n_scans = len(df_scan)
+    ranges = split_row_ranges(len(keys), chunk_rows)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_match_worker,
+                             initargs=(forward_index, reverse_index)) as pool:
+        forward = [pool.submit(_forward_match_chunk, keys[start:stop], start) for start, stop in ranges]
+        reverse = [pool.submit(_reverse_match_chunk, keys[start:stop], n_scans) for start, stop in ranges]
+
+        pkg_parts = []
+        scan_parts = []
+        for (start, stop), future in zip(ranges, forward):
+            pkg_pos, scan_pos = future.result()
+            pkg_parts.append(pkg_pos)
+            scan_parts.append(scan_pos)
+            if on_progress is not None:
+                on_progress(stop)
+
+        # 每个扫描行取最靠前的分段中的匹配（分段内已是第一个匹配）
+        first_match = np.full(n_scans, -1, dtype=np.int64)
+        for (start, stop), future in zip(ranges, reverse):
+            hits, local = future.result()
+            fill = first_match[hits] < 0
+            first_match[hits[fill]] = local[fill] + start
+
+    pairs = pd.DataFrame({"pkg_pos": np.concatenate(pkg_parts).astype(np.int64),
+                          "scan_pos": np.concatenate(scan_parts).astype(np.int64)})
+    return pairs, first_match
+
+
+def first_match_positions(pkg_pos: np.ndarray, scan_pos: np.ndarray, n_scans: int, n_keys: int) -> np.ndarray:
+    """由逆向匹配对得到每个扫描行包裹顺序最靠前的匹配位置，未匹配为 -1（同 find_reverse_matches）"""
+    first_match = np.full(n_scans, n_keys, dtype=np.int64)
+    np.minimum.at(first_match, scan_pos, pkg_pos)
+    first_match[first_match == n_keys] = -1
+    return first_match
+
+
+def backend_match_workers(backend: str) -> int:
+    """匹配阶段的线程数：columnar 后端按条码长度多线程（CPU 核数），pandas 后端单线程"""
+    return (os.cpu_count() or 1) if backend == "columnar" else 1
+
+
+def columnar_match(df_scan: pd.DataFrame, df_pkg: pd.DataFrame,
+                   workers: int = None) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    按列匹配（columnar 后端）：条码索引为按长度分组的有序数组（同共享存储），包裹键的子串按列切出后二分查找，
+    各条码长度在线程池中并行（默认线程数为 CPU 核数）。返回值同 parallel_match，与逐行匹配结果一致。
+    """
+    workers = workers or backend_match_workers("columnar")
+    index = build_code_index(df_scan)
+    keys = build_pkg_keys(df_pkg).tolist()
+    pkg_pos, scan_pos = index_match_pairs(index, keys, workers=workers)
+    rev_pkg, rev_scan = index_match_pairs(index, keys, min_length=1, workers=workers)
+    pairs = pd.DataFrame({"pkg_pos": pkg_pos.astype(np.int64), "scan_pos": scan_pos.astype(np.int64)})
+    return pairs, first_match_positions(rev_pkg, rev_scan, len(df_scan), len(keys))
+
+
+def compare_with_store(scan_store: dict, df_pkg: pd.DataFrame,
+                       workers: int = 1) -> Tuple[pd.DataFrame, pd.DataFrame, np.ndarray]:
+    """
+    基于共享存储执行正向与逆向比对，只取出结果需要的扫描行；workers 为匹配线程数（见 backend_match_workers）。
+    返回 (比较结果, 按箱号筛选后的未预报结果, 各扫描行是否被逆向匹配)，与内存中 DataFrame 的流程结果一致。
+    """
+    keys = build_pkg_keys(df_pkg).tolist()
+    n_scans = scan_store["n_rows"]
+
+    # 正向比对：只取出命中的扫描行
+    pkg_pos, scan_pos = store_match_pairs(scan_store, keys, workers=workers)
+    used = np.unique(scan_pos)
+    pairs = pd.DataFrame({"pkg_pos": pkg_pos, "scan_pos": np.searchsorted(used, scan_pos)})
+    df_compare = compare_tables(gather_scan_rows(scan_store, used), df_pkg, pairs)
+
+    # 逆向比对：每个扫描行取包裹顺序最靠前的匹配
+    rev_pkg, rev_scan = store_match_pairs(scan_store, keys, min_length=1, workers=workers)
+    first_match = first_match_positions(rev_pkg, rev_scan, n_scans, len(keys))
+    scan_matched = first_match >= 0
+
+    # 与 filter_valid_boxes 相同：只保留出现过匹配的箱号
+    try:
+        box_keys, box_null = column_keys(scan_store, "箱号")
+        matched_boxes = np.unique(box_keys[scan_matched & ~box_null])
+        keep = np.flatnonzero(np.isin(box_keys, matched_boxes) & ~box_null)
+        if len(keep) < n_scans:
+            print(f"筛选完成: 原数据 {n_scans} 行 -> 筛选后 {len(keep)} 行 (过滤了 {n_scans - len(keep)} 行未匹配箱号的数据)")
+        else:
+            print(f"筛选完成: 无数据被过滤 ({n_scans} 行)")
+    except KeyError:
+        keep = np.arange(n_scans, dtype=np.int64)
+    df_unreport = compare_scan_to_pkg(gather_scan_rows(scan_store, keep), df_pkg, first_match[keep])
+
+    return df_compare, df_unreport, scan_matched
+
+
+def export_unreport_with_colors(df: pd.DataFrame, filename: str, fill_mode: str = "cells"):
+    """
+    导出未预报结果（fill_mode 见 FILL_MODES）
+    """
+    scan_cols = [c for c in df.columns
+                 if c not in ["是否匹配", "预报单号", "托盘序号", "操作箱号", "操作渠道号", "_excel_row"] + INTERNAL_COLUMNS]
     if 'fba条码' in scan_cols:
         scan_cols.remove('fba条码')
         scan_cols.insert(scan_cols.index('条码') + 1 if '条码' in scan_cols else 0, 'fba条码')
@@ -559,39 +1305,10 @@ def export_unreport_with_colors(df: pd.DataFrame, filename: str):
     
     export_df = df[final_cols].copy()
     export_df = export_df.reset_index(drop=True)
-    
+    statuses = result_statuses(df, classify_unreport_status)
+
     with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-        export_df.to_excel(writer, sheet_name='Sheet1', index=False)
-        worksheet = writer.sheets['Sheet1']
-        
-        red_fill = PatternFill(start_color="F08080", end_color="F08080", fill_type="solid")
-        yellow_fill = PatternFill(start_color="EEFF00", end_color="EEFF00", fill_type="solid")
-        green_fill = PatternFill(start_color="14E01E", end_color="14E01E", fill_type="solid")
-        
-        for idx, row in export_df.iterrows():
-            row_num = idx + 2
-            is_matched = str(row.get("是否匹配", "")).strip()
-            
-            fill_color = None
-            if is_matched == "否":
-                fill_color = red_fill
-            elif is_matched == "是":
-                scan_box = str(row.get("箱号", "")).strip()
-                op_box = str(row.get("操作箱号", "")).strip()
-                scan_channel = str(row.get("渠道号", "")).strip()
-                op_channel = str(row.get("操作渠道号", "")).strip()
-                
-                box_match = (scan_box == op_box) or (not scan_box and not op_box)
-                channel_match = (scan_channel == op_channel) or (not scan_channel and not op_channel)
-                
-                if box_match and channel_match:
-                    fill_color = green_fill
-                else:
-                    fill_color = yellow_fill
-            
-            if fill_color:
-                for col_idx in range(1, len(final_cols) + 1):
-                    cell = worksheet.cell(row=row_num, column=col_idx).fill = fill_color
+        write_status_sheet(writer, 'Sheet1', export_df, statuses, fill_mode)
                     
     print(f"已导出到 {filename}")
 
@@ -624,19 +1341,258 @@ def has_matches(df: pd.DataFrame) -> bool:
     return (df["是否匹配"] == "是").any()
 
 
-def export_merged_with_colors(df_compare: pd.DataFrame, df_unreport: pd.DataFrame, filename: str):
+def find_duplicate_scans(df: pd.DataFrame) -> pd.Series:
     """
-    导出合并结果：Sheet1=比较结果, Sheet2=未预报结果
+    标记 原始扫描序号 在结果中重复出现的行（空值/nan/None 不参与查重）
+    """
+    if '原始扫描序号' not in df.columns:
+        return pd.Series(False, index=df.index)
+    original_scan_col = df['原始扫描序号'].astype(str).str.strip()
+    valid_mask = (original_scan_col != '') & (original_scan_col != 'nan') & (original_scan_col != 'None')
+    return valid_mask & original_scan_col.where(valid_mask).duplicated(keep=False)
+
+
+def _stripped_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """与逐行 str(row.get(col, '')).strip() 相同的按列文本（缺少的列视为空）"""
+    if col in df.columns:
+        return df[col].astype(str).str.strip()
+    return pd.Series('', index=df.index)
+
+
+def classify_compare_status(df: pd.DataFrame) -> pd.Series:
+    """
+    比较结果状态：红=条码未匹配，绿=箱号渠道均对齐，黄=箱号或渠道不对齐，橙=原始扫描序号重复，空=无状态
+    """
+    code_match = _stripped_column(df, '条码匹配')
+    box_align = _stripped_column(df, '箱号对齐')
+    channel_align = _stripped_column(df, '渠道对齐')
+
+    status = np.select(
+        [code_match == '否',
+         (box_align == '是') & (channel_align == '是'),
+         (box_align == '否') | (channel_align == '否')],
+        ['红', '绿', '黄'],
+        default='',
+    )
+    status = np.where(find_duplicate_scans(df).to_numpy(), '橙', status)
+    return pd.Series(status, index=df.index, dtype=object)
+
+
+def classify_unreport_status(df: pd.DataFrame) -> pd.Series:
+    """
+    未预报结果状态：红=扫描未匹配，绿=匹配且箱号渠道与操作分表一致，黄=匹配但箱号或渠道不一致，空=无状态
+    """
+    is_matched = _stripped_column(df, '是否匹配')
+    aligned = ((_stripped_column(df, '箱号') == _stripped_column(df, '操作箱号'))
+               & (_stripped_column(df, '渠道号') == _stripped_column(df, '操作渠道号')))
+    status = np.select(
+        [is_matched == '否', (is_matched == '是') & aligned, is_matched == '是'],
+        ['红', '绿', '黄'],
+        default='',
+    )
+    return pd.Series(status, index=df.index, dtype=object)
+
+
+def classify_backfill_status(df: pd.DataFrame) -> pd.Series:
+    """
+    回填着色状态：无扫描信息=空，红=条码未匹配，绿=箱号渠道均对齐，其余=黄（回填不标橙色）
+    """
+    info_cols = [c for c in ('扫描箱号', '扫描渠道号', '原始扫描序号') if c in df.columns]
+    has_scan_info = df[info_cols].notna().any(axis=1).to_numpy() if info_cols else np.zeros(len(df), dtype=bool)
+    aligned = (_stripped_column(df, '箱号对齐') == '是') & (_stripped_column(df, '渠道对齐') == '是')
+    status = np.select(
+        [~has_scan_info, _stripped_column(df, '条码匹配') == '否', aligned],
+        ['', '红', '绿'],
+        default='黄',
+    )
+    return pd.Series(status, index=df.index, dtype=object)
+
+
+# 分类阶段写入结果表的内部状态列，导出与回填直接读取（不作为数据列输出）
+RESULT_STATUS_COLUMN = '_状态'
+BACKFILL_STATUS_COLUMN = '_回填状态'
+INTERNAL_COLUMNS = [RESULT_STATUS_COLUMN, BACKFILL_STATUS_COLUMN]
+
+
+def classify_results(df_compare: pd.DataFrame, df_unreport: pd.DataFrame = None):
+    """
+    分类阶段：为比较结果写入 _状态（报告着色）与 _回填状态（回填着色），为未预报结果写入 _状态。
+    颜色只在这里计算一次，所有导出与回填都使用同一结果。
+    """
+    df_compare[RESULT_STATUS_COLUMN] = classify_compare_status(df_compare)
+    df_compare[BACKFILL_STATUS_COLUMN] = classify_backfill_status(df_compare)
+    if df_unreport is not None:
+        df_unreport[RESULT_STATUS_COLUMN] = classify_unreport_status(df_unreport)
+
+
+def result_statuses(df: pd.DataFrame, classify: Callable[[pd.DataFrame], pd.Series],
+                    column: str = RESULT_STATUS_COLUMN) -> pd.Series:
+    """读取分类阶段写入的状态（按行位置）；未经分类阶段的结果表当场计算"""
+    statuses = df[column] if column in df.columns else classify(df)
+    return statuses.reset_index(drop=True)
+
+
+# 导出着色方式：cells=逐单元格设置填充色；rules=写入隐藏的状态列，用工作表级条件格式按状态整行着色。
+# 两者使用同一组填充（STATUS_FILLS），显示效果相同；rules 只加快写入（不逐单元格设置样式），
+# 文件大小与 cells 相近（多出的状态列抵消了省下的单元格样式）
+FILL_MODES = ("cells", "rules")
+STATUS_COLORS = {'红': 'F08080', '黄': 'EEFF00', '绿': '14E01E', '橙': 'FFC000'}
+STATUS_HELPER_HEADER = '_状态'
+
+STATUS_FILLS = {
+    '红': PatternFill(start_color="F08080", end_color="F08080", fill_type="solid"),
+    '黄': PatternFill(start_color="EEFF00", end_color="EEFF00", fill_type="solid"),
+    '绿': PatternFill(start_color="14E01E", end_color="14E01E", fill_type="solid"),
+    '橙': PatternFill(start_color="FFC000", end_color="FFA500", fill_type="solid"),
+}
+
+
+def write_sheet_with_status_rules(writer, sheet_name: str, export_df: pd.DataFrame, statuses: pd.Series):
+    """
+    条件格式模式导出一个工作表：状态写入数据右侧的隐藏列，每种颜色一条条件格式规则
+    """
+    n_cols = len(export_df.columns)
+    n_rows = len(export_df)
+    with_status = export_df.copy()
+    with_status[STATUS_HELPER_HEADER] = statuses.to_numpy()
+    with_status.to_excel(writer, sheet_name=sheet_name, index=False)
+    worksheet = writer.sheets[sheet_name]
+
+    status_letter = get_column_letter(n_cols + 1)
+    worksheet.column_dimensions[status_letter].hidden = True
+    if n_rows == 0 or n_cols == 0:
+        return
+    cell_range = f"A2:{get_column_letter(n_cols)}{n_rows + 1}"
+    for status, fill in STATUS_FILLS.items():
+        worksheet.conditional_formatting.add(
+            cell_range, FormulaRule(formula=[f'${status_letter}2="{status}"'], fill=fill, stopIfTrue=True))
+
+
+def apply_status_fills(worksheet, statuses: Iterable[str], n_cols: int):
+    """逐单元格着色：按状态为数据行（从第 2 行起）整行设置填充色"""
+    for row_num, status in enumerate(statuses, start=2):
+        fill = STATUS_FILLS.get(status)
+        if fill is not None:
+            for col_idx in range(1, n_cols + 1):
+                worksheet.cell(row=row_num, column=col_idx).fill = fill
+
+
+def write_status_sheet(writer, sheet_name: str, export_df: pd.DataFrame, statuses: pd.Series,
+                       fill_mode: str = "cells"):
+    """按给定状态导出一个着色工作表"""
+    if fill_mode == "rules":
+        write_sheet_with_status_rules(writer, sheet_name, export_df, statuses)
+    else:
+        export_df.to_excel(writer, sheet_name=sheet_name, index=False)
+        apply_status_fills(writer.sheets[sheet_name], statuses, len(export_df.columns))
+
+
+# Excel 单个工作表最多 1,048,576 行（含表头）
+EXCEL_MAX_DATA_ROWS = 1_048_575
+SPLIT_MODES = ("sheets", "files")
+REPORT_INDEX_SHEET = '索引'
+
+
+def split_row_ranges(n_rows: int, max_rows: int) -> List[Tuple[int, int]]:
+    """按行数上限切分为 [start, stop) 区间；空表返回一个空区间，保证至少输出一个带表头的部分"""
+    return [(start, min(start + max_rows, n_rows)) for start in range(0, n_rows, max_rows)] or [(0, 0)]
+
+
+def _write_report_part(filename: str, sheets: List[Tuple[str, pd.DataFrame, pd.Series]], fill_mode: str) -> str:
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        for sheet_name, export_df, statuses in sheets:
+            write_status_sheet(writer, sheet_name, export_df, statuses, fill_mode)
+    return filename
+
+
+def write_report_index(writer, entries: List[dict]):
+    """写入索引工作表：每个分段一行，位置列为指向对应工作表或文件的超链接"""
+    columns = ['内容', '位置', '起始行', '结束行', '行数']
+    pd.DataFrame([{col: entry[col] for col in columns} for entry in entries], columns=columns).to_excel(
+        writer, sheet_name=REPORT_INDEX_SHEET, index=False)
+    worksheet = writer.sheets[REPORT_INDEX_SHEET]
+    for row_num, entry in enumerate(entries, start=2):
+        cell = worksheet.cell(row=row_num, column=2)
+        cell.hyperlink = entry['链接']
+        cell.style = "Hyperlink"
+
+
+def export_split_report(parts: List[Tuple[str, pd.DataFrame, pd.Series]], filename: str,
+                        df_near_miss: pd.DataFrame = None, fill_mode: str = "cells",
+                        max_rows: int = EXCEL_MAX_DATA_ROWS, split_mode: str = "sheets", workers: int = 1):
+    """
+    超出行数上限的报告分段导出，parts 为 [(内容名, 导出表, 状态)]，状态在整表上计算（重复标记跨分段一致）。
+    sheets: 同一工作簿内分为 比较结果、比较结果_2 ...；files: 每段一个文件（可多进程并行写入），
+    filename 只保存索引与近似匹配建议。两种方式都在 索引 工作表中列出各分段并附超链接。
+    sheets 方式下 filename 也可以是文件对象（如 BytesIO）。返回写出的文件列表（files 方式包含各分段文件）。
+    """
+    if split_mode == "files":
+        # 分段文件按 <包裹清单名>_<内容>_<序号>.xlsx 命名
+        filename = Path(filename)
+        part_stem = filename.stem.removesuffix('_比较结果')
+    chunks = []
+    for content, export_df, statuses in parts:
+        for k, (start, stop) in enumerate(split_row_ranges(len(export_df), max_rows), start=1):
+            chunks.append({
+                "content": content,
+                "sheet": content if k == 1 else f"{content}_{k}",
+                "file": filename.with_name(f"{part_stem}_{content}_{k:03d}.xlsx") if split_mode == "files" else None,
+                "df": export_df.iloc[start:stop].reset_index(drop=True),
+                "statuses": statuses.iloc[start:stop].reset_index(drop=True),
+                "start": start,
+                "stop": stop,
+            })
+
+    entries = []
+    for chunk in chunks:
+        location = chunk["file"].name if split_mode == "files" else chunk["sheet"]
+        entries.append({
+            '内容': chunk["content"],
+            '位置': location,
+            '起始行': chunk["start"] + 1,
+            '结束行': chunk["stop"],
+            '行数': chunk["stop"] - chunk["start"],
+            '链接': location if split_mode == "files" else f"#'{location}'!A1",
+        })
+
+    if split_mode == "files":
+        jobs = [(str(chunk["file"]), [(chunk["content"], chunk["df"], chunk["statuses"])], fill_mode)
+                for chunk in chunks]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_write_report_part, *zip(*jobs)))
+        else:
+            for job in jobs:
+                _write_report_part(*job)
+
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        write_report_index(writer, entries)
+        if split_mode != "files":
+            for chunk in chunks:
+                write_status_sheet(writer, chunk["sheet"], chunk["df"], chunk["statuses"], fill_mode)
+        if df_near_miss is not None and not df_near_miss.empty:
+            df_near_miss.to_excel(writer, sheet_name='近似匹配建议', index=False)
+    print(f"  报告超过每表 {max_rows} 行，已分为 {len(chunks)} 段导出（{split_mode}）")
+    if split_mode == "files":
+        return [filename] + [chunk["file"] for chunk in chunks]
+    return [filename]
+
+
+def report_sheets(df_compare: pd.DataFrame, df_unreport: pd.DataFrame) -> List[Tuple[str, pd.DataFrame, pd.Series]]:
+    """
+    合并报告的两张结果表及其状态：[(比较结果, 导出表, 状态), (未预报结果, 导出表, 状态)]
     """
     # --- Sheet 1 ---
     required_cols_1 = ['预报单号', '托盘序号', '出库Ref', '破损/不可识别', '箱号', '渠道号', 
-                     '条码匹配', '箱号对齐', '渠道对齐', '扫描箱号', '扫描渠道号', '扫描托盘号', '原始扫描序号']
+                     '条码匹配', '箱号对齐', '渠道对齐', '扫描箱号', '扫描渠道号', '扫描托盘号', '原始扫描序号',
+                     '扫描历史重复']
     available_cols_1 = [col for col in required_cols_1 if col in df_compare.columns]
     export_df_1 = df_compare[available_cols_1].copy()
     export_df_1 = export_df_1.reset_index(drop=True)
     
     # --- Sheet 2 ---
-    scan_cols = [c for c in df_unreport.columns if c not in ["是否匹配", "预报单号", "托盘序号", "操作箱号", "操作渠道号", "_excel_row"]]
+    scan_cols = [c for c in df_unreport.columns
+                 if c not in ["是否匹配", "预报单号", "托盘序号", "操作箱号", "操作渠道号", "_excel_row"] + INTERNAL_COLUMNS]
     if 'fba条码' in scan_cols:
         scan_cols.remove('fba条码')
         scan_cols.insert(scan_cols.index('条码') + 1 if '条码' in scan_cols else 0, 'fba条码')
@@ -647,92 +1603,370 @@ def export_merged_with_colors(df_compare: pd.DataFrame, df_unreport: pd.DataFram
     export_df_2 = df_unreport[final_cols_2].copy()
     export_df_2 = export_df_2.reset_index(drop=True)
     
-    red_fill = PatternFill(start_color="F08080", end_color="F08080", fill_type="solid")
-    yellow_fill = PatternFill(start_color="EEFF00", end_color="EEFF00", fill_type="solid")
-    green_fill = PatternFill(start_color="14E01E", end_color="14E01E", fill_type="solid")
-    orange_fill = PatternFill(start_color="FFC000", end_color="FFA500", fill_type="solid")
+    statuses_1 = result_statuses(df_compare, classify_compare_status)
+    statuses_2 = result_statuses(df_unreport, classify_unreport_status)
+    return [('比较结果', export_df_1, statuses_1), ('未预报结果', export_df_2, statuses_2)]
 
-    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-        # Sheet 1
-        export_df_1.to_excel(writer, sheet_name='比较结果', index=False)
-        ws1 = writer.sheets['比较结果']
-        
-        try:
-            original_scan_col = export_df_1['原始扫描序号'].astype(str).apply(lambda x: x.strip())
-            valid_mask = (original_scan_col != '') & (original_scan_col != 'nan') & (original_scan_col != 'None')
-            valid_series = original_scan_col[valid_mask]
-            duplicates = valid_series[valid_series.duplicated(keep=False)]
-            duplicate_indices = set(duplicates.index)
-        except Exception:
-            duplicate_indices = set()
-
-        for idx, row in export_df_1.iterrows():
-            row_num = idx + 2
-            code_match = str(row.get('条码匹配', '')).strip()
-            box_align = str(row.get('箱号对齐', '')).strip()
-            channel_align = str(row.get('渠道对齐', '')).strip()
-            
-            fill_color = None
-            if code_match == '否':
-                fill_color = red_fill
-            elif box_align == '是' and channel_align == '是':
-                fill_color = green_fill
-            elif box_align == '否' or channel_align == '否':
-                fill_color = yellow_fill
-            if idx in duplicate_indices:
-                fill_color = orange_fill
-            
-            if fill_color:
-                for col_idx in range(1, len(available_cols_1) + 1):
-                    ws1.cell(row=row_num, column=col_idx).fill = fill_color
 
-        # Sheet 2
-        export_df_2.to_excel(writer, sheet_name='未预报结果', index=False)
-        ws2 = writer.sheets['未预报结果']
-        
-        for idx, row in export_df_2.iterrows():
-            row_num = idx + 2
-            is_matched = str(row.get("是否匹配", "")).strip()
-            
-            fill_color_2 = None
-            if is_matched == "否":
-                fill_color_2 = red_fill
-            elif is_matched == "是":
-                scan_box = str(row.get("箱号", "")).strip()
-                op_box = str(row.get("操作箱号", "")).strip()
-                scan_channel = str(row.get("渠道号", "")).strip()
-                op_channel = str(row.get("操作渠道号", "")).strip()
-                
-                box_match = (scan_box == op_box) or (not scan_box and not op_box)
-                channel_match = (scan_channel == op_channel) or (not scan_channel and not op_channel)
-                
-                if box_match and channel_match:
-                    fill_color_2 = green_fill
-                else:
-                    fill_color_2 = yellow_fill
-            
-            if fill_color_2:
-                for col_idx in range(1, len(final_cols_2) + 1):
-                    ws2.cell(row=row_num, column=col_idx).fill = fill_color_2
+def export_merged_with_colors(df_compare: pd.DataFrame, df_unreport: pd.DataFrame, filename: str,
+                              df_near_miss: pd.DataFrame = None, fill_mode: str = "cells",
+                              max_rows: int = EXCEL_MAX_DATA_ROWS, split_mode: str = "sheets", split_workers: int = 1,
+                              report_format: str = "xlsx"):
+    """
+    导出合并结果：Sheet1=比较结果, Sheet2=未预报结果, Sheet3=近似匹配建议（有建议时）；fill_mode 见 FILL_MODES。
+    任一结果超过 max_rows 行时改为分段导出（见 export_split_report）。
+    report_format 为 html / both 时另外（或只）导出网页报告到 <报告名>_html/（见 export_html_report）。
+    返回写出的报告文件列表（网页报告为其 index.html，分段文件逐个列出）。
+    """
+    sheets = report_sheets(df_compare, df_unreport)
+    outputs = []
+    if report_format in ("html", "both"):
+        html_dir = html_report_dir(filename)
+        export_html_report(sheets, html_dir, Path(filename).stem, df_near_miss)
+        print(f"已导出网页报告到 {html_dir / 'index.html'}")
+        outputs.append(html_dir / 'index.html')
+        if report_format == "html":
+            return outputs
+
+    (_, export_df_1, statuses_1), (_, export_df_2, statuses_2) = sheets
+    if len(export_df_1) > max_rows or len(export_df_2) > max_rows:
+        outputs += export_split_report(sheets, filename, df_near_miss, fill_mode, max_rows, split_mode, split_workers)
+        print(f"已导出合并报告到 {filename}")
+        return outputs
+
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        write_status_sheet(writer, '比较结果', export_df_1, statuses_1, fill_mode)
+        write_status_sheet(writer, '未预报结果', export_df_2, statuses_2, fill_mode)
+        if df_near_miss is not None and not df_near_miss.empty:
+            df_near_miss.to_excel(writer, sheet_name='近似匹配建议', index=False)
 
     print(f"已导出合并报告到 {filename}")
+    return outputs + [filename]
+
+
+# 网页报告：查看器静态文件所在目录、每个数据分块的行数、状态在分块中的编码
+REPORT_FORMATS = ("xlsx", "html", "both")
+HTML_VIEWER_DIR = Path(__file__).resolve().parent / "html_report"
+HTML_CHUNK_ROWS = 5000
+HTML_STATUS_CODES = {'': '0', '红': '1', '黄': '2', '绿': '3', '橙': '4'}
+HTML_SEARCH_COLUMNS = ('预报单号', 'fba条码')
+
+
+def html_report_dir(filename) -> Path:
+    """网页报告目录：与 xlsx 报告同名，加 _html 后缀"""
+    filename = Path(filename)
+    return filename.with_name(f"{filename.stem}_html")
+
+
+def _display_text(series: pd.Series) -> List[str]:
+    """单元格显示文本：空值为空串，整数值的浮点数按整数显示（与 Excel 中看到的一致）"""
+    if pd.api.types.is_float_dtype(series):
+        text = _event_text(series)
+        text[series.isna()] = ''
+        return text.tolist()
+    values = series.astype(object).copy()
+    integral = values.map(lambda v: isinstance(v, float) and v.is_integer()).astype(bool)
+    values[integral] = values[integral].map(int)
+    return values.where(values.notna(), '').astype(str).tolist()
+
+
+def _column_widths(columns: List[str], texts: List[List[str]], sample_rows: int = 1000) -> List[int]:
+    """按表头与前若干行估算列宽（像素），中文按两个字符宽度计"""
+    widths = []
+    for col, values in zip(columns, texts):
+        units = max([len(col.encode('utf-8')) + len(col)] +
+                    [len(v.encode('utf-8')) + len(v) for v in values[:sample_rows]]) / 2
+        widths.append(int(min(max(units * 8 + 20, 70), 360)))
+    return widths
+
+
+def _write_html_chunk(path: Path, table_key: str, index: int, rows: List[tuple], status: str):
+    """写入一个数据分块：gzip 压缩的 JSON，base64 后包在脚本调用中（本地打开 index.html 即可加载，无需服务器）"""
+    payload = json.dumps({"rows": rows, "status": status}, ensure_ascii=False, separators=(',', ':'))
+    encoded = base64.b64encode(gzip.compress(payload.encode('utf-8'), compresslevel=6)).decode('ascii')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'REPORT_CHUNK({json.dumps(table_key)},{index},"{encoded}");\n')
+
+
+def export_html_report(sheets: List[Tuple[str, pd.DataFrame, pd.Series]], out_dir, title: str,
+                       df_near_miss: pd.DataFrame = None, chunk_rows: int = HTML_CHUNK_ROWS) -> Path:
+    """
+    导出网页报告：out_dir 下为查看器（index.html / script.js / style.css）和 data/ 中的分块数据。
+    查看器按块加载数据，虚拟滚动只渲染可见行，支持按状态（红/黄/绿/橙）筛选和按 预报单号 / fba条码 搜索。
+    """
+    out_dir = Path(out_dir)
+    data_dir = out_dir / "data"
+    shutil.rmtree(data_dir, ignore_errors=True)
+    data_dir.mkdir(parents=True)
+    for asset in ("index.html", "script.js", "style.css"):
+        shutil.copy(HTML_VIEWER_DIR / asset, out_dir / asset)
+
+    tables = [(name, export_df, statuses, True) for name, export_df, statuses in sheets]
+    if df_near_miss is not None and not df_near_miss.empty:
+        tables.append(('近似匹配建议', df_near_miss.reset_index(drop=True),
+                       pd.Series('', index=range(len(df_near_miss)), dtype=object), False))
+
+    meta_tables = []
+    for key, (name, export_df, statuses, has_status) in enumerate(tables):
+        table_key = f"t{key}"
+        columns = [str(c) for c in export_df.columns]
+        texts = [_display_text(export_df[c]) for c in export_df.columns]
+        rows = list(zip(*texts)) if texts else [()] * len(export_df)
+        codes = ''.join(statuses.map(HTML_STATUS_CODES).fillna('0').tolist())
+        ranges = split_row_ranges(len(export_df), chunk_rows)
+        for index, (start, stop) in enumerate(ranges):
+            _write_html_chunk(data_dir / f"{table_key}_{index:04d}.js", table_key, index, rows[start:stop],
+                              codes[start:stop])
+        counts = statuses.value_counts()
+        meta_tables.append({
+            "key": table_key,
+            "name": name,
+            "columns": columns,
+            "widths": _column_widths(columns, texts),
+            "rows": len(export_df),
+            "chunks": len(ranges),
+            "search": [columns.index(c) for c in HTML_SEARCH_COLUMNS if c in columns],
+            "has_status": has_status,
+            "status_counts": {status: int(counts.get(status, 0)) for status in STATUS_COLORS},
+        })
+
+    meta = {"title": title, "generated_at": pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "status_colors": {status: f"#{color}" for status, color in STATUS_COLORS.items()},
+            "tables": meta_tables}
+    with open(data_dir / "meta.js", 'w', encoding='utf-8') as f:
+        f.write(f"REPORT_META({json.dumps(meta, ensure_ascii=False)});\n")
+    return out_dir / "index.html"
+
+
+STATUS_COLUMNS = {'绿': '匹配(绿)', '黄': '错位(黄)', '红': '未匹配(红)', '橙': '重复(橙)'}
+
+
+def summarize_compare_result(name: str, df_compare: pd.DataFrame) -> pd.DataFrame:
+    """
+    按 箱号/渠道号 统计单个文件比较结果中各状态的行数
+    """
+    columns = ['文件', '箱号', '渠道号', '总行数'] + list(STATUS_COLUMNS.values())
+    if df_compare is None or df_compare.empty:
+        return pd.DataFrame(columns=columns)
+
+    keys = pd.DataFrame({
+        '箱号': df_compare['箱号'].astype(object).fillna('') if '箱号' in df_compare.columns else '',
+        '渠道号': df_compare['渠道号'].astype(object).fillna('') if '渠道号' in df_compare.columns else '',
+        '状态': result_statuses(df_compare, classify_compare_status).to_numpy(),
+    }, index=df_compare.index)
+    counts = pd.crosstab([keys['箱号'], keys['渠道号']], keys['状态'])
+    counts = counts.reindex(columns=list(STATUS_COLUMNS), fill_value=0).rename(columns=STATUS_COLUMNS)
+    counts.insert(0, '总行数', keys.groupby(['箱号', '渠道号']).size())
+    summary = counts.reset_index()
+    summary.insert(0, '文件', name)
+    return summary[columns]
+
+
+def collect_matched_scans(name: str, df_compare: pd.DataFrame) -> pd.DataFrame:
+    """
+    提取单个文件比较结果中已匹配的扫描（精简列），用于跨文件查重
+    """
+    columns = ['文件', '箱号', '渠道号', '预报单号', '托盘序号', '原始扫描序号']
+    if df_compare is None or df_compare.empty or '原始扫描序号' not in df_compare.columns:
+        return pd.DataFrame(columns=columns)
+    scan_ori = df_compare['原始扫描序号'].astype(str).str.strip()
+    matched = df_compare[(scan_ori != '') & (scan_ori != 'nan') & (scan_ori != 'None')]
+    result = matched.reindex(columns=columns[1:])
+    result.insert(0, '文件', name)
+    return result.reset_index(drop=True)
+
+
+def build_batch_summary(file_summaries: List[pd.DataFrame], df_scan: pd.DataFrame,
+                        scan_matched: np.ndarray, matched_scans: List[pd.DataFrame] = None) -> dict:
+    """
+    汇总批次结果：按文件、按 文件/箱号/渠道号 的状态计数，在所有文件中都未匹配的扫描，
+    以及跨文件被重复匹配的扫描（同一原始扫描序号出现在多行比较结果中）
+    """
+    by_box = pd.concat(file_summaries, ignore_index=True) if file_summaries else summarize_compare_result('', None)
+    count_cols = ['总行数'] + list(STATUS_COLUMNS.values())
+    by_box[count_cols] = by_box[count_cols].astype(np.int64)
+    by_file = by_box.groupby('文件', sort=False)[count_cols].sum().reset_index()
+
+    if df_scan is None:
+        unmatched_scans = pd.DataFrame()
+    elif scan_matched is None:
+        unmatched_scans = df_scan.copy()
+    else:
+        unmatched_scans = df_scan[~scan_matched].copy()
+
+    if matched_scans:
+        all_matched = pd.concat(matched_scans, ignore_index=True)
+        scan_key = all_matched['原始扫描序号'].astype(str).str.strip()
+        global_duplicates = all_matched[scan_key.duplicated(keep=False)]
+        global_duplicates = global_duplicates.iloc[np.argsort(scan_key[global_duplicates.index].to_numpy(),
+                                                              kind="stable")]
+    else:
+        global_duplicates = collect_matched_scans('', None)
+
+    return {"by_file": by_file, "by_box": by_box, "unmatched_scans": unmatched_scans,
+            "global_duplicates": global_duplicates}
+
+
+def export_batch_summary(summary: dict, filename: str):
+    """
+    导出批次汇总：Sheet1=按文件汇总, Sheet2=按箱号渠道汇总, Sheet3=全部未匹配扫描, Sheet4=跨文件重复扫描
+    """
+    with pd.ExcelWriter(filename, engine='openpyxl') as writer:
+        summary["by_file"].to_excel(writer, sheet_name='按文件汇总', index=False)
+        summary["by_box"].to_excel(writer, sheet_name='按箱号渠道汇总', index=False)
+        summary["unmatched_scans"].to_excel(writer, sheet_name='全部未匹配扫描', index=False)
+        summary["global_duplicates"].to_excel(writer, sheet_name='跨文件重复扫描', index=False)
+    print(f"已导出批次汇总到 {filename}")
 
 # =================================================================================================
 #  Main Logic
 # =================================================================================================
 
-def process_full_workflow(table_b_path: str, preprocessed_scan_df) -> bool:
+DEFAULT_OUTPUT_DIR = Path("./compare_tables_test/output")
+
+
+def list_pkg_files(folder: Path) -> List[Path]:
+    """列出文件夹中待处理的操作分表（跳过 Excel 临时文件）"""
+    return sorted([f for f in Path(folder).glob("*.xlsx") if not f.name.startswith("~$")])
+
+
+# -------------------------------------------------------------------------------------------------
+#  运行日志（断点续跑）
+#  每个操作分表（按完整路径）成功处理后记录其内容哈希、扫描数据哈希、运行选项和输出文件，--resume 时跳过未变化的文件。
+# -------------------------------------------------------------------------------------------------
+
+JOURNAL_NAME = "run_journal.json"
+JOURNAL_STATS_DIR = ".journal"
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_dataset_hash(df_scan: pd.DataFrame) -> str:
+    """
+    预处理后扫描数据的内容哈希（任一扫描文件变化都会改变该值）。
+    应在标记历史重复之前计算；历史重复标记单独记入运行选项（见 journal_options）。
+    """
+    digest = hashlib.sha256()
+    digest.update("|".join(map(str, df_scan.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df_scan, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def load_run_journal(output_dir: Path) -> dict:
+    journal_path = Path(output_dir) / JOURNAL_NAME
+    if not journal_path.exists():
+        return {}
+    try:
+        with open(journal_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"警告: 运行日志无法读取，将全部重新处理: {e}")
+        return {}
+
+
+def save_run_journal(journal: dict, output_dir: Path):
+    """先写临时文件再替换，避免中途崩溃留下损坏的日志"""
+    journal_path = Path(output_dir) / JOURNAL_NAME
+    tmp_path = journal_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(journal, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, journal_path)
+
+
+def journal_key(pkg_file: Path) -> str:
+    """运行日志中操作分表的键：完整路径（不同文件夹中的同名文件互不影响）"""
+    return str(Path(pkg_file).resolve())
+
+
+def journal_options(report_options: dict = None, backend: str = "pandas", history: str = None) -> dict:
+    """
+    影响输出内容的运行选项，记入运行日志；split_workers 只影响写入速度，不参与比较。
+    history 为历史重复标记的哈希（见 history_flags_hash，未使用历史扫描记录时为 None）。
+    """
+    options = {key: value for key, value in (report_options or {}).items() if key != "split_workers"}
+    options["backend"] = backend
+    options["history"] = history
+    return options
+
+
+def history_flags_hash(df_scan: pd.DataFrame) -> Optional[str]:
+    """历史重复标记（历史重复、历史首次扫描两列）的哈希；没有这两列时为 None"""
+    if HISTORY_DUP_COLUMN not in df_scan.columns:
+        return None
+    return scan_dataset_hash(df_scan[[HISTORY_DUP_COLUMN, HISTORY_FIRST_RUN_COLUMN]])
+
+
+def record_journal_entry(journal: dict, output_dir: Path, pkg_file: Path, pkg_hash: str, scan_hash: str,
+                         result: dict, options: dict = None):
+    """记录成功处理的文件、所用选项（见 journal_options）及全部输出文件，并保存批次汇总所需的统计结果"""
+    stats_dir = Path(output_dir) / JOURNAL_STATS_DIR
+    stats_dir.mkdir(parents=True, exist_ok=True)
+    key = journal_key(pkg_file)
+    stats_file = stats_dir / f"{pkg_file.stem}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:12]}.pkl"
+    pd.to_pickle({
+        "summary": result["summary"],
+        "matched_scans": result["matched_scans"],
+        "scan_matched_positions": np.flatnonzero(result["scan_matched"]),
+    }, stats_file)
+    journal[key] = {
+        "pkg_hash": pkg_hash,
+        "scan_hash": scan_hash,
+        "options": options or {},
+        "outputs": [str(output) for output in result["report_files"]] + [str(result["backfill_file"])],
+        "stats_file": str(stats_file),
+    }
+    save_run_journal(journal, output_dir)
+
+
+def load_journal_result(journal: dict, pkg_file: Path, pkg_hash: str, scan_hash: str,
+                        n_scans: int, options: dict = None) -> Optional[dict]:
+    """输入与选项未变化且输出齐全时，返回上次保存的统计结果；否则返回 None"""
+    entry = journal.get(journal_key(pkg_file))
+    if not entry or entry.get("pkg_hash") != pkg_hash or entry.get("scan_hash") != scan_hash:
+        return None
+    if entry.get("options") != (options or {}):
+        return None
+    if not all(Path(output).exists() for output in entry.get("outputs", [])):
+        return None
+    try:
+        stats = pd.read_pickle(entry["stats_file"])
+    except (OSError, KeyError, ValueError) as e:
+        print(f"  警告: 统计结果缺失，将重新处理: {e}")
+        return None
+    scan_matched = np.zeros(n_scans, dtype=bool)
+    scan_matched[stats["scan_matched_positions"]] = True
+    return {"summary": stats["summary"], "matched_scans": stats["matched_scans"], "scan_matched": scan_matched}
+
+
+def process_full_workflow(table_b_path: str, preprocessed_scan_df, near_miss_index: dict = None,
+                          output_dir: Path = None, scan_store: dict = None,
+                          progress: BatchProgress = None, report_options: dict = None,
+                          match_workers: int = 1, backend: str = "pandas") -> Optional[dict]:
     """
     执行完整流程：
     1. 预处理包裹清单 (Table B)
-    2. 正向比对 (Pkg -> Scan)
+    2. 正向比对 (Pkg -> Scan) & 未匹配行的近似条码建议
     3. 逆向比对 (Scan -> Pkg) & 筛选
-    4. 导出合并报告 (Sheet1=比较结果, Sheet2=未预报结果)
+    4. 导出合并报告 (Sheet1=比较结果, Sheet2=未预报结果, Sheet3=近似匹配建议)
     5. 导出回填结果 (基于原始Excel格式回填)
+    成功时返回结果字典（含批次汇总所需的统计），失败返回 None。
+    传入 scan_store（共享存储）时不需要 preprocessed_scan_df，只按需取出结果涉及的扫描行。
+    传入 progress 时按阶段记录进度与吞吐量；report_options 为导出合并报告的选项
+    （fill_mode / max_rows / split_mode / split_workers，见 export_merged_with_colors）。
+    match_workers > 1 且包裹行数超过 MATCH_CHUNK_ROWS 时，文件内的正向/逆向匹配分段并行执行（见 parallel_match）。
+    backend 见 BACKENDS（columnar 时预处理与匹配按列执行，见 columnar_match；共享存储上按 backend_match_workers 多线程匹配）。
     """
+    if progress is None:
+        progress = BatchProgress(enabled=False)
     table_b_path_obj = Path(table_b_path)
     table_b_name = table_b_path_obj.stem
-    output_dir = Path("./compare_tables_test/output")
+    output_dir = Path(output_dir) if output_dir is not None else DEFAULT_OUTPUT_DIR
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # 定义输出文件名
@@ -745,37 +1979,131 @@ def process_full_workflow(table_b_path: str, preprocessed_scan_df) -> bool:
         
     # 1. 预处理包裹清单
     print(f"[{table_b_name}] 正在读取并预处理...")
-    try:
-        raw_pkg2 = preprocess_pkg_list(table_b_path)
-        print(f"  预处理完成，共 {len(raw_pkg2)} 行数据")
-    except Exception as e:
-        print(f"  错误: 预处理失败 - {e}")
-        return False
+    with progress.stage("预处理"):
+        try:
+            raw_pkg2 = preprocess_pkg_list(table_b_path, backend=backend)
+            progress.set_rows(len(raw_pkg2))
+            print(f"  预处理完成，共 {len(raw_pkg2)} 行数据")
+        except Exception as e:
+            print(f"  错误: 预处理失败 - {e}")
+            return None
         
     # 2. 正向比对
     print(f"  正在执行正向比对 (比较结果)...")
-    df_compare = compare_tables(preprocessed_scan_df, raw_pkg2)
+    if scan_store is not None:
+        with progress.stage("比对", len(raw_pkg2)):
+            df_compare, df_unreport_filtered, scan_matched = compare_with_store(scan_store, raw_pkg2,
+                                                                                backend_match_workers(backend))
+        scan_source = scan_store
+        if near_miss_index is None:
+            near_miss_index = scan_store.get("near_miss_index")
+    else:
+        pairs = first_match = None
+        if backend == "columnar":
+            with progress.stage("按列匹配", len(raw_pkg2)):
+                pairs, first_match = columnar_match(preprocessed_scan_df, raw_pkg2)
+        elif match_workers > 1 and len(raw_pkg2) > MATCH_CHUNK_ROWS:
+            with progress.stage("并行匹配", len(raw_pkg2)):
+                pairs, first_match = parallel_match(preprocessed_scan_df, raw_pkg2, match_workers,
+                                                    on_progress=progress.advance)
+        with progress.stage("正向比对", len(raw_pkg2)):
+            df_compare = compare_tables(preprocessed_scan_df, raw_pkg2, pairs, on_progress=progress.advance)
+        scan_source = preprocessed_scan_df
+    with progress.stage("近似建议"):
+        df_near_miss = suggest_near_misses(df_compare, scan_source, near_miss_index)
+        progress.set_rows(int((df_compare['条码匹配'] == '否').sum()) if '条码匹配' in df_compare.columns else 0)
+    if not df_near_miss.empty:
+        print(f"  未匹配行近似条码建议: {len(df_near_miss)} 条")
     
     # 3. 逆向比对
     print(f"  正在执行逆向比对 (未预报结果)...")
-    df_unreport = compare_scan_to_pkg(preprocessed_scan_df, raw_pkg2)
-    
-    # 筛选逆向结果
-    df_unreport_filtered = filter_valid_boxes(df_unreport)
-    print(f"  逆向结果筛选完毕: {len(df_unreport)} -> {len(df_unreport_filtered)} 行")
+    if scan_store is None:
+        with progress.stage("逆向比对", len(raw_pkg2)):
+            df_unreport = compare_scan_to_pkg(preprocessed_scan_df, raw_pkg2, first_match,
+                                              on_progress=progress.advance)
+            scan_matched = (df_unreport["是否匹配"] == "是").to_numpy()
+            # 筛选逆向结果
+            df_unreport_filtered = filter_valid_boxes(df_unreport)
+    print(f"  逆向结果筛选完毕: {len(scan_matched)} -> {len(df_unreport_filtered)} 行")
+    with progress.stage("分类", len(df_compare) + len(df_unreport_filtered)):
+        classify_results(df_compare, df_unreport_filtered)
 
     # 4. 导出合并报告
     print(f"  正在导出合并报告: {merged_report_file.name}")
-    export_merged_with_colors(df_compare, df_unreport_filtered, str(merged_report_file))
+    with progress.stage("导出", len(df_compare) + len(df_unreport_filtered) + len(df_near_miss)):
+        report_files = export_merged_with_colors(df_compare, df_unreport_filtered, str(merged_report_file),
+                                                 df_near_miss, **(report_options or {}))
     
     # 5. 导出回填结果
     print(f"  正在导出回填结果: {backfill_file.name}")
-    try:
-        export_backfill_to_original(str(table_b_path_obj), df_compare, str(backfill_file))
-    except Exception as e:
-        print(f"  错误: 回填导出失败 - {e}")
+    backfill_ok = True
+    with progress.stage("回填", len(df_compare)):
+        try:
+            export_backfill_to_original(str(table_b_path_obj), df_compare, str(backfill_file))
+        except Exception as e:
+            backfill_ok = False
+            print(f"  错误: 回填导出失败 - {e}")
     
-    return True
+    return {
+        "name": table_b_name,
+        "compare": df_compare,
+        "unreport": df_unreport_filtered,
+        "near_miss": df_near_miss,
+        "summary": summarize_compare_result(table_b_name, df_compare),
+        "matched_scans": collect_matched_scans(table_b_name, df_compare),
+        "scan_matched": scan_matched,
+        "merged_report_file": (html_report_dir(merged_report_file) / "index.html"
+                               if (report_options or {}).get("report_format") == "html" else merged_report_file),
+        "report_files": [Path(output) for output in report_files],
+        "backfill_file": backfill_file,
+        "backfill_ok": backfill_ok,
+    }
+
+def export_other_container_scans(table_a_path: Path, pkg_files: List[Path], containers, output_dir: Path):
+    """
+    按需生成其他箱号扫描的逆向比对结果：加载不属于本批箱号的扫描，与本批全部操作分表逆向比对
+    """
+    df_other = load_scan_data(table_a_path, containers, other_containers=True)
+    if df_other is None or df_other.empty:
+        print("其他箱号没有扫描数据")
+        return
+
+    pkg_frames = []
+    for pkg_file in pkg_files:
+        try:
+            pkg_frames.append(preprocess_pkg_list(str(pkg_file)))
+        except Exception as e:
+            print(f"  警告: 预处理失败 {pkg_file.name} - {e}")
+    if not pkg_frames:
+        return
+
+    df_unreport = compare_scan_to_pkg(df_other, pd.concat(pkg_frames, ignore_index=True))
+    export_unreport_with_colors(df_unreport, str(Path(output_dir) / "其他箱号扫描_逆向结果.xlsx"))
+
+
+def compact_result(result: dict) -> dict:
+    """去掉结果中的大表，只保留批次汇总和运行日志需要的字段"""
+    keep = ("name", "summary", "matched_scans", "scan_matched", "merged_report_file", "report_files",
+            "backfill_file", "backfill_ok")
+    return {key: result[key] for key in keep}
+
+
+_WORKER_SCAN_STORE = None
+
+
+def _init_store_worker(store_path: str):
+    global _WORKER_SCAN_STORE
+    _WORKER_SCAN_STORE = open_scan_store(store_path)
+
+
+def _process_file_in_worker(table_b_path: str, output_dir: str, report_options: dict = None,
+                            backend: str = "pandas") -> Optional[dict]:
+    """子进程处理一个文件；结果另带 stage_stats（各阶段行数与耗时），由主进程汇总到进度统计"""
+    progress = BatchProgress(enabled=False)
+    result = process_full_workflow(table_b_path, None, None, Path(output_dir), scan_store=_WORKER_SCAN_STORE,
+                                   progress=progress, report_options=report_options, backend=backend)
+    return dict(compact_result(result), stage_stats=progress.stage_stats()) if result else None
+
 
 def main():
     parser = argparse.ArgumentParser(description='主程序 v3: 生成合并比较报告 & 回填结果')
@@ -785,47 +2113,176 @@ def main():
     parser.add_argument('table_b', nargs='?',
                         default='./compare_tables_test/input_pkg',
                         help='表B文件路径或文件夹(包裹清单)')
+    parser.add_argument('--resume', action='store_true',
+                        help='断点续跑: 跳过输入未变化且输出已存在的文件')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行处理文件的进程数；大于 1 时扫描数据发布为共享存储，各进程只读映射')
+    parser.add_argument('--only-pkg-containers', action='store_true',
+                        help='只加载操作分表文件名中箱号相关的扫描（箱号取自 "操作分表" 之前的文件名）')
+    parser.add_argument('--other-scans-report', action='store_true',
+                        help='配合 --only-pkg-containers: 另行输出其他箱号扫描的逆向比对结果')
+    parser.add_argument('--metrics-file', default=None,
+                        help='定期写入进度与吞吐量指标的文件（.prom 为 Prometheus 文本格式，其他为 JSON）')
+    parser.add_argument('--no-progress', action='store_true', help='不输出进度行')
+    parser.add_argument('--fill-mode', choices=FILL_MODES, default='cells',
+                        help='报告着色方式: cells=逐单元格填充(默认), rules=隐藏状态列+条件格式(文件更小、更快)')
+    parser.add_argument('--seen-store', default=None,
+                        help='历史扫描记录目录：标记之前运行中已扫描过的条码（历史重复），并在运行结束后记入本次扫描')
+    parser.add_argument('--run-label', default=None, help='本次运行在历史扫描记录中的批次名（默认当天日期）')
+    parser.add_argument('--max-sheet-rows', type=int, default=EXCEL_MAX_DATA_ROWS,
+                        help=f'每个工作表最多写入的数据行数，超出时分段导出（默认 {EXCEL_MAX_DATA_ROWS}，即 Excel 上限）')
+    parser.add_argument('--split-mode', choices=SPLIT_MODES, default='sheets',
+                        help='分段方式: sheets=同一文件内多个工作表(默认), files=每段一个文件')
+    parser.add_argument('--split-workers', type=int, default=1,
+                        help='--split-mode files 时并行写入分段文件的进程数')
+    parser.add_argument('--report-format', choices=REPORT_FORMATS, default='xlsx',
+                        help='合并报告格式: xlsx(默认), html=分块加载的网页报告(大报告打开更快), both=两者都导出')
+    parser.add_argument('--backend', choices=BACKENDS, default='pandas',
+                        help='执行后端: pandas=逐行参考实现(默认), columnar=按列向量化 + 多线程匹配(结果相同)')
+    parser.add_argument('--match-workers', type=int, default=1,
+                        help=f'单个操作分表超过 {MATCH_CHUNK_ROWS} 行时，文件内匹配分段并行的进程数'
+                             '（--workers 为 1 且 --backend pandas 时生效）')
     
     args = parser.parse_args()
-    
-    # 1. 加载扫描数据
+    if args.match_workers > 1 and args.backend == "columnar":
+        print("警告: --backend columnar 按条码长度多线程匹配，--match-workers 不生效")
+    report_options = {"fill_mode": args.fill_mode, "max_rows": args.max_sheet_rows,
+                      "split_mode": args.split_mode, "split_workers": args.split_workers,
+                      "report_format": args.report_format}
     table_a_path = Path(args.table_a)
-    print(f"正在加载扫描数据: {table_a_path}")
-    preprocessed_scan_df = load_scan_data(table_a_path)
-    
-    if preprocessed_scan_df is None:
-        print("错误: 无法加载扫描数据，程序终止。")
-        return
-
-    # 2. 处理表B
     table_b_path = Path(args.table_b)
     
+    # 1. 确定待处理的表B
     if table_b_path.is_dir():
         print(f"\n检测到文件夹，开始批量处理: {table_b_path}")
-        xlsx_files = sorted([f for f in table_b_path.glob("*.xlsx") if not f.name.startswith("~$")])
+        xlsx_files = list_pkg_files(table_b_path)
         if not xlsx_files:
             print(f"错误: 文件夹中没有找到 .xlsx 文件")
             return
-        
-        print(f"找到 {len(xlsx_files)} 个文件待处理...")
-        processed_count = 0
-        
-        for idx, xlsx_file in enumerate(xlsx_files, 1):
-            print(f"\n[{idx}/{len(xlsx_files)}] 处理文件: {xlsx_file.name}")
-            print("-" * 60)
-            result = process_full_workflow(str(xlsx_file), preprocessed_scan_df)
-            if result: processed_count += 1
-            
-        print(f"\n批量处理完成！成功处理 {processed_count}/{len(xlsx_files)} 个文件。")
     else:
         if not table_b_path.exists():
             print(f"错误: 文件不存在 - {table_b_path}")
             return
-        
         print(f"\n处理单文件: {table_b_path.name}")
-        print("-" * 60)
-        process_full_workflow(str(table_b_path), preprocessed_scan_df)
+        xlsx_files = [table_b_path]
+
+    progress = BatchProgress(total_files=len(xlsx_files), metrics_path=args.metrics_file,
+                             enabled=not args.no_progress)
+
+    # 2. 加载扫描数据
+    containers = {container_name(f) for f in xlsx_files} if args.only_pkg_containers else None
+    print(f"正在加载扫描数据: {table_a_path}")
+    with progress.stage("加载扫描"):
+        preprocessed_scan_df = load_scan_data(table_a_path, containers, backend=args.backend)
+        progress.set_rows(0 if preprocessed_scan_df is None else len(preprocessed_scan_df))
+    
+    if preprocessed_scan_df is None:
+        print("错误: 无法加载扫描数据，程序终止。")
+        return
+
+    # 扫描数据哈希不含历史重复标记：历史扫描记录每次运行后都会更新，标记本身单独比较
+    scan_hash = scan_dataset_hash(preprocessed_scan_df)
+    seen_store = None
+    run_label = args.run_label or date.today().isoformat()
+    if args.seen_store:
+        seen_store = SeenStore(args.seen_store)
+        preprocessed_scan_df = mark_history_duplicates(preprocessed_scan_df, seen_store, run_label)
+        history_count = int((preprocessed_scan_df[HISTORY_DUP_COLUMN] == '是').sum())
+        print(f"历史扫描记录: 已记录 {len(seen_store)} 个条码，本次发现 {history_count} 条历史重复扫描")
+
+    DEFAULT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    journal = load_run_journal(DEFAULT_OUTPUT_DIR)
+    run_options = journal_options(report_options, args.backend, history_flags_hash(preprocessed_scan_df))
+
+    print(f"找到 {len(xlsx_files)} 个文件待处理...")
+    results = {}
+    pending = []
+    skipped_count = 0
+    for idx, xlsx_file in enumerate(xlsx_files, 1):
+        pkg_hash = file_sha256(xlsx_file)
+        if args.resume:
+            cached = load_journal_result(journal, xlsx_file, pkg_hash, scan_hash, len(preprocessed_scan_df),
+                                         run_options)
+            if cached:
+                print(f"[{idx}/{len(xlsx_files)}] {xlsx_file.name}: 输入未变化且输出已存在，跳过")
+                results[idx] = cached
+                skipped_count += 1
+                continue
+        pending.append((idx, xlsx_file, pkg_hash))
+
+    # 进度只统计需要处理的文件，预计剩余时间按文件大小加权（从此处起计，不含加载扫描）
+    progress.start_batch(len(pending), float(sum(xlsx_file.stat().st_size for _, xlsx_file, _ in pending)))
+
+    def finish(idx: int, xlsx_file: Path, pkg_hash: str, result: Optional[dict]):
+        if result and result["backfill_ok"]:
+            record_journal_entry(journal, DEFAULT_OUTPUT_DIR, xlsx_file, pkg_hash, scan_hash, result, run_options)
+        results[idx] = result
+        progress.finish_file(bool(result), xlsx_file.name, float(xlsx_file.stat().st_size))
+
+    if args.workers > 1 and len(pending) > 1:
+        store_path = DEFAULT_OUTPUT_DIR / ".scan_store"
+        shutil.rmtree(store_path, ignore_errors=True)
+        publish_scan_store(preprocessed_scan_df, store_path, build_near_miss_index(preprocessed_scan_df))
+        print(f"扫描数据已发布为共享存储: {store_path}，使用 {args.workers} 个进程处理 {len(pending)} 个文件")
+        if args.match_workers > 1 and args.backend == "pandas":
+            print("警告: 多进程处理时各文件在共享存储上匹配，--match-workers 不生效")
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_store_worker,
+                                 initargs=(str(store_path),)) as pool:
+            futures = {pool.submit(_process_file_in_worker, str(xlsx_file), str(DEFAULT_OUTPUT_DIR),
+                                   report_options, args.backend):
+                       (idx, xlsx_file, pkg_hash) for idx, xlsx_file, pkg_hash in pending}
+            for future in as_completed(futures):
+                idx, xlsx_file, pkg_hash = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"  错误: {xlsx_file.name} 处理失败 - {e}")
+                    result = None
+                print(f"[{idx}/{len(xlsx_files)}] {xlsx_file.name}: {'完成' if result else '失败'}")
+                # 各进程内的阶段不单独显示进度，完成一个文件时汇总其阶段统计并输出一行进度
+                if result:
+                    progress.merge_stage_stats(result.pop("stage_stats"))
+                finish(idx, xlsx_file, pkg_hash, result)
+    else:
+        near_miss_index = None
+        for idx, xlsx_file, pkg_hash in pending:
+            print(f"\n[{idx}/{len(xlsx_files)}] 处理文件: {xlsx_file.name}")
+            print("-" * 60)
+            progress.start_file(xlsx_file.name, float(xlsx_file.stat().st_size))
+            if near_miss_index is None:
+                with progress.stage("近似索引", len(preprocessed_scan_df)):
+                    near_miss_index = build_near_miss_index(preprocessed_scan_df)
+            result = process_full_workflow(str(xlsx_file), preprocessed_scan_df, near_miss_index,
+                                           progress=progress, report_options=report_options,
+                                           match_workers=args.match_workers, backend=args.backend)
+            # 只保留统计结果，避免整批结果常驻内存
+            finish(idx, xlsx_file, pkg_hash, compact_result(result) if result else None)
+
+    processed_count = 0
+    file_summaries = []
+    matched_scans = []
+    scan_matched = np.zeros(len(preprocessed_scan_df), dtype=bool)
+    for idx in sorted(results):
+        result = results[idx]
+        if result:
+            processed_count += 1
+            file_summaries.append(result["summary"])
+            matched_scans.append(result["matched_scans"])
+            scan_matched |= result["scan_matched"]
+        
+    if table_b_path.is_dir():
+        print(f"\n批量处理完成！成功处理 {processed_count}/{len(xlsx_files)} 个文件（其中跳过 {skipped_count} 个）。")
+        summary = build_batch_summary(file_summaries, preprocessed_scan_df, scan_matched, matched_scans)
+        export_batch_summary(summary, str(DEFAULT_OUTPUT_DIR / "批次汇总.xlsx"))
+    else:
         print("\n处理完成。")
 
+    if args.other_scans_report and containers is not None:
+        export_other_container_scans(table_a_path, xlsx_files, containers, DEFAULT_OUTPUT_DIR)
+
+    if seen_store is not None:
+        added = record_seen_scans(preprocessed_scan_df, seen_store, run_label)
+        print(f"历史扫描记录已更新: 新增 {added} 个条码（批次 {run_label}）")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+比对结果一致性检查：在同一份输入上分别运行参考实现和待验证实现，
+逐单元格比较各步骤的结果表，以及导出工作簿（比较结果、未预报结果、回填结果）的值与填充色，并并排输出耗时。
+
+实现可以是模块文件路径（如 compare_table_v2.py），也可以是 git:<提交>，
+表示取该提交中的 compare_tables 目录（如 git:HEAD~5、git:master）。
+
+    # 工作区中的 v3 对比最近一次提交（默认）
+    python golden_check.py ./input_scan ./input_pkg
+    # 对比 v2（v2 不做渠道名规范化等处理，预期会有差异）
+    python golden_check.py --reference compare_table_v2.py ./input_scan ./input_pkg
+    # 对比某个历史提交，使用随机生成的输入
+    python golden_check.py --reference git:HEAD~3 --generate 7
+
+存在差异时退出码为 1。
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import multiprocessing
+import random
+import re
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils import column_index_from_string, get_column_letter, range_boundaries
+
+HERE = Path(__file__).resolve().parent
+MAX_REPORTED_DIFFS = 10
+
+
+# ==========================================
+# Loading implementations
+# ==========================================
+
+def _export_git_tree(rev: str, target: Path) -> Path:
+    """把某个提交中的 compare_tables/*.py 导出到 target 目录"""
+    repo_root = Path(subprocess.check_output(["git", "rev-parse", "--show-toplevel"], cwd=HERE, text=True).strip())
+    prefix = HERE.relative_to(repo_root).as_posix()
+    names = subprocess.check_output(["git", "ls-tree", "--name-only", f"{rev}:{prefix}"],
+                                    cwd=repo_root, text=True).split()
+    target.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        if name.endswith(".py"):
+            content = subprocess.check_output(["git", "show", f"{rev}:{prefix}/{name}"], cwd=repo_root)
+            (target / name).write_bytes(content)
+    return target
+
+
+def _drop_sibling_modules(directory: Path):
+    """
+    从 sys.modules 中移除与 directory 下 .py 文件同名的模块，以及从该目录加载的模块
+    （不包括本脚本与 load_implementation 注册的 golden_<label> 实现模块）
+    """
+    names = {path.stem for path in directory.glob("*.py")}
+    for name, module in list(sys.modules.items()):
+        if name == "__main__" or name.startswith("golden_"):
+            continue
+        module_file = getattr(module, "__file__", None)
+        if name in names or (module_file and Path(module_file).resolve().parent == directory):
+            sys.modules.pop(name, None)
+
+
+def load_implementation(spec: str, label: str, work_dir: Path):
+    """
+    按 spec 加载实现模块：文件路径，或 git:<提交>（取该提交的 compare_table_v3.py）
+    """
+    if spec.startswith("git:"):
+        rev = spec[len("git:"):]
+        path = _export_git_tree(rev, work_dir / f"{label}_src") / "compare_table_v3.py"
+    else:
+        path = Path(spec)
+        if not path.is_absolute() and not path.exists():
+            path = HERE / path
+    path = path.resolve()
+    if not path.exists():
+        raise FileNotFoundError(f"找不到实现: {spec}")
+
+    # 实现依赖同目录下的其他模块（scan_store、seen_store 等）：加载前后都移除已缓存的同名模块，
+    # 各实现只会导入自己目录下的版本，不会沿用另一侧已加载的模块
+    _drop_sibling_modules(path.parent)
+    sys.path.insert(0, str(path.parent))
+    try:
+        module_spec = importlib.util.spec_from_file_location(f"golden_{label}", path)
+        module = importlib.util.module_from_spec(module_spec)
+        # 注册模块名，多进程路径（parallel_match）按模块名序列化工作函数
+        sys.modules[module_spec.name] = module
+        module_spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(str(path.parent))
+        _drop_sibling_modules(path.parent)
+    module.__golden_source__ = spec
+    return module
+
+
+# ==========================================
+# Generated inputs
+# ==========================================
+
+def _random_fba(r: random.Random) -> str:
+    chars = string.ascii_uppercase + string.digits
+    return "FBA15" + "".join(r.choice(chars) for _ in range(7)) + "U00" + "".join(r.choice(string.digits) for _ in range(4))
+
+
+def generate_inputs(target: Path, seed: int = 0, containers: Tuple[str, ...] = ("CA", "CB", "CC"),
+                    rows_per_channel: int = 60, extra_scans: int = 40) -> Tuple[Path, Path]:
+    """
+    生成一组随机的扫描数据与操作分表，覆盖一对多匹配、箱号/渠道不对齐、重复扫描、短条码、
+    C 开头编码条码与无法解析的箱码等情况。返回 (扫描文件夹, 操作分表文件夹)。
+    """
+    r = random.Random(seed)
+    scan_dir = target / "scan"
+    pkg_dir = target / "pkg"
+    scan_dir.mkdir(parents=True, exist_ok=True)
+    pkg_dir.mkdir(parents=True, exist_ok=True)
+    scans = []
+    for container in containers:
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "包裹清单"
+        codes_by_channel = {}
+        for gi, channel in enumerate(["CWE-DE01", "卡派-FR02", "US03"]):
+            base = gi * 6 + 1
+            ws.cell(row=1, column=base, value=channel)
+            for k, header in enumerate(["预报单号", "托盘序号", "出库Ref", "实际扫描", "破损/不可识别"]):
+                ws.cell(row=2, column=base + k, value=header)
+            codes = []
+            for i in range(rows_per_channel):
+                if r.random() < 0.05:
+                    continue
+                code = _random_fba(r) if r.random() < 0.9 else f"SHORT{i}"
+                pallet = r.choice([None, f"P{r.randint(1, 9)}", r.randint(1, 9)])
+                ws.cell(row=3 + i, column=base, value=code)
+                if pallet is not None:
+                    ws.cell(row=3 + i, column=base + 1, value=pallet)
+                ws.cell(row=3 + i, column=base + 2, value=f"REF{i}")
+                codes.append((code, channel.replace("CWE-", "").replace("卡派-", "")))
+            codes_by_channel[channel] = codes
+
+        ws2 = wb.create_sheet("包裹列表")
+        ws2.cell(row=1, column=1, value="Platform Order Ref.1\n平台单号1")
+        ws2.cell(row=1, column=2, value="Track Nr.\n跟踪号")
+        for row, (code, _) in enumerate(codes_by_channel["卡派-FR02"][:10], start=2):
+            ws2.cell(row=row, column=1, value=code)
+            ws2.cell(row=row, column=2, value=_random_fba(r))
+        wb.save(pkg_dir / f"{container}操作分表.xlsx")
+
+        for codes in codes_by_channel.values():
+            for code, channel in codes:
+                if r.random() < 0.2:
+                    continue
+                box = container if r.random() < 0.85 else "OTHER"
+                scan_channel = channel if r.random() < 0.85 else "XX"
+                box_code = "badbox" if r.random() < 0.05 else f"{box},{scan_channel},PAL{r.randint(1, 5)}"
+                scans.append([len(scans), box_code, "t", code])
+                if r.random() < 0.1:
+                    scans.append([len(scans), f"{box},{scan_channel},PAL9", "t", code])
+
+    for _ in range(extra_scans):
+        scans.append([len(scans), f"{r.choice(containers)},DE01,PAL1", "t", _random_fba(r)])
+    for _ in range(10):
+        encoded = f"C{r.randint(0, 99):02d}{r.randint(0, 99):02d}{r.randint(0, 10 ** 9):011d}{r.randint(0, 9999):04d}"
+        scans.append([len(scans), f"{containers[0]},DE01,PAL1", "t", encoded])
+    scans.append([len(scans), f"{containers[0]},DE01,PAL1", "t", 123456])
+    r.shuffle(scans)
+
+    df = pd.DataFrame(scans, columns=["序号", "箱码", "时间", "条码"])
+    df = pd.concat([df, pd.DataFrame([[None] * 4] * 4, columns=df.columns)], ignore_index=True)
+    df.to_excel(scan_dir / "scan1.xlsx", index=False)
+    return scan_dir, pkg_dir
+
+
+# ==========================================
+# Comparison
+# ==========================================
+
+def _cells_equal(a, b) -> bool:
+    if a is None or b is None or (not isinstance(a, str) and pd.isna(a)) or (not isinstance(b, str) and pd.isna(b)):
+        return (a is None or (not isinstance(a, str) and pd.isna(a))) and \
+               (b is None or (not isinstance(b, str) and pd.isna(b)))
+    if isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number)) \
+            and not isinstance(a, bool) and not isinstance(b, bool):
+        return float(a) == float(b)
+    return a == b
+
+
+def compare_frames(reference: pd.DataFrame, candidate: pd.DataFrame, check_index: bool = True) -> List[str]:
+    """逐单元格比较两个结果表（忽略数值列的 dtype 差异），返回差异描述"""
+    if reference is None or candidate is None:
+        return [] if reference is None and candidate is None else ["一侧没有结果"]
+    diffs = []
+    if list(reference.columns) != list(candidate.columns):
+        diffs.append(f"列不同: {list(reference.columns)} != {list(candidate.columns)}")
+    if len(reference) != len(candidate):
+        diffs.append(f"行数不同: {len(reference)} != {len(candidate)}")
+        return diffs
+    if check_index and list(reference.index) != list(candidate.index):
+        diffs.append("行索引不同")
+    for col in [c for c in reference.columns if c in candidate.columns]:
+        ref_values = reference[col].to_numpy(dtype=object)
+        cand_values = candidate[col].to_numpy(dtype=object)
+        for i, (a, b) in enumerate(zip(ref_values, cand_values)):
+            if not _cells_equal(a, b):
+                diffs.append(f"第 {i} 行 [{col}]: {a!r} != {b!r}")
+    return diffs
+
+
+def _fill_colors(fill) -> Tuple[str, str]:
+    """填充的 (前景色, 背景色)：两者都比较，条件格式与逐单元格填充须使用同一填充"""
+    return str(fill.fgColor.rgb), str(fill.bgColor.rgb)
+
+
+def _fill_color(cell) -> Optional[Tuple[str, str]]:
+    if cell.fill is None or cell.fill.fill_type is None:
+        return None
+    return _fill_colors(cell.fill)
+
+
+# 导出时生成的状态条件格式规则形如 $N2="红"
+_STATUS_RULE = re.compile(r'^\$([A-Z]+)(\d+)="(.*)"$')
+
+
+def _rule_fills(ws) -> Dict[Tuple[int, int], Tuple[str, str]]:
+    """解析工作表上的状态条件格式，得到 (行, 列) -> 显示的填充色，以便与逐单元格填充比较"""
+    fills = {}
+    for cf_range in ws.conditional_formatting:
+        for rule in cf_range.rules:
+            match = _STATUS_RULE.match(rule.formula[0]) if rule.formula else None
+            if match is None or rule.dxf is None or rule.dxf.fill is None:
+                continue
+            status_col = column_index_from_string(match.group(1))
+            first_row = int(match.group(2))
+            color = _fill_colors(rule.dxf.fill)
+            for cell_range in cf_range.sqref.ranges:
+                min_col, min_row, max_col, max_row = range_boundaries(str(cell_range))
+                for row in range(min_row, max_row + 1):
+                    if ws.cell(row=row - min_row + first_row, column=status_col).value == match.group(3):
+                        for col in range(min_col, max_col + 1):
+                            fills.setdefault((row, col), color)
+    return fills
+
+
+def _hidden_columns(ws) -> set:
+    return {column_index_from_string(letter) for letter, dim in ws.column_dimensions.items() if dim.hidden}
+
+
+def compare_workbooks(reference_file: Path, candidate_file: Path, sheets: Dict[str, str] = None) -> List[str]:
+    """
+    比较两个工作簿的单元格值与填充色。sheets 为 {参考工作表: 待验证工作表}，默认比较同名工作表。
+    """
+    if not reference_file.exists() or not candidate_file.exists():
+        return [] if not reference_file.exists() and not candidate_file.exists() else ["一侧没有输出文件"]
+    wb_ref = load_workbook(reference_file)
+    wb_cand = load_workbook(candidate_file)
+    if sheets is None:
+        sheets = {name: name for name in wb_ref.sheetnames}
+    diffs = []
+    for ref_name, cand_name in sheets.items():
+        if ref_name not in wb_ref.sheetnames or cand_name not in wb_cand.sheetnames:
+            if (ref_name in wb_ref.sheetnames) != (cand_name in wb_cand.sheetnames):
+                diffs.append(f"工作表 {ref_name}/{cand_name} 只存在于一侧")
+            continue
+        ws_ref = wb_ref[ref_name]
+        ws_cand = wb_cand[cand_name]
+        # 比较用户看到的效果：条件格式与逐单元格填充等价，隐藏的辅助列不参与比较
+        rules_ref = _rule_fills(ws_ref)
+        rules_cand = _rule_fills(ws_cand)
+        hidden = _hidden_columns(ws_ref) | _hidden_columns(ws_cand)
+        max_row = max(ws_ref.max_row, ws_cand.max_row)
+        max_col = max(ws_ref.max_column, ws_cand.max_column)
+        for row in range(1, max_row + 1):
+            for col in range(1, max_col + 1):
+                if col in hidden:
+                    continue
+                c_ref = ws_ref.cell(row=row, column=col)
+                c_cand = ws_cand.cell(row=row, column=col)
+                if not _cells_equal(c_ref.value, c_cand.value):
+                    diffs.append(f"{ref_name}!{c_ref.coordinate} 值: {c_ref.value!r} != {c_cand.value!r}")
+                fill_ref = rules_ref.get((row, col)) or _fill_color(c_ref)
+                fill_cand = rules_cand.get((row, col)) or _fill_color(c_cand)
+                if fill_ref != fill_cand:
+                    diffs.append(f"{ref_name}!{get_column_letter(col)}{row} 填充: {fill_ref} != {fill_cand}")
+    return diffs
+
+
+# ==========================================
+# Running
+# ==========================================
+
+class StepRecorder:
+    """记录每个步骤在两侧的耗时与差异"""
+
+    def __init__(self):
+        self.rows = []
+
+    def record(self, file_name: str, step: str, ref_seconds: Optional[float], cand_seconds: Optional[float],
+               diffs: List[str]):
+        self.rows.append({"文件": file_name, "步骤": step, "参考耗时": ref_seconds,
+                          "待验证耗时": cand_seconds, "差异数": len(diffs)})
+        status = "一致" if not diffs else f"{len(diffs)} 处差异"
+        print(f"  {step:<10} {_fmt_seconds(ref_seconds):>9} {_fmt_seconds(cand_seconds):>9} "
+              f"{_fmt_speedup(ref_seconds, cand_seconds):>8}  {status}")
+        for line in diffs[:MAX_REPORTED_DIFFS]:
+            print(f"      - {line}")
+        if len(diffs) > MAX_REPORTED_DIFFS:
+            print(f"      ... 另有 {len(diffs) - MAX_REPORTED_DIFFS} 处差异")
+
+    @property
+    def total_diffs(self) -> int:
+        return sum(row["差异数"] for row in self.rows)
+
+
+def _fmt_seconds(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds:.3f}s"
+
+
+def _fmt_speedup(ref_seconds: Optional[float], cand_seconds: Optional[float]) -> str:
+    if not ref_seconds or not cand_seconds:
+        return "-"
+    return f"{ref_seconds / cand_seconds:.1f}x"
+
+
+def _timed(func, *args, **kwargs):
+    """静默运行实现函数（实现内部会打印进度），返回 (结果, 耗时)"""
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def _unreport(module, df_scan: pd.DataFrame, df_pkg: pd.DataFrame) -> Optional[pd.DataFrame]:
+    if not hasattr(module, "compare_scan_to_pkg"):
+        return None
+    return module.filter_valid_boxes(module.compare_scan_to_pkg(df_scan, df_pkg))
+
+
+def _export_report(module, df_compare: pd.DataFrame, df_unreport: Optional[pd.DataFrame], filename: Path,
+                   fill_mode: str = None) -> str:
+    """导出比较结果报告，返回比较结果所在的工作表名"""
+    options = {"fill_mode": fill_mode} if fill_mode else {}
+    if hasattr(module, "export_merged_with_colors") and df_unreport is not None:
+        module.export_merged_with_colors(df_compare, df_unreport, str(filename), **options)
+        return "比较结果"
+    module.export_with_colors(df_compare, str(filename), **options)
+    return "Sheet1"
+
+
+def check_file(reference, candidate, df_scan_ref: pd.DataFrame, df_scan_cand: pd.DataFrame,
+               pkg_file: Path, work_dir: Path, recorder: StepRecorder, fill_mode: str = None):
+    """在一个操作分表上逐步运行两侧实现并比较"""
+    name = pkg_file.stem
+    out_ref = work_dir / "reference"
+    out_cand = work_dir / "candidate"
+    out_ref.mkdir(parents=True, exist_ok=True)
+    out_cand.mkdir(parents=True, exist_ok=True)
+    print(f"\n[{name}]")
+
+    pkg_ref, t_ref = _timed(reference.preprocess_pkg_list, str(pkg_file))
+    pkg_cand, t_cand = _timed(candidate.preprocess_pkg_list, str(pkg_file))
+    recorder.record(name, "包裹预处理", t_ref, t_cand, compare_frames(pkg_ref, pkg_cand))
+
+    compare_ref, t_ref = _timed(reference.compare_tables, df_scan_ref, pkg_ref)
+    compare_cand, t_cand = _timed(candidate.compare_tables, df_scan_cand, pkg_cand)
+    recorder.record(name, "正向比对", t_ref, t_cand, compare_frames(compare_ref, compare_cand))
+
+    unreport_ref, t_ref = _timed(_unreport, reference, df_scan_ref, pkg_ref)
+    unreport_cand, t_cand = _timed(_unreport, candidate, df_scan_cand, pkg_cand)
+    if unreport_ref is not None and unreport_cand is not None:
+        recorder.record(name, "逆向比对", t_ref, t_cand, compare_frames(unreport_ref, unreport_cand))
+
+    # 待验证实现的共享存储快速路径（多进程模式使用），结果应与参考实现的普通路径一致
+    if hasattr(candidate, "compare_with_store") and unreport_ref is not None:
+        store_dir = work_dir / "candidate_store"
+        if not store_dir.exists():
+            with contextlib.redirect_stdout(io.StringIO()):
+                candidate.publish_scan_store(df_scan_cand, store_dir)
+        store = candidate.open_scan_store(store_dir)
+        (store_compare, store_unreport, _), t_store = _timed(candidate.compare_with_store, store, pkg_cand)
+        diffs = compare_frames(compare_ref, store_compare) + compare_frames(unreport_ref, store_unreport)
+        recorder.record(name, "共享存储比对", None, t_store, diffs)
+
+    # 待验证实现的按列后端与文件内分段并行匹配，结果应与参考实现的普通路径一致
+    if hasattr(candidate, "columnar_match") and unreport_ref is not None:
+        pkg_columnar, t_pre = _timed(candidate.preprocess_pkg_list, str(pkg_file), backend="columnar")
+        (pairs, first_match), t_match = _timed(candidate.columnar_match, df_scan_cand, pkg_columnar)
+        diffs = compare_frames(pkg_ref, pkg_columnar)
+        with contextlib.redirect_stdout(io.StringIO()):
+            diffs += compare_frames(compare_ref, candidate.compare_tables(df_scan_cand, pkg_columnar, pairs))
+            diffs += compare_frames(unreport_ref, candidate.filter_valid_boxes(
+                candidate.compare_scan_to_pkg(df_scan_cand, pkg_columnar, first_match)))
+        recorder.record(name, "按列后端", None, t_pre + t_match, diffs)
+    # 子进程以 fork 方式启动时才能直接使用已加载的实现模块（spawn 方式下子进程无法按文件导入它）
+    if (hasattr(candidate, "parallel_match") and unreport_ref is not None
+            and multiprocessing.get_start_method() == "fork"):
+        # 分段足够小，保证实际分为多段、在多个进程中执行
+        chunk_rows = max(1, len(pkg_cand) // 4)
+        (pairs, first_match), t_par = _timed(candidate.parallel_match, df_scan_cand, pkg_cand, 2, chunk_rows)
+        with contextlib.redirect_stdout(io.StringIO()):
+            diffs = compare_frames(compare_ref, candidate.compare_tables(df_scan_cand, pkg_cand, pairs))
+            diffs += compare_frames(unreport_ref, candidate.filter_valid_boxes(
+                candidate.compare_scan_to_pkg(df_scan_cand, pkg_cand, first_match)))
+        recorder.record(name, "并行匹配", None, t_par, diffs)
+
+    report_ref = out_ref / f"{name}_比较结果.xlsx"
+    report_cand = out_cand / f"{name}_比较结果.xlsx"
+    sheet_ref, t_ref = _timed(_export_report, reference, compare_ref, unreport_ref, report_ref)
+    sheet_cand, t_cand = _timed(_export_report, candidate, compare_cand, unreport_cand, report_cand, fill_mode)
+    sheets = {sheet_ref: sheet_cand}
+    if sheet_ref == sheet_cand == "比较结果":
+        sheets["未预报结果"] = "未预报结果"
+    recorder.record(name, "导出报告", t_ref, t_cand, compare_workbooks(report_ref, report_cand, sheets))
+
+    backfill_ref = out_ref / f"回填结果_{name}.xlsx"
+    backfill_cand = out_cand / f"回填结果_{name}.xlsx"
+    _, t_ref = _timed(reference.export_backfill_to_original, str(pkg_file), compare_ref, str(backfill_ref))
+    _, t_cand = _timed(candidate.export_backfill_to_original, str(pkg_file), compare_cand, str(backfill_cand))
+    recorder.record(name, "回填结果", t_ref, t_cand, compare_workbooks(backfill_ref, backfill_cand))
+
+
+def run_check(reference, candidate, table_a: Path, table_b: Path, work_dir: Path,
+              fill_mode: str = None) -> StepRecorder:
+    recorder = StepRecorder()
+    print(f"参考实现: {reference.__golden_source__}")
+    print(f"待验证实现: {candidate.__golden_source__}")
+    print(f"  {'步骤':<10} {'参考':>9} {'待验证':>9} {'加速比':>8}")
+
+    df_scan_ref, t_ref = _timed(reference.load_scan_data, Path(table_a))
+    df_scan_cand, t_cand = _timed(candidate.load_scan_data, Path(table_a))
+    if df_scan_ref is None or df_scan_cand is None:
+        raise RuntimeError("扫描数据加载失败")
+    recorder.record("扫描数据", "加载解码", t_ref, t_cand, compare_frames(df_scan_ref, df_scan_cand))
+    if "columnar" in getattr(candidate, "BACKENDS", ()):
+        df_scan_columnar, t_columnar = _timed(candidate.load_scan_data, Path(table_a), backend="columnar")
+        recorder.record("扫描数据", "按列加载", None, t_columnar, compare_frames(df_scan_ref, df_scan_columnar))
+
+    pkg_files = candidate.list_pkg_files(table_b) if hasattr(candidate, "list_pkg_files") and table_b.is_dir() \
+        else (sorted(f for f in table_b.glob("*操作分表.xlsx") if not f.name.startswith("~$"))
+              if table_b.is_dir() else [table_b])
+    for pkg_file in pkg_files:
+        check_file(reference, candidate, df_scan_ref, df_scan_cand, pkg_file, work_dir, recorder, fill_mode)
+    return recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description='比较参考实现与待验证实现的比对结果、导出颜色与耗时')
+    parser.add_argument('table_a', nargs='?', default='./compare_tables_test/input_scan',
+                        help='表A文件路径或文件夹(扫描数据)')
+    parser.add_argument('table_b', nargs='?', default='./compare_tables_test/input_pkg',
+                        help='表B文件路径或文件夹(包裹清单)')
+    parser.add_argument('--reference', default='git:HEAD',
+                        help='参考实现: 模块文件路径或 git:<提交>，默认为最近一次提交的 v3')
+    parser.add_argument('--candidate', default='compare_table_v3.py',
+                        help='待验证实现: 模块文件路径或 git:<提交>')
+    parser.add_argument('--generate', type=int, metavar='SEED', default=None,
+                        help='不使用 table_a/table_b，而是按随机种子生成输入')
+    parser.add_argument('--fill-mode', default=None,
+                        help='待验证实现导出报告时使用的着色方式（如 rules），报告按显示效果比较')
+    parser.add_argument('--work-dir', default=None, help='保存中间输出的目录（默认使用临时目录）')
+    parser.add_argument('--timings', default=None, help='将耗时与差异统计另存为 Excel')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="golden_") as tmp:
+        work_dir = Path(args.work_dir) if args.work_dir else Path(tmp)
+        if args.generate is not None:
+            table_a, table_b = generate_inputs(work_dir / "inputs", seed=args.generate)
+        else:
+            table_a, table_b = Path(args.table_a), Path(args.table_b)
+
+        reference = load_implementation(args.reference, "reference", work_dir)
+        candidate = load_implementation(args.candidate, "candidate", work_dir)
+        recorder = run_check(reference, candidate, table_a, table_b, work_dir, args.fill_mode)
+
+        if args.timings:
+            pd.DataFrame(recorder.rows).to_excel(args.timings, index=False)
+
+    print("-" * 60)
+    if recorder.total_diffs:
+        print(f"发现 {recorder.total_diffs} 处差异")
+        sys.exit(1)
+    print("全部一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+// --- Data Loading Hooks ---
+// data/meta.js 与 data/t*_NNNN.js 以脚本方式加载（本地直接打开 index.html 即可，无需服务器）
+let reportMeta = null;
+let pendingChunk = null;
+
+window.REPORT_META = meta => {
+    reportMeta = meta;
+};
+
+window.REPORT_CHUNK = (tableKey, index, encoded) => {
+    pendingChunk = { tableKey, index, encoded };
+};
+
+document.addEventListener('DOMContentLoaded', () => {
+    // --- Config ---
+    const ROW_HEIGHT = 28;
+    const HEADER_HEIGHT = 32;
+    const ROW_NUMBER_WIDTH = 64;
+    // 浏览器对元素高度有上限，超出时按比例映射滚动位置
+    const MAX_SCROLL_PX = 8000000;
+    const SEARCH_DELAY = 200;
+    const STATUS_CODES = { '红': '1', '黄': '2', '绿': '3', '橙': '4' };
+    const NO_STATUS = '0';
+
+    // --- State ---
+    let tables = [];              // {meta, rows, status, loadedChunks}
+    let current = null;           // 当前显示的表
+    let filtered = null;          // 当前表筛选后的行号；null 表示未筛选（全部显示）
+    let activeStatuses = new Set(['0', '1', '2', '3', '4']);
+    let query = '';
+    let rowPool = [];
+    let renderQueued = false;
+    let searchTimer;
+
+    // --- DOM Elements ---
+    const els = {
+        reportTitle: document.getElementById('reportTitle'),
+        tabs: document.getElementById('tabs'),
+        statusFilters: document.getElementById('statusFilters'),
+        searchInput: document.getElementById('searchInput'),
+        viewport: document.getElementById('viewport'),
+        gridHeader: document.getElementById('gridHeader'),
+        spacer: document.getElementById('spacer'),
+        rows: document.getElementById('rows'),
+        rowCount: document.getElementById('rowCount'),
+        loadState: document.getElementById('loadState')
+    };
+
+    // --- Initialization ---
+    function init() {
+        if (!reportMeta) {
+            els.rowCount.textContent = '未找到报告数据 (data/meta.js)';
+            return;
+        }
+        if (typeof DecompressionStream === 'undefined') {
+            els.rowCount.textContent = '当前浏览器不支持解压报告数据，请使用新版 Chrome / Edge / Firefox 打开';
+            return;
+        }
+
+        document.title = reportMeta.title;
+        els.reportTitle.textContent = reportMeta.title;
+        tables = reportMeta.tables.map(meta => ({ meta, rows: [], status: [], loadedChunks: 0 }));
+
+        renderTabs();
+        selectTable(0);
+
+        els.viewport.addEventListener('scroll', queueRender);
+        window.addEventListener('resize', queueRender);
+        els.searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                query = els.searchInput.value.trim().toLowerCase();
+                rebuildFilter();
+            }, SEARCH_DELAY);
+        });
+
+        loadAllChunks();
+    }
+
+    // --- Chunk Loading ---
+    function loadScript(src) {
+        return new Promise((resolve, reject) => {
+            const script = document.createElement('script');
+            script.src = src;
+            script.onload = () => {
+                script.remove();
+                resolve();
+            };
+            script.onerror = () => reject(new Error(`无法加载 ${src}`));
+            document.body.appendChild(script);
+        });
+    }
+
+    async function decodeChunk(encoded) {
+        const binary = atob(encoded);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+        return JSON.parse(await new Response(stream).text());
+    }
+
+    async function loadAllChunks() {
+        // 按顺序逐块加载，保证行顺序与报告一致；首块加载后即可浏览
+        try {
+            for (const table of tables) {
+                for (let index = 0; index < table.meta.chunks; index++) {
+                    const name = `${table.meta.key}_${String(index).padStart(4, '0')}.js`;
+                    await loadScript(`data/${name}`);
+                    const chunk = pendingChunk;
+                    pendingChunk = null;
+                    const data = await decodeChunk(chunk.encoded);
+                    appendChunk(table, data);
+                }
+            }
+        } catch (e) {
+            els.loadState.textContent = `加载失败: ${e.message}`;
+            return;
+        }
+        updateStatusBar();
+    }
+
+    function appendChunk(table, data) {
+        const start = table.rows.length;
+        for (let i = 0; i < data.rows.length; i++) {
+            table.rows.push(data.rows[i]);
+            table.status.push(data.status[i] || NO_STATUS);
+        }
+        table.loadedChunks += 1;
+        if (table === current) {
+            if (filtered !== null) {
+                extendFilter(start);
+            }
+            queueRender();
+        }
+        updateStatusBar();
+    }
+
+    // --- Filtering ---
+    function isFiltering() {
+        return query !== '' || (current.meta.has_status && activeStatuses.size < 5);
+    }
+
+    function matches(i) {
+        if (current.meta.has_status && !activeStatuses.has(current.status[i])) {
+            return false;
+        }
+        if (query === '') {
+            return true;
+        }
+        const row = current.rows[i];
+        return current.meta.search.some(col => row[col].toLowerCase().includes(query));
+    }
+
+    function extendFilter(start) {
+        for (let i = start; i < current.rows.length; i++) {
+            if (matches(i)) {
+                filtered.push(i);
+            }
+        }
+    }
+
+    function rebuildFilter() {
+        filtered = isFiltering() ? [] : null;
+        if (filtered !== null) {
+            extendFilter(0);
+        }
+        els.viewport.scrollTop = 0;
+        queueRender();
+        updateStatusBar();
+    }
+
+    function visibleCount() {
+        return filtered === null ? current.rows.length : filtered.length;
+    }
+
+    function rowIndexAt(k) {
+        return filtered === null ? k : filtered[k];
+    }
+
+    // --- UI ---
+    function renderTabs() {
+        els.tabs.innerHTML = '';
+        tables.forEach((table, i) => {
+            const tab = document.createElement('button');
+            tab.className = 'tab';
+            tab.textContent = `${table.meta.name} (${table.meta.rows.toLocaleString()})`;
+            tab.addEventListener('click', () => selectTable(i));
+            els.tabs.appendChild(tab);
+        });
+    }
+
+    function renderStatusFilters() {
+        els.statusFilters.innerHTML = '';
+        if (!current.meta.has_status) {
+            return;
+        }
+        const counts = current.meta.status_counts;
+        const coloredTotal = Object.values(counts).reduce((a, b) => a + b, 0);
+        const entries = Object.entries(STATUS_CODES).map(([status, code]) => ({
+            code, label: status, count: counts[status] || 0, color: reportMeta.status_colors[status]
+        }));
+        entries.push({ code: NO_STATUS, label: '无状态', count: current.meta.rows - coloredTotal, color: '#ffffff' });
+
+        entries.forEach(entry => {
+            const chip = document.createElement('label');
+            chip.className = 'filter-chip' + (activeStatuses.has(entry.code) ? '' : ' off');
+            const swatch = document.createElement('span');
+            swatch.className = 'swatch';
+            swatch.style.background = entry.color;
+            chip.appendChild(swatch);
+            chip.appendChild(document.createTextNode(`${entry.label} ${entry.count.toLocaleString()}`));
+            chip.addEventListener('click', () => {
+                if (activeStatuses.has(entry.code)) {
+                    activeStatuses.delete(entry.code);
+                } else {
+                    activeStatuses.add(entry.code);
+                }
+                chip.classList.toggle('off', !activeStatuses.has(entry.code));
+                rebuildFilter();
+            });
+            els.statusFilters.appendChild(chip);
+        });
+    }
+
+    function selectTable(i) {
+        current = tables[i];
+        Array.from(els.tabs.children).forEach((tab, j) => tab.classList.toggle('active', i === j));
+        els.searchInput.disabled = current.meta.search.length === 0;
+
+        const template = [ROW_NUMBER_WIDTH, ...current.meta.widths].map(w => `${w}px`).join(' ');
+        els.gridHeader.style.gridTemplateColumns = template;
+        els.gridHeader.innerHTML = '';
+        ['#', ...current.meta.columns].forEach(name => {
+            const cell = document.createElement('div');
+            cell.className = 'cell';
+            cell.textContent = name;
+            cell.title = name;
+            els.gridHeader.appendChild(cell);
+        });
+
+        // 行元素按表重建，之后滚动时只更新文字与底色
+        els.rows.innerHTML = '';
+        rowPool = [];
+        els.rows.dataset.template = template;
+
+        renderStatusFilters();
+        rebuildFilter();
+    }
+
+    function makeRow() {
+        const row = document.createElement('div');
+        row.className = 'grid-row';
+        row.style.gridTemplateColumns = els.rows.dataset.template;
+        const numberCell = document.createElement('div');
+        numberCell.className = 'cell row-number';
+        row.appendChild(numberCell);
+        current.meta.columns.forEach(() => {
+            const cell = document.createElement('div');
+            cell.className = 'cell';
+            row.appendChild(cell);
+        });
+        els.rows.appendChild(row);
+        return row;
+    }
+
+    function queueRender() {
+        if (!renderQueued) {
+            renderQueued = true;
+            requestAnimationFrame(() => {
+                renderQueued = false;
+                render();
+            });
+        }
+    }
+
+    function render() {
+        // 虚拟滚动：占位元素撑出总高度，只渲染可见的行
+        const n = visibleCount();
+        const totalPx = n * ROW_HEIGHT;
+        const spacerPx = Math.min(totalPx, MAX_SCROLL_PX);
+        els.spacer.style.height = `${spacerPx}px`;
+
+        const bodyHeight = Math.max(ROW_HEIGHT, els.viewport.clientHeight - HEADER_HEIGHT);
+        const scrollTop = els.viewport.scrollTop;
+        let exact;
+        if (totalPx <= MAX_SCROLL_PX) {
+            exact = scrollTop / ROW_HEIGHT;
+        } else {
+            exact = scrollTop / Math.max(1, spacerPx - bodyHeight) * Math.max(0, n - bodyHeight / ROW_HEIGHT);
+        }
+        const first = Math.min(Math.floor(exact), Math.max(0, n - 1));
+        const offset = Math.max(0, scrollTop - (exact - first) * ROW_HEIGHT);
+        els.rows.style.transform = `translateY(${offset}px)`;
+
+        const visible = Math.max(0, Math.min(n - first, Math.ceil(bodyHeight / ROW_HEIGHT) + 1));
+        while (rowPool.length < visible) {
+            rowPool.push(makeRow());
+        }
+        const colors = reportMeta.status_colors;
+        const codeColors = {};
+        Object.entries(STATUS_CODES).forEach(([status, code]) => {
+            codeColors[code] = colors[status];
+        });
+
+        rowPool.forEach((row, j) => {
+            if (j >= visible) {
+                row.style.display = 'none';
+                return;
+            }
+            const index = rowIndexAt(first + j);
+            const values = current.rows[index];
+            row.style.display = '';
+            row.style.background = codeColors[current.status[index]] || '';
+            const cells = row.children;
+            cells[0].textContent = index + 1;
+            for (let c = 0; c < values.length; c++) {
+                cells[c + 1].textContent = values[c];
+                cells[c + 1].title = values[c];
+            }
+        });
+    }
+
+    function updateStatusBar() {
+        const n = visibleCount();
+        const total = current.meta.rows;
+        els.rowCount.textContent = isFiltering()
+            ? `筛选结果 ${n.toLocaleString()} 行 / 共 ${total.toLocaleString()} 行`
+            : `共 ${total.toLocaleString()} 行`;
+        const loaded = tables.reduce((sum, t) => sum + t.rows.length, 0);
+        const all = tables.reduce((sum, t) => sum + t.meta.rows, 0);
+        els.loadState.textContent = loaded < all
+            ? `正在加载 ${loaded.toLocaleString()} / ${all.toLocaleString()} 行`
+            : `生成于 ${reportMeta.generated_at}`;
+    }
+
+    init();
+});
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线：把 v3 的处理拆成可单独执行的阶段，中间结果落盘，只重新执行输入发生变化的阶段。
+
+    ingest_scans      扫描数据 -> <work>/scans.pkl（读取、清洗、解码）
+    build_index       scans.pkl -> <work>/scan_store/（按列 .npy 存储 + 条码索引 + 近似条码索引）
+    ingest_pkg:<名>   操作分表 -> <work>/pkg/<名>.pkl
+    match:<名>        scan_store + pkg -> <work>/match/<名>.pkl（正向/逆向比对、近似条码建议）
+    classify:<名>     match -> <work>/classify/<名>.pkl（状态列）
+    export:<名>       classify -> <output>/<名>_比较结果.xlsx
+    backfill:<名>     classify + 操作分表 -> <output>/回填结果_<名>.xlsx
+    summary           全部 classify + scans.pkl -> <output>/批次汇总.xlsx（操作分表为文件夹时）
+
+阶段键 = 阶段名 + 参数 + 源文件内容哈希 + 上游阶段输出的内容摘要 + 阶段代码摘要。阶段代码 = 阶段函数及其
+（经同目录模块的顶层函数、类、常量）间接用到的全部定义的源码（见 CodeIndex），导出阶段另含网页报告模板；
+修改导出格式只会重跑导出阶段，不会重新读取、匹配。
+键不变且输出齐全的阶段直接跳过；上游重跑但输出内容不变时，下游也不会重跑。状态记录在 <work>/pipeline_state.json。
+
+    python pipeline.py run ./input_scan ./input_pkg                        # 执行全部（跳过未变化的阶段）
+    python pipeline.py run ./input_scan ./input_pkg --targets build_index   # 只更新扫描数据与索引（可单独定时执行）
+    python pipeline.py run ./input_scan ./input_pkg --targets export --fill-mode rules
+    python pipeline.py status ./input_scan ./input_pkg                     # 查看哪些阶段需要重跑
+"""
+
+import argparse
+import ast
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import textwrap
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from compare_table_v3 import (
+    BACKENDS,
+    DEFAULT_OUTPUT_DIR,
+    EXCEL_MAX_DATA_ROWS,
+    FILL_MODES,
+    HTML_VIEWER_DIR,
+    REPORT_FORMATS,
+    SPLIT_MODES,
+    backend_match_workers,
+    build_batch_summary,
+    build_near_miss_index,
+    classify_results,
+    collect_matched_scans,
+    compare_with_store,
+    container_name,
+    export_backfill_to_original,
+    export_batch_summary,
+    export_merged_with_colors,
+    file_sha256,
+    html_report_dir,
+    list_pkg_files,
+    load_scan_data,
+    preprocess_pkg_list,
+    suggest_near_misses,
+    summarize_compare_result,
+)
+from scan_store import open_scan_store, publish_scan_store
+
+STATE_NAME = "pipeline_state.json"
+
+HERE = Path(__file__).resolve().parent
+
+
+def _path_digest(path: Path) -> str:
+    """文件内容哈希；目录为其下所有文件（相对路径 + 内容）的哈希"""
+    if path.is_file():
+        return file_sha256(path)
+    digest = hashlib.sha256()
+    for sub in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(sub.relative_to(path).as_posix().encode("utf-8"))
+        digest.update(file_sha256(sub).encode("ascii"))
+    return digest.hexdigest()
+
+
+def _statement_source(lines: List[str], node: ast.stmt) -> str:
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return "".join(lines[start - 1:node.end_lineno])
+
+
+def _referenced_names(tree: ast.AST) -> Tuple[Set[str], Set[Tuple[str, str]]]:
+    """语句中出现的名称，以及 模块名.属性 形式的引用（按名称保守地收集，局部变量同名时多算也无妨）"""
+    names, attributes = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            attributes.add((node.value.id, node.attr))
+    return names, attributes
+
+
+class CodeIndex:
+    """
+    同目录模块的顶层定义（函数、类、赋值的常量）及其引用关系。阶段代码摘要 = 阶段函数的源码 +
+    它经顶层定义间接用到的全部定义的源码；模块顶层的注册调用（如 register_barcode_decoder(...)）计入该模块的每个定义。
+    标准库与第三方模块不计入。
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.modules: Dict[str, Optional[dict]] = {}
+
+    def module(self, name: str) -> Optional[dict]:
+        if name not in self.modules:
+            path = self.directory / f"{name}.py"
+            self.modules[name] = self._parse(path) if path.is_file() else None
+        return self.modules[name]
+
+    @staticmethod
+    def _parse(path: Path) -> dict:
+        text = path.read_text(encoding="utf-8")
+        lines = text.splitlines(keepends=True)
+        info = {"defs": {}, "imports": {}, "module_aliases": {}, "effects": []}
+        for node in ast.parse(text).body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                info["defs"][node.name] = (_statement_source(lines, node), node)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for sub in ast.walk(target):
+                        if isinstance(sub, ast.Name):
+                            info["defs"][sub.id] = (_statement_source(lines, node), node)
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                for alias in node.names:
+                    info["imports"][alias.asname or alias.name] = (node.module, alias.name)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    info["module_aliases"][alias.asname or alias.name] = alias.name
+            elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+                info["effects"].append((_statement_source(lines, node), node))
+        return info
+
+    def _resolve(self, module: str, name: str) -> Optional[Tuple[str, str]]:
+        info = self.module(module)
+        if info is None:
+            return None
+        if name in info["defs"]:
+            return module, name
+        if name in info["imports"]:
+            return self._resolve(*info["imports"][name])
+        return None
+
+    def _dependencies(self, module: str, tree: ast.AST) -> List[Tuple[str, str]]:
+        info = self.module(module)
+        names, attributes = _referenced_names(tree)
+        found = [self._resolve(module, name) for name in names]
+        found += [self._resolve(info["module_aliases"][owner], attr)
+                  for owner, attr in attributes if owner in info["module_aliases"]]
+        return [item for item in found if item is not None]
+
+    def sources(self, func: Callable) -> List[str]:
+        """函数及其间接用到的同目录顶层定义的源码（按模块、名称排序）"""
+        source_file = Path(inspect.getsourcefile(func)).resolve()
+        module = source_file.stem
+        own_source = inspect.getsource(func)
+        if source_file.parent != self.directory.resolve() or self.module(module) is None:
+            return [own_source]
+        pending = self._dependencies(module, ast.parse(textwrap.dedent(own_source)))
+        seen: Set[Tuple[str, str]] = set()
+        seen_modules: Set[str] = set()
+        while pending:
+            item = pending.pop()
+            if item in seen:
+                continue
+            seen.add(item)
+            info = self.module(item[0])
+            pending.extend(self._dependencies(item[0], info["defs"][item[1]][1]))
+            if item[0] not in seen_modules:
+                seen_modules.add(item[0])
+                for _, effect in info["effects"]:
+                    pending.extend(self._dependencies(item[0], effect))
+        parts = [own_source]
+        for module_name, name in sorted(seen):
+            parts.append(f"{module_name}.{name}\n{self.module(module_name)['defs'][name][0]}")
+        for module_name in sorted(seen_modules):
+            parts.extend(source for source, _ in self.module(module_name)["effects"])
+        return parts
+
+    def digest(self, func: Callable, assets: Iterable[Path] = ()) -> str:
+        """阶段代码摘要：sources(func) + 附带的模板文件或目录（如网页报告查看器）的内容"""
+        digest = hashlib.sha256()
+        for part in self.sources(func):
+            digest.update(part.encode("utf-8"))
+        for path in assets:
+            digest.update(path.name.encode("utf-8"))
+            digest.update(_path_digest(path).encode("ascii"))
+        return digest.hexdigest()
+
+
+class Stage:
+    def __init__(self, name: str, func: Callable[[], Optional[List[Path]]], deps: List[str], sources: List[Path],
+                 outputs: List[Path], params: dict, assets: List[Path]):
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.sources = sources
+        self.outputs = outputs
+        self.params = params
+        self.assets = assets
+
+    @property
+    def kind(self) -> str:
+        return self.name.split(":", 1)[0]
+
+
+class Pipeline:
+    """
+    阶段 DAG：按添加顺序执行（添加时上游必须已存在），每个阶段完成后立即记录状态。
+    阶段函数可返回实际写出的文件列表（如分段导出的各分段文件），记入状态，之后其中任一文件缺失时阶段重跑。
+    """
+
+    def __init__(self, work_dir: Path):
+        self.work_dir = Path(work_dir)
+        self.stages: Dict[str, Stage] = {}
+        self.state_path = self.work_dir / STATE_NAME
+        self.state: Dict[str, dict] = {}
+        self.code_index = CodeIndex(HERE)
+        if self.state_path.exists():
+            with open(self.state_path, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def add(self, name: str, func: Callable[[], Optional[List[Path]]], deps: List[str] = (),
+            sources: List[Path] = (), outputs: List[Path] = (), params: dict = None, assets: List[Path] = ()):
+        missing = [dep for dep in deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"阶段 {name} 的上游阶段不存在: {missing}")
+        self.stages[name] = Stage(name, func, list(deps), [Path(p) for p in sources], [Path(p) for p in outputs],
+                                  params or {}, [Path(p) for p in assets])
+
+    def stage_key(self, stage: Stage) -> Optional[str]:
+        """阶段键；上游尚未成功执行过时返回 None"""
+        dep_digests = []
+        for dep in stage.deps:
+            if dep not in self.state:
+                return None
+            dep_digests.append(self.state[dep]["digest"])
+        payload = {
+            "stage": stage.name,
+            "params": stage.params,
+            "sources": [[str(p), file_sha256(p)] for p in stage.sources],
+            "deps": dep_digests,
+            "code": self.code_index.digest(stage.func, stage.assets),
+        }
+        return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def is_fresh(self, stage: Stage, key: Optional[str]) -> bool:
+        record = self.state.get(stage.name)
+        return (key is not None and record is not None and record["key"] == key
+                and all(p.exists() for p in stage.outputs)
+                and all(Path(p).exists() for p in record.get("written", [])))
+
+    def closure(self, targets: Iterable[str] = None) -> List[str]:
+        """目标阶段（可用阶段名或阶段类型，如 export）及其全部上游，按执行顺序返回"""
+        if not targets:
+            return list(self.stages)
+        targets = set(targets)
+        needed = set()
+        pending = [name for name, stage in self.stages.items() if name in targets or stage.kind in targets]
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+    def save_state(self):
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, targets: Iterable[str] = None, force: Iterable[str] = ()) -> bool:
+        force = set(force or ())
+        failed = set()
+        executed = 0
+        for name in self.closure(targets):
+            stage = self.stages[name]
+            if any(dep in failed for dep in stage.deps):
+                print(f"[跳过] {name}: 上游阶段失败")
+                failed.add(name)
+                continue
+            key = self.stage_key(stage)
+            if name not in force and stage.kind not in force and self.is_fresh(stage, key):
+                print(f"[最新] {name}")
+                continue
+
+            print(f"[执行] {name}")
+            started = time.time()
+            try:
+                written = [Path(p) for p in stage.func() or []]
+            except Exception as e:
+                print(f"  错误: 阶段 {name} 失败 - {e}")
+                failed.add(name)
+                continue
+            outputs = list(dict.fromkeys(stage.outputs + written))
+            self.state[name] = {
+                "key": self.stage_key(stage),
+                "digest": hashlib.sha256("".join(_path_digest(p) for p in outputs).encode("ascii")).hexdigest(),
+                "written": [str(p) for p in written],
+                "seconds": round(time.time() - started, 3),
+                "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self.save_state()
+            executed += 1
+            print(f"  完成 ({self.state[name]['seconds']}s)")
+
+        print(f"\n流水线结束: 执行 {executed} 个阶段，失败 {len(failed)} 个")
+        return not failed
+
+    def status(self, targets: Iterable[str] = None) -> pd.DataFrame:
+        """各阶段状态：最新 / 需要重跑 / 取决于上游（上游需要重跑，重跑后输出可能不变）"""
+        rows = []
+        stale = set()
+        for name in self.closure(targets):
+            stage = self.stages[name]
+            record = self.state.get(name, {})
+            if any(dep in stale for dep in stage.deps):
+                status = "取决于上游"
+                stale.add(name)
+            elif self.is_fresh(stage, self.stage_key(stage)):
+                status = "最新"
+            else:
+                status = "需要重跑"
+                stale.add(name)
+            rows.append({"阶段": name, "状态": status, "上次耗时(秒)": record.get("seconds"),
+                         "上次完成": record.get("finished_at")})
+        return pd.DataFrame(rows)
+
+
+def build_pipeline(table_a: Path, table_b: Path, work_dir: Path, output_dir: Path,
+                   report_options: dict = None, only_pkg_containers: bool = False,
+                   backend: str = "pandas") -> Pipeline:
+    """
+    按输入构建 v3 的阶段 DAG；only_pkg_containers 同 v3 的 --only-pkg-containers，backend 同 v3 的 --backend
+    """
+    table_a = Path(table_a)
+    table_b = Path(table_b)
+    work_dir = Path(work_dir)
+    output_dir = Path(output_dir)
+    report_options = report_options or {}
+    pipeline = Pipeline(work_dir)
+
+    if table_a.is_dir():
+        scan_files = sorted(f for f in table_a.glob("*.xlsx")
+                            if not f.name.startswith("~$") and not f.name.startswith("_merged"))
+    else:
+        scan_files = [table_a]
+    pkg_files = list_pkg_files(table_b) if table_b.is_dir() else [table_b]
+    containers = sorted({container_name(f) for f in pkg_files}) if only_pkg_containers else None
+
+    scans_path = work_dir / "scans.pkl"
+    store_path = work_dir / "scan_store"
+
+    def ingest_scans():
+        df_scan = load_scan_data(table_a, containers, backend=backend)
+        if df_scan is None:
+            raise RuntimeError("无法加载扫描数据")
+        scans_path.parent.mkdir(parents=True, exist_ok=True)
+        df_scan.to_pickle(scans_path)
+
+    def build_index():
+        df_scan = pd.read_pickle(scans_path)
+        shutil.rmtree(store_path, ignore_errors=True)
+        publish_scan_store(df_scan, store_path, build_near_miss_index(df_scan))
+
+    pipeline.add("ingest_scans", ingest_scans, sources=scan_files, outputs=[scans_path],
+                 params={"containers": containers, "backend": backend})
+    pipeline.add("build_index", build_index, deps=["ingest_scans"], outputs=[store_path])
+
+    classify_stages = []
+    classify_paths = []
+    for pkg_file in pkg_files:
+        name = pkg_file.stem
+        pkg_path = work_dir / "pkg" / f"{name}.pkl"
+        match_path = work_dir / "match" / f"{name}.pkl"
+        classify_path = work_dir / "classify" / f"{name}.pkl"
+        report_file = output_dir / f"{name}_比较结果.xlsx"
+        report_outputs = []
+        if report_options.get("report_format", "xlsx") != "html":
+            report_outputs.append(report_file)
+        if report_options.get("report_format", "xlsx") != "xlsx":
+            report_outputs.append(html_report_dir(report_file))
+        backfill_file = output_dir / f"回填结果_{name}.xlsx"
+
+        def ingest_pkg(pkg_file=pkg_file, pkg_path=pkg_path):
+            pkg_path.parent.mkdir(parents=True, exist_ok=True)
+            preprocess_pkg_list(str(pkg_file), backend=backend).to_pickle(pkg_path)
+
+        def match(pkg_path=pkg_path, match_path=match_path):
+            scan_store = open_scan_store(store_path)
+            df_pkg = pd.read_pickle(pkg_path)
+            df_compare, df_unreport, scan_matched = compare_with_store(scan_store, df_pkg,
+                                                                       backend_match_workers(backend))
+            df_near_miss = suggest_near_misses(df_compare, scan_store, scan_store.get("near_miss_index"))
+            match_path.parent.mkdir(parents=True, exist_ok=True)
+            pd.to_pickle({"compare": df_compare, "unreport": df_unreport, "near_miss": df_near_miss,
+                          "scan_matched": scan_matched}, match_path)
+
+        def classify(match_path=match_path, classify_path=classify_path):
+            result = pd.read_pickle(match_path)
+            classify_results(result["compare"], result["unreport"])
+            classify_path.parent.mkdir(parents=True, exist_ok=True)
+            pd.to_pickle(result, classify_path)
+
+        def export(classify_path=classify_path, report_file=report_file):
+            result = pd.read_pickle(classify_path)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            return export_merged_with_colors(result["compare"], result["unreport"], str(report_file),
+                                             result["near_miss"], **report_options)
+
+        def backfill(pkg_file=pkg_file, classify_path=classify_path, backfill_file=backfill_file):
+            result = pd.read_pickle(classify_path)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            export_backfill_to_original(str(pkg_file), result["compare"], str(backfill_file))
+
+        pipeline.add(f"ingest_pkg:{name}", ingest_pkg, sources=[pkg_file], outputs=[pkg_path],
+                     params={"backend": backend})
+        pipeline.add(f"match:{name}", match, deps=["build_index", f"ingest_pkg:{name}"], outputs=[match_path])
+        pipeline.add(f"classify:{name}", classify, deps=[f"match:{name}"], outputs=[classify_path])
+        pipeline.add(f"export:{name}", export, deps=[f"classify:{name}"], outputs=report_outputs,
+                     params=report_options, assets=[HTML_VIEWER_DIR])
+        pipeline.add(f"backfill:{name}", backfill, deps=[f"classify:{name}"], sources=[pkg_file],
+                     outputs=[backfill_file])
+        classify_stages.append(f"classify:{name}")
+        classify_paths.append((name, classify_path))
+
+    if table_b.is_dir():
+        summary_file = output_dir / "批次汇总.xlsx"
+
+        def summary():
+            df_scan = pd.read_pickle(scans_path)
+            file_summaries = []
+            matched_scans = []
+            scan_matched = np.zeros(len(df_scan), dtype=bool)
+            for name, classify_path in classify_paths:
+                result = pd.read_pickle(classify_path)
+                file_summaries.append(summarize_compare_result(name, result["compare"]))
+                matched_scans.append(collect_matched_scans(name, result["compare"]))
+                scan_matched |= result["scan_matched"]
+            output_dir.mkdir(parents=True, exist_ok=True)
+            export_batch_summary(build_batch_summary(file_summaries, df_scan, scan_matched, matched_scans),
+                                 str(summary_file))
+
+        pipeline.add("summary", summary, deps=["ingest_scans"] + classify_stages, outputs=[summary_file])
+
+    return pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分阶段执行比对流程，只重跑输入变化的阶段')
+    parser.add_argument('command', choices=['run', 'status'], help='run=执行, status=查看各阶段状态')
+    parser.add_argument('table_a', nargs='?', default='./compare_tables_test/input_scan',
+                        help='表A文件路径或文件夹(扫描数据)')
+    parser.add_argument('table_b', nargs='?', default='./compare_tables_test/input_pkg',
+                        help='表B文件路径或文件夹(包裹清单)')
+    parser.add_argument('--output-dir', default=str(DEFAULT_OUTPUT_DIR), help='报告输出目录')
+    parser.add_argument('--work-dir', default=None, help='中间结果目录（默认 <输出目录>/.pipeline）')
+    parser.add_argument('--targets', default=None,
+                        help='只执行这些阶段及其上游，逗号分隔，可用阶段名或阶段类型（如 export,backfill）')
+    parser.add_argument('--force', default=None, help='强制重跑的阶段名或阶段类型，逗号分隔')
+    parser.add_argument('--only-pkg-containers', action='store_true', help='只比对操作分表对应柜号的扫描记录')
+    parser.add_argument('--fill-mode', choices=FILL_MODES, default='cells', help='报告着色方式')
+    parser.add_argument('--max-sheet-rows', type=int, default=EXCEL_MAX_DATA_ROWS, help='每个工作表最多写入的数据行数')
+    parser.add_argument('--split-mode', choices=SPLIT_MODES, default='sheets', help='超出行数时的分段方式')
+    parser.add_argument('--backend', choices=BACKENDS, default='pandas', help='扫描与包裹清单预处理及匹配的执行后端')
+    parser.add_argument('--report-format', choices=REPORT_FORMATS, default='xlsx', help='合并报告格式')
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    work_dir = Path(args.work_dir) if args.work_dir else output_dir / ".pipeline"
+    report_options = {"fill_mode": args.fill_mode, "max_rows": args.max_sheet_rows, "split_mode": args.split_mode,
+                      "report_format": args.report_format}
+    pipeline = build_pipeline(Path(args.table_a), Path(args.table_b), work_dir, output_dir, report_options,
+                              args.only_pkg_containers, args.backend)
+    targets = args.targets.split(",") if args.targets else None
+
+    if args.command == 'status':
+        print(pipeline.status(targets).to_string(index=False))
+    else:
+        pipeline.run(targets, args.force.split(",") if args.force else ())
+
+
+if __name__ == "__main__":
+    main()
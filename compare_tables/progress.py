@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+跑批进度与吞吐量统计：按阶段记录行数与耗时，定期输出进度行（含进度条、行/秒、预计剩余时间），
+并可把指标写成 JSON 或 Prometheus 文本格式（文件扩展名为 .prom 时）供监控抓取。
+正在进行的阶段按本阶段 advance() 报告的行数计算行/秒；预计剩余时间从 start_batch() 起计，不含加载扫描等准备时间。
+多进程处理时各进程的阶段统计由 stage_stats() / merge_stage_stats() 汇总到主进程。
+
+所有更新都按 refresh_interval 节流，热循环里调用 advance() 只是一次时间比较。
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def _format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def _bar(fraction: float, width: int = 20) -> str:
+    filled = int(round(max(0.0, min(1.0, fraction)) * width))
+    return "█" * filled + "░" * (width - filled)
+
+
+class BatchProgress:
+    """
+    批次进度：文件级进度 + 当前文件的阶段进度。
+    total_weight 为全部文件的权重（通常为文件字节数），用于按已完成权重估算剩余时间。
+    """
+
+    def __init__(self, total_files: int = 0, total_weight: float = 0.0, metrics_path=None,
+                 refresh_interval: float = 2.0, stream=None, enabled: bool = True):
+        self.total_files = total_files
+        self.total_weight = total_weight
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+        self.refresh_interval = refresh_interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.enabled = enabled
+
+        self.started_at = time.time()
+        self.batch_started_at: Optional[float] = None
+        self.files_done = 0
+        self.files_failed = 0
+        self.weight_done = 0.0
+        self.current_file = ""
+        self.current_weight = 0.0
+        self.current_stage = ""
+        self.stage_started_at = 0.0
+        self.stage_running = False
+        self.stage_rows_total = 0
+        self.stage_rows_done = 0
+        self.stage_rows: Dict[str, int] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self._last_refresh = 0.0
+
+    # ---- 更新接口 ----
+
+    def start_batch(self, total_files: int, total_weight: float = 0.0):
+        """准备工作（加载扫描等）完成、开始逐个处理文件：设置总量，预计剩余时间从此时起计"""
+        self.total_files = total_files
+        self.total_weight = total_weight
+        self.batch_started_at = time.time()
+
+    def start_file(self, name: str, weight: float = 0.0):
+        self.current_file = name
+        self.current_weight = weight
+        self.refresh(force=True)
+
+    def finish_file(self, ok: bool = True, name: str = None, weight: float = None):
+        self.files_done += 1
+        if not ok:
+            self.files_failed += 1
+        self.weight_done += self.current_weight if weight is None else weight
+        if name is not None:
+            self.current_file = name
+        self.current_stage = ""
+        self.refresh(force=True)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        """记录一个阶段：进入时开始计时，退出时累计行数与耗时（行/秒按阶段累计计算）"""
+        self.current_stage = name
+        self.stage_started_at = time.time()
+        self.stage_running = True
+        self.stage_rows_total = rows
+        self.stage_rows_done = 0
+        self.refresh()
+        try:
+            yield self
+        finally:
+            self.stage_running = False
+            elapsed = time.time() - self.stage_started_at
+            rows = self.stage_rows_total
+            self.stage_rows[name] = self.stage_rows.get(name, 0) + rows
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed
+            self.stage_rows_done = rows
+            self.refresh(force=True)
+
+    def set_rows(self, rows: int):
+        """阶段开始时行数未知（如读取文件）时，在阶段内补充本阶段处理的行数"""
+        self.stage_rows_total = rows
+
+    def advance(self, rows_done: int):
+        """阶段内进度（热循环中调用，已按时间节流）"""
+        self.stage_rows_done = rows_done
+        if time.time() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def stage_stats(self) -> dict:
+        """各阶段累计的行数与耗时（供子进程返回给主进程）"""
+        return {"rows": dict(self.stage_rows), "seconds": dict(self.stage_seconds)}
+
+    def merge_stage_stats(self, stats: dict):
+        """累加其他进程的阶段统计（见 stage_stats）"""
+        for name, rows in stats["rows"].items():
+            self.stage_rows[name] = self.stage_rows.get(name, 0) + rows
+        for name, seconds in stats["seconds"].items():
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    # ---- 统计 ----
+
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    def batch_elapsed(self) -> float:
+        """处理文件已用的时间（未调用 start_batch 时同 elapsed）"""
+        return time.time() - (self.started_at if self.batch_started_at is None else self.batch_started_at)
+
+    def eta(self) -> Optional[float]:
+        if self.total_files and self.files_done >= self.total_files:
+            return 0.0
+        if self.total_weight > 0 and self.weight_done > 0:
+            return self.batch_elapsed() / self.weight_done * max(0.0, self.total_weight - self.weight_done)
+        if self.files_done:
+            return self.batch_elapsed() / self.files_done * max(0, self.total_files - self.files_done)
+        return None
+
+    def current_rate(self) -> Optional[float]:
+        """正在进行的阶段的行/秒：按本阶段已报告的行数与已用时间计算，尚无进度时为 None"""
+        elapsed = time.time() - self.stage_started_at
+        if not self.stage_running or self.stage_rows_done <= 0 or elapsed <= 0:
+            return None
+        return self.stage_rows_done / elapsed
+
+    def rates(self) -> Dict[str, float]:
+        return {stage: self.stage_rows[stage] / seconds if seconds > 0 else 0.0
+                for stage, seconds in self.stage_seconds.items()}
+
+    def snapshot(self) -> dict:
+        return {
+            "files_total": self.total_files,
+            "files_done": self.files_done,
+            "files_failed": self.files_failed,
+            "current_file": self.current_file,
+            "current_stage": self.current_stage,
+            "stage_rows_done": self.stage_rows_done,
+            "stage_rows_total": self.stage_rows_total,
+            "stage_rows_per_second_current": None if self.current_rate() is None else round(self.current_rate(), 1),
+            "elapsed_seconds": round(self.elapsed(), 3),
+            "eta_seconds": None if self.eta() is None else round(self.eta(), 3),
+            "stage_rows": dict(self.stage_rows),
+            "stage_seconds": {k: round(v, 3) for k, v in self.stage_seconds.items()},
+            "stage_rows_per_second": {k: round(v, 1) for k, v in self.rates().items()},
+            "updated_at": time.time(),
+        }
+
+    # ---- 输出 ----
+
+    def refresh(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+        if self.enabled:
+            self.stream.write(self.render() + "\n")
+            self.stream.flush()
+        if self.metrics_path is not None:
+            self.write_metrics()
+
+    def render(self) -> str:
+        fraction = self.files_done / self.total_files if self.total_files else 0.0
+        line = f"⏱ [{_bar(fraction)}] {self.files_done}/{self.total_files} 文件"
+        if self.current_stage:
+            stage_line = f" | {self.current_file} {self.current_stage}"
+            if self.stage_rows_total:
+                stage_line += f" {self.stage_rows_done}/{self.stage_rows_total} 行"
+            rate = self.current_rate() if self.stage_running else self.rates().get(self.current_stage)
+            if rate:
+                stage_line += f" ({rate:,.0f} 行/秒)"
+            line += stage_line
+        return line + f" | 已用 {_format_duration(self.elapsed())} 预计剩余 {_format_duration(self.eta())}"
+
+    def write_metrics(self):
+        snapshot = self.snapshot()
+        if self.metrics_path.suffix == ".prom":
+            content = self._prometheus_text(snapshot)
+        else:
+            content = json.dumps(snapshot, ensure_ascii=False, indent=2)
+        self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.metrics_path.with_suffix(self.metrics_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, self.metrics_path)
+
+    @staticmethod
+    def _prometheus_text(snapshot: dict) -> str:
+        lines = [
+            "# TYPE compare_files_total gauge",
+            f"compare_files_total {snapshot['files_total']}",
+            "# TYPE compare_files_done gauge",
+            f"compare_files_done {snapshot['files_done']}",
+            "# TYPE compare_files_failed gauge",
+            f"compare_files_failed {snapshot['files_failed']}",
+            "# TYPE compare_elapsed_seconds gauge",
+            f"compare_elapsed_seconds {snapshot['elapsed_seconds']}",
+        ]
+        if snapshot["eta_seconds"] is not None:
+            lines += ["# TYPE compare_eta_seconds gauge", f"compare_eta_seconds {snapshot['eta_seconds']}"]
+        lines.append("# TYPE compare_stage_rows_total counter")
+        lines += [f'compare_stage_rows_total{{stage="{k}"}} {v}' for k, v in snapshot["stage_rows"].items()]
+        lines.append("# TYPE compare_stage_seconds_total counter")
+        lines += [f'compare_stage_seconds_total{{stage="{k}"}} {v}' for k, v in snapshot["stage_seconds"].items()]
+        lines.append("# TYPE compare_stage_rows_per_second gauge")
+        lines += [f'compare_stage_rows_per_second{{stage="{k}"}} {v}'
+                  for k, v in snapshot["stage_rows_per_second"].items()]
+        lines += ["# TYPE compare_last_update_timestamp_seconds gauge",
+                  f"compare_last_update_timestamp_seconds {snapshot['updated_at']:.3f}"]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+扫描数据共享存储：把解码后的扫描数据、条码索引和近似条码索引按列写成 .npy 数组，
+各工作进程以只读 mmap 方式打开，同一台机器上的多个进程共用一份页缓存，无需逐进程复制整份扫描数据。
+
+目录结构：
+    meta.json                  列名/列类型/行数/索引长度
+    col_<k>.npy                数值与日期列原样保存（带时区的日期列保存为 UTC 时间）；
+                               文本或混合类型列保存为字典编号（int32，空为 -1）
+    col_<k>.dict_types.npy     字典中每个值的类型（文本/整数/浮点/其他）
+    col_<k>.dict_data.npy      字典值依次拼接的字节（文本为 UTF-8，整数/浮点为十进制文本，其他类型为 pickle）
+    col_<k>.dict_offsets.npy   各字典值在 dict_data 中的起止位置
+    index.npy                  原 DataFrame 的行索引（整数索引时）
+    codes_<L>.npy              长度为 L 的 fba条码（已排序去重）
+    offsets_<L>.npy            codes_<L> 中每个条码对应的扫描行位置区间（CSR）
+    positions_<L>.npy          扫描行位置
+    nm_*.npy                   近似条码 n-gram 倒排表及未入索引的公共片段
+"""
+
+import json
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+STORE_META = "meta.json"
+
+TYPE_STR = 1
+TYPE_INT = 2
+TYPE_FLOAT = 3
+TYPE_OTHER = 4
+
+
+def _fixed_width(texts: List[str]) -> np.ndarray:
+    width = max([len(t) for t in texts] + [1])
+    return np.array(texts, dtype=f"U{width}")
+
+
+def _is_null(value) -> bool:
+    return value is None or (pd.api.types.is_scalar(value) and not isinstance(value, (bool, np.bool_))
+                             and pd.isna(value))
+
+
+def _encode_value(value) -> Tuple[int, bytes]:
+    if isinstance(value, str):
+        return TYPE_STR, value.encode("utf-8")
+    if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+        return TYPE_INT, str(int(value)).encode("ascii")
+    if isinstance(value, (float, np.floating)):
+        return TYPE_FLOAT, repr(float(value)).encode("ascii")
+    # 日期、布尔等其他对象原样还原
+    return TYPE_OTHER, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _encode_object_column(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    将对象列字典编码，返回 (每行的字典编号, 字典值类型, 字典值字节, 字典值起止位置)。
+    重复值只保存一次，单个很长的值不会增加其他行的占用；文本、整数、浮点数与其他对象均可无损还原。
+    """
+    codes = np.full(len(values), -1, dtype=np.int32)
+    entries = {}
+    for k, value in enumerate(values):
+        if _is_null(value):
+            continue
+        entry = _encode_value(value)
+        code = entries.get(entry)
+        if code is None:
+            code = entries[entry] = len(entries)
+        codes[k] = code
+    types = np.array([entry_type for entry_type, _ in entries], dtype=np.int8)
+    offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(raw) for _, raw in entries], dtype=np.int64)
+    data = np.frombuffer(b"".join(raw for _, raw in entries), dtype=np.uint8)
+    return codes, types, data, offsets
+
+
+def _decode_entry(dictionary: Tuple[np.ndarray, np.ndarray, np.ndarray], code: int):
+    types, data, offsets = dictionary
+    raw = bytes(data[offsets[code]:offsets[code + 1]])
+    entry_type = types[code]
+    if entry_type == TYPE_STR:
+        return raw.decode("utf-8")
+    if entry_type == TYPE_INT:
+        return int(raw)
+    if entry_type == TYPE_FLOAT:
+        return float(raw)
+    return pickle.loads(raw)
+
+
+def _decode_object_column(codes: np.ndarray, dictionary: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+    """按字典还原对象列（每个不同的值只解码一次），空为 NaN"""
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    values = np.full(len(unique_codes), np.nan, dtype=object)
+    for j, code in enumerate(unique_codes):
+        if code >= 0:
+            values[j] = _decode_entry(dictionary, int(code))
+    return values[inverse.reshape(-1)]
+
+
+def build_code_index(df_scan: pd.DataFrame) -> Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    fba条码 按长度分组的有序索引：{长度 L: (长度为 L 的条码（排序去重）, 每个条码的扫描行区间（CSR）, 扫描行位置)}
+    """
+    index = {}
+    if "fba条码" not in df_scan.columns:
+        return index
+    fba = df_scan["fba条码"]
+    valid = fba.notna().to_numpy()
+    codes = pd.Series([str(v).strip() for v in fba.to_numpy(dtype=object)[valid]], dtype=object)
+    entries = pd.DataFrame({"code": codes, "pos": np.flatnonzero(valid)})
+    entries = entries[codes.str.len().to_numpy() > 0]
+    for length, group in entries.groupby(entries["code"].str.len()):
+        group = group.sort_values(["code", "pos"], kind="stable")
+        sorted_codes = group["code"].to_numpy(dtype=f"U{length}")
+        unique_codes, starts = np.unique(sorted_codes, return_index=True)
+        index[int(length)] = (unique_codes, np.append(starts, len(group)).astype(np.int64),
+                              group["pos"].to_numpy(dtype=np.int64))
+    return index
+
+
+def publish_scan_store(df_scan: pd.DataFrame, path, near_miss_index: dict = None) -> Path:
+    """
+    将扫描数据及其条码索引写入共享存储目录，返回目录路径
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    columns = []
+    for k, col in enumerate(df_scan.columns):
+        series = df_scan[col]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biufmM":
+            np.save(path / f"col_{k}.npy", series.to_numpy())
+            columns.append({"name": str(col), "kind": "numeric"})
+        elif isinstance(series.dtype, pd.DatetimeTZDtype):
+            np.save(path / f"col_{k}.npy", series.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy())
+            columns.append({"name": str(col), "kind": "datetime_tz", "tz": str(series.dtype.tz)})
+        else:
+            codes, types, data, offsets = _encode_object_column(series.to_numpy(dtype=object))
+            np.save(path / f"col_{k}.npy", codes)
+            np.save(path / f"col_{k}.dict_types.npy", types)
+            np.save(path / f"col_{k}.dict_data.npy", data)
+            np.save(path / f"col_{k}.dict_offsets.npy", offsets)
+            columns.append({"name": str(col), "kind": "object"})
+
+    has_index = pd.api.types.is_integer_dtype(df_scan.index.dtype)
+    if has_index:
+        np.save(path / "index.npy", df_scan.index.to_numpy(dtype=np.int64))
+
+    lengths = []
+    for length, (codes, offsets, positions) in build_code_index(df_scan).items():
+        np.save(path / f"codes_{length}.npy", codes)
+        np.save(path / f"offsets_{length}.npy", offsets)
+        np.save(path / f"positions_{length}.npy", positions)
+        lengths.append(length)
+
+    if near_miss_index is not None:
+        grams = sorted(near_miss_index["postings"])
+        ids = [near_miss_index["postings"][g] for g in grams]
+        np.save(path / "nm_codes.npy", _fixed_width(list(near_miss_index["codes"])))
+        np.save(path / "nm_first_row.npy", np.asarray(near_miss_index["first_row"], dtype=np.int64))
+        np.save(path / "nm_grams.npy", _fixed_width(grams))
+        np.save(path / "nm_gram_offsets.npy", np.cumsum([0] + [len(i) for i in ids]).astype(np.int64))
+        np.save(path / "nm_gram_ids.npy", np.asarray([i for group in ids for i in group], dtype=np.int64))
+        np.save(path / "nm_stop_grams.npy", _fixed_width(sorted(near_miss_index.get("stop_grams", ()))))
+
+    meta = {
+        "n_rows": len(df_scan),
+        "columns": columns,
+        "has_index": has_index,
+        "index_lengths": lengths,
+        "near_miss_n": near_miss_index["n"] if near_miss_index is not None else None,
+    }
+    with open(path / STORE_META, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return path
+
+
+class MappedPostings:
+    """只读 n-gram 倒排表，接口与 dict.get 相同"""
+
+    def __init__(self, grams: np.ndarray, offsets: np.ndarray, ids: np.ndarray):
+        self.grams = grams
+        self.offsets = offsets
+        self.ids = ids
+
+    def get(self, gram: str, default=None):
+        k = int(np.searchsorted(self.grams, gram))
+        if k < len(self.grams) and self.grams[k] == gram:
+            return self.ids[self.offsets[k]:self.offsets[k + 1]]
+        return default
+
+
+def open_scan_store(path) -> dict:
+    """
+    以只读 mmap 方式打开共享存储
+    """
+    path = Path(path)
+    with open(path / STORE_META, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    def load(name: str) -> np.ndarray:
+        return np.load(path / name, mmap_mode="r")
+
+    store = {"path": path, "meta": meta, "n_rows": meta["n_rows"], "columns": [], "index": {}}
+    for k, col in enumerate(meta["columns"]):
+        dictionary = None
+        if col["kind"] == "object":
+            dictionary = (load(f"col_{k}.dict_types.npy"), load(f"col_{k}.dict_data.npy"),
+                          load(f"col_{k}.dict_offsets.npy"))
+        store["columns"].append({
+            "name": col["name"],
+            "values": load(f"col_{k}.npy"),
+            "dictionary": dictionary,
+            "tz": col.get("tz"),
+        })
+    store["row_index"] = load("index.npy") if meta["has_index"] else None
+    for length in meta["index_lengths"]:
+        store["index"][length] = (load(f"codes_{length}.npy"), load(f"offsets_{length}.npy"),
+                                  load(f"positions_{length}.npy"))
+    if meta["near_miss_n"] is not None:
+        store["near_miss_index"] = {
+            "n": meta["near_miss_n"],
+            "codes": load("nm_codes.npy"),
+            "first_row": load("nm_first_row.npy"),
+            "postings": MappedPostings(load("nm_grams.npy"), load("nm_gram_offsets.npy"), load("nm_gram_ids.npy")),
+            "stop_grams": set(load("nm_stop_grams.npy").tolist()),
+        }
+    return store
+
+
+def gather_scan_rows(store: dict, positions) -> pd.DataFrame:
+    """
+    按位置取出扫描行（仅复制被取出的行），列顺序、数值类型与原 DataFrame 一致
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    data = {}
+    for col in store["columns"]:
+        values = np.asarray(col["values"][positions])
+        if col["dictionary"] is not None:
+            data[col["name"]] = _decode_object_column(values, col["dictionary"])
+        elif col["tz"] is not None:
+            data[col["name"]] = pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(col["tz"]).array
+        else:
+            data[col["name"]] = values
+    index = np.asarray(store["row_index"][positions]) if store["row_index"] is not None else positions
+    return pd.DataFrame(data, index=index)
+
+
+def column_text(store: dict, name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """返回某列的 (每行的文本, 是否为空)，用于按列比较；对象列只把每个字典值转换一次"""
+    for col in store["columns"]:
+        if col["name"] == name:
+            if col["dictionary"] is None:
+                values = np.asarray(col["values"])
+                return values.astype(str), pd.isna(values)
+            codes = np.asarray(col["values"])
+            types, data, offsets = col["dictionary"]
+            texts = [bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8") if types[i] != TYPE_OTHER
+                     else str(_decode_entry(col["dictionary"], i)) for i in range(len(types))]
+            # 编号 -1（空）取末尾的空文本
+            return np.array(texts + [""], dtype=object)[codes], codes < 0
+    raise KeyError(name)
+
+
+def column_keys(store: dict, name: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    返回某列的 (每行的值编号, 是否为空)：值相等的行编号相同，与 pandas 的 isin / unique 一致
+    （整数 1 与浮点数 1.0 相同，与文本 "1" 不同），用于按值筛选；对象列只解码每个字典值一次
+    """
+    for col in store["columns"]:
+        if col["name"] == name:
+            values = np.asarray(col["values"])
+            if col["dictionary"] is None:
+                return pd.factorize(values)[0].astype(np.int64), pd.isna(values)
+            entry_keys = {}
+            remap = [entry_keys.setdefault(_decode_entry(col["dictionary"], i), len(entry_keys))
+                     for i in range(len(col["dictionary"][0]))]
+            # 编号 -1（空）取末尾的 -1
+            return np.array(remap + [-1], dtype=np.int64)[values], values < 0
+    raise KeyError(name)
+
+
+def _keys_by_length(keys: List[str]) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """按长度分组的包裹键：{键长 G: (键位置, (n, G) 的 UCS-4 码点矩阵)}，用于按列切出所有子串"""
+    lengths = np.fromiter((len(key) for key in keys), dtype=np.int64, count=len(keys))
+    key_array = np.array(keys, dtype=object)
+    groups = {}
+    for length in np.unique(lengths):
+        if length == 0:
+            continue
+        owners = np.flatnonzero(lengths == length)
+        matrix = np.array(key_array[owners].tolist(), dtype=f"U{length}").view(np.uint32).reshape(len(owners), length)
+        groups[int(length)] = (owners, matrix)
+    return groups
+
+
+def _match_code_length(codes: np.ndarray, offsets: np.ndarray, positions: np.ndarray, length: int,
+                       key_groups: Dict[int, Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """长度为 length 的条码与所有包裹键子串的匹配对（未去重）"""
+    subs = []
+    owners = []
+    for key_length, (key_owners, matrix) in key_groups.items():
+        for k in range(key_length - length + 1):
+            subs.append(np.ascontiguousarray(matrix[:, k:k + length]).view(f"U{length}").ravel())
+            owners.append(key_owners)
+    if not subs or len(codes) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    subs = np.concatenate(subs)
+    owners = np.concatenate(owners)
+    slot = np.minimum(np.searchsorted(codes, subs), len(codes) - 1)
+    found = codes[slot] == subs
+    slot = slot[found]
+    owners = owners[found]
+    starts = offsets[slot]
+    counts = offsets[slot + 1] - starts
+    total = int(counts.sum())
+    run_starts = np.repeat(np.cumsum(counts) - counts, counts)
+    take = np.arange(total, dtype=np.int64) - run_starts + np.repeat(starts, counts)
+    return np.repeat(owners, counts), np.asarray(positions[take])
+
+
+def index_match_pairs(index: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]], keys: List[str],
+                      min_length: int = 11, workers: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在条码索引（build_code_index 的结构）中查找 (包裹键位置, 扫描行位置) 匹配对：扫描条码为包裹键的子串。
+    每个条码长度的所有子串一次性按列切出并二分查找；workers > 1 时各长度在线程池中并行。
+    结果去重并按包裹位置、扫描位置排序。
+    """
+    key_groups = _keys_by_length(keys)
+    lengths = [length for length in index if length >= min_length]
+    if workers > 1 and len(lengths) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda length: _match_code_length(*index[length], length, key_groups), lengths))
+    else:
+        parts = [_match_code_length(*index[length], length, key_groups) for length in lengths]
+    parts = [part for part in parts if len(part[0])]
+
+    if not parts:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    pairs = np.unique(np.stack([np.concatenate([p[0] for p in parts]),
+                                np.concatenate([p[1] for p in parts])], axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def store_match_pairs(store: dict, keys: List[str], min_length: int = 11,
+                      workers: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    在共享索引中查找 (包裹键位置, 扫描行位置) 匹配对：扫描条码为包裹键的子串。
+    结果去重并按包裹位置、扫描位置排序；workers 见 index_match_pairs。
+    """
+    return index_match_pairs(store["index"], keys, min_length, workers)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+跨批次扫描记录：持久保存历次运行见过的 fba条码，用于发现 "昨天扫过、今天又扫一次" 的历史重复扫描。
+
+    Bloom 过滤器      bloom.npy        位数组，批量判断 "一定没见过"，绝大多数新条码在这里直接排除
+    精确记录（有序）  hashes.npy       条码 64 位哈希（升序）
+                      codes.npy        条码原文，与 hashes 对齐，用于排除哈希碰撞
+                      first_run.npy    首次出现的运行批次（meta.json 中 runs 的下标）
+    首次批次的扫描    first_events.npy 条码在首次出现的运行批次中的扫描事件（条码哈希与原始扫描行签名的组合键，升序去重）
+    meta.json         Bloom 参数、条码数量、运行批次列表
+
+条码在首次出现的批次中的扫描事件永远不算历史重复，其他扫描事件（之后批次的新扫描）都算；
+判断只依赖首次批次，同一批扫描无论重跑多少次，标记结果都相同。
+所有检查均为向量化批量操作，每条扫描的开销为微秒级。
+"""
+
+import json
+import math
+import os
+import shutil
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+SEEN_META = "meta.json"
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+MIN_BLOOM_CAPACITY = 1 << 20
+
+
+def hash_texts(texts: pd.Series) -> np.ndarray:
+    """文本的稳定 64 位哈希（跨进程、跨运行一致）"""
+    return pd.util.hash_pandas_object(texts.astype(str), index=False).to_numpy(dtype=np.uint64)
+
+
+def _event_keys(codes: pd.Series, events: np.ndarray) -> np.ndarray:
+    """条码与扫描事件签名的组合键"""
+    frame = pd.DataFrame({"code": hash_texts(codes), "event": events})
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy(dtype=np.uint64)
+
+
+def _bloom_shape(capacity: int, false_positive_rate: float) -> Tuple[int, int]:
+    n_bits = int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+    n_bits = (n_bits + 7) // 8 * 8
+    n_hashes = max(1, int(round(n_bits / capacity * math.log(2))))
+    return n_bits, n_hashes
+
+
+class SeenStore:
+    """持久的已见条码集合（Bloom 过滤器 + 精确记录）"""
+
+    def __init__(self, path, false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE):
+        self.path = Path(path)
+        self.false_positive_rate = false_positive_rate
+        old_dir = self._sibling(".old")
+        if not (self.path / SEEN_META).exists() and (old_dir / SEEN_META).exists():
+            # 上次保存在替换目录的间隙中断，使用保留的旧记录
+            os.replace(old_dir, self.path)
+        meta_path = self.path / SEEN_META
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self.runs: List[str] = meta["runs"]
+            self.capacity = meta["capacity"]
+            self.n_bits = meta["n_bits"]
+            self.n_hashes = meta["n_hashes"]
+            self.bloom = np.load(self.path / "bloom.npy")
+            self.hashes = np.load(self.path / "hashes.npy")
+            self.codes = np.load(self.path / "codes.npy")
+            self.first_events = np.load(self.path / "first_events.npy")
+            self.first_run = np.load(self.path / "first_run.npy")
+        else:
+            self.runs = []
+            self.capacity = MIN_BLOOM_CAPACITY
+            self.n_bits, self.n_hashes = _bloom_shape(self.capacity, false_positive_rate)
+            self.bloom = np.zeros(self.n_bits // 8, dtype=np.uint8)
+            self.hashes = np.array([], dtype=np.uint64)
+            self.codes = np.array([], dtype="U1")
+            self.first_events = np.array([], dtype=np.uint64)
+            self.first_run = np.array([], dtype=np.int32)
+
+    def _sibling(self, suffix: str) -> Path:
+        return self.path.with_name(self.path.name + suffix)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    # ---- Bloom ----
+
+    def _bit_positions(self, hashes: np.ndarray) -> np.ndarray:
+        """双重哈希：第 i 个位置 = (h1 + i*h2) mod m，返回 (n, k) 位置矩阵"""
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.n_bits)
+
+    def _bloom_add(self, hashes: np.ndarray):
+        positions = self._bit_positions(hashes).ravel()
+        np.bitwise_or.at(self.bloom, (positions >> np.uint64(3)).astype(np.int64),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+
+    def _bloom_contains(self, hashes: np.ndarray) -> np.ndarray:
+        positions = self._bit_positions(hashes)
+        bits = self.bloom[(positions >> np.uint64(3)).astype(np.int64)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (bits & 1).all(axis=1)
+
+    # ---- 查询与更新 ----
+
+    def lookup(self, codes: pd.Series) -> np.ndarray:
+        """
+        批量查询条码，返回精确记录中的位置（未见过为 -1）。先经 Bloom 过滤，只有可能见过的条码才做二分查找与原文核对。
+        """
+        codes = codes.astype(str)
+        found = np.full(len(codes), -1, dtype=np.int64)
+        if len(codes) == 0 or len(self.hashes) == 0:
+            return found
+        hashes = hash_texts(codes)
+        maybe = np.flatnonzero(self._bloom_contains(hashes))
+        if len(maybe) == 0:
+            return found
+        slots = np.minimum(np.searchsorted(self.hashes, hashes[maybe]), len(self.hashes) - 1)
+        exact = (self.hashes[slots] == hashes[maybe]) & (self.codes[slots] == codes.to_numpy(dtype=str)[maybe])
+        found[maybe[exact]] = slots[exact]
+        return found
+
+    def check(self, codes: pd.Series, events: np.ndarray, run_label: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        判断扫描是否为历史重复：条码已有记录，且本条扫描事件不是该条码首次出现批次中的扫描。
+        run_label 为本次运行的批次名：条码首次出现于同名批次（中断后续跑）时不算历史重复。
+        返回 (是否历史重复, 首次出现的运行批次名)
+        """
+        found = self.lookup(codes)
+        duplicate = found >= 0
+        if duplicate.any() and run_label in self.runs:
+            duplicate[duplicate] = self.first_run[found[duplicate]] != self.runs.index(run_label)
+        if duplicate.any() and len(self.first_events):
+            keys = _event_keys(codes.astype(str)[duplicate], np.asarray(events, dtype=np.uint64)[duplicate])
+            slots = np.minimum(np.searchsorted(self.first_events, keys), len(self.first_events) - 1)
+            duplicate[duplicate] = self.first_events[slots] != keys
+        labels = np.full(len(found), '', dtype=object)
+        if duplicate.any():
+            runs = np.array(self.runs, dtype=object)
+            labels[duplicate] = runs[self.first_run[found[duplicate]]]
+        return duplicate, labels
+
+    def add(self, codes: pd.Series, events: np.ndarray, run_label: str) -> int:
+        """
+        记录本次运行的条码（已有条码保留首次出现的批次），以及首次出现于本批次的条码的扫描事件，返回新增条码数
+        """
+        codes = codes.astype(str).reset_index(drop=True)
+        events = np.asarray(events, dtype=np.uint64)
+        if run_label not in self.runs:
+            self.runs.append(run_label)
+        run_id = self.runs.index(run_label)
+
+        found = self.lookup(codes)
+        new = found < 0
+        # 同一批次分多次运行（中断后续跑）时，已记录条码的首次批次仍是本批次，其扫描事件同样记入
+        first_here = new.copy()
+        first_here[~new] = self.first_run[found[~new]] == run_id
+        if first_here.any():
+            self.first_events = np.union1d(self.first_events, _event_keys(codes[first_here], events[first_here]))
+        if not new.any():
+            return 0
+        frame = pd.DataFrame({"code": codes.to_numpy(dtype=object)[new]}).drop_duplicates("code")
+        new_hashes = hash_texts(frame["code"])
+
+        hashes = np.concatenate([self.hashes, new_hashes])
+        order = np.argsort(hashes, kind="stable")
+        width = max(self.codes.dtype.itemsize // 4, int(frame["code"].str.len().max()), 1)
+        self.hashes = hashes[order]
+        self.codes = np.concatenate([self.codes.astype(f"U{width}"), frame["code"].to_numpy(dtype=f"U{width}")])[order]
+        self.first_run = np.concatenate([self.first_run, np.full(len(frame), run_id, dtype=np.int32)])[order]
+
+        if len(self.hashes) > self.capacity:
+            # 容量不足时按两倍容量重建 Bloom，保持误判率
+            while self.capacity < len(self.hashes):
+                self.capacity *= 2
+            self.n_bits, self.n_hashes = _bloom_shape(self.capacity, self.false_positive_rate)
+            self.bloom = np.zeros(self.n_bits // 8, dtype=np.uint8)
+            self._bloom_add(self.hashes)
+        else:
+            self._bloom_add(new_hashes)
+        return len(frame)
+
+    def save(self):
+        """写入临时目录后整体替换，中途失败不会留下不一致的记录"""
+        tmp_dir = self._sibling(".tmp")
+        old_dir = self._sibling(".old")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        arrays = {"bloom.npy": self.bloom, "hashes.npy": self.hashes, "codes.npy": self.codes,
+                  "first_events.npy": self.first_events, "first_run.npy": self.first_run}
+        for name, array in arrays.items():
+            np.save(tmp_dir / name, array)
+        meta = {"runs": self.runs, "capacity": self.capacity, "n_bits": self.n_bits,
+                "n_hashes": self.n_hashes, "n_codes": len(self.hashes)}
+        with open(tmp_dir / SEEN_META, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if self.path.exists():
+            os.replace(self.path, old_dir)
+        os.replace(tmp_dir, self.path)
+        shutil.rmtree(old_dir, ignore_errors=True)
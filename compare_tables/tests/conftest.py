@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 各脚本以同目录导入（from scan_store import ...），测试时同样把脚本目录加入 sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compare_table_v3 import (
+    RESULT_STATUS_COLUMN,
+    STATUS_COLUMNS,
+    build_batch_summary,
+    load_scan_data,
+    process_full_workflow,
+)
+from golden_check import generate_inputs
+
+
+@pytest.fixture(scope="module")
+def batch(tmp_path_factory):
+    target = tmp_path_factory.mktemp("summary")
+    scan_dir, pkg_dir = generate_inputs(target, seed=11, containers=("CA", "CB"), rows_per_channel=25,
+                                        extra_scans=10)
+    df_scan = load_scan_data(scan_dir)
+    results = [process_full_workflow(str(f), df_scan, output_dir=target / "out")
+               for f in sorted(pkg_dir.glob("*.xlsx"))]
+    return df_scan, results
+
+
+def test_counts_match_compare_results(batch):
+    df_scan, results = batch
+    scan_matched = np.logical_or.reduce([r["scan_matched"] for r in results])
+    summary = build_batch_summary([r["summary"] for r in results], df_scan, scan_matched,
+                                  [r["matched_scans"] for r in results])
+
+    by_file = summary["by_file"].set_index("文件")
+    for result in results:
+        statuses = result["compare"][RESULT_STATUS_COLUMN].value_counts()
+        row = by_file.loc[result["name"]]
+        assert row["总行数"] == len(result["compare"])
+        for status, column in STATUS_COLUMNS.items():
+            assert row[column] == statuses.get(status, 0)
+        # 按箱号渠道汇总的各行加起来等于按文件汇总
+        by_box = summary["by_box"][summary["by_box"]["文件"] == result["name"]]
+        assert by_box[list(by_file.columns)].sum().tolist() == row.tolist()
+        channels = result["compare"].groupby(["箱号", "渠道号"]).size()
+        assert by_box.set_index(["箱号", "渠道号"])["总行数"].sort_index().tolist() == channels.sort_index().tolist()
+
+    assert len(summary["unmatched_scans"]) == int((~scan_matched).sum())
+    pd.testing.assert_frame_equal(summary["unmatched_scans"], df_scan[~scan_matched])
+
+
+def test_global_duplicates_are_scans_matched_more_than_once(batch):
+    df_scan, results = batch
+    summary = build_batch_summary([r["summary"] for r in results], df_scan, None,
+                                  [r["matched_scans"] for r in results])
+    all_matched = pd.concat([r["matched_scans"] for r in results], ignore_index=True)
+    counts = all_matched["原始扫描序号"].astype(str).str.strip().value_counts()
+    duplicates = summary["global_duplicates"]["原始扫描序号"].astype(str).str.strip()
+    assert not duplicates.empty
+    assert set(duplicates) == set(counts[counts > 1].index)
+    assert len(duplicates) == int(counts[counts > 1].sum())
+    # 同一扫描的各行排在一起
+    assert (duplicates != duplicates.shift()).sum() == duplicates.nunique()
+    # 未传入 scan_matched 时全部扫描视为未匹配
+    assert len(summary["unmatched_scans"]) == len(df_scan)
@@ -0,0 +1,44 @@
+import pandas as pd
+from openpyxl import Workbook
+
+from compare_table_v3 import preprocess_pkg_list
+
+
+def _pkg_workbook(path):
+    """两个卡派分组含同一预报单号（各自按出现次数替换），一个普通分组含空行和数字单号"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "包裹清单"
+    groups = {
+        "卡派-FR02": ["K1", "K1", "K1", "K2", None, "K9"],
+        "CWE-DE01": ["A1", None, 123, "A2"],
+        "卡派-FR03": ["K1", "K2", "K2"],
+    }
+    for gi, (channel, codes) in enumerate(groups.items()):
+        base = gi * 6 + 1
+        ws.cell(row=1, column=base, value=channel)
+        for k, header in enumerate(["预报单号", "托盘序号", "出库Ref", "实际扫描", "破损/不可识别"]):
+            ws.cell(row=2, column=base + k, value=header)
+        for i, code in enumerate(codes):
+            if code is not None:
+                ws.cell(row=3 + i, column=base, value=code)
+                ws.cell(row=3 + i, column=base + 2, value=f"REF{gi}{i}")
+    ws.cell(row=3 + 4, column=1 + 1, value="P1")  # 卡派分组中预报单号为空但有托盘序号的行
+
+    ws2 = wb.create_sheet("包裹列表")
+    ws2.cell(row=1, column=1, value="Platform Order Ref.1\n平台单号1")
+    ws2.cell(row=1, column=2, value="Track Nr.\n跟踪号")
+    for row, (key, track) in enumerate([("K1", "T1a"), ("K1", "T1b"), ("K2", "T2a")], start=2):
+        ws2.cell(row=row, column=1, value=key)
+        ws2.cell(row=row, column=2, value=track)
+    wb.save(path)
+
+
+def test_columnar_pkg_list_matches_pandas(tmp_path):
+    path = tmp_path / "CA操作分表.xlsx"
+    _pkg_workbook(path)
+    expected = preprocess_pkg_list(str(path))
+    columnar = preprocess_pkg_list(str(path), backend="columnar")
+    pd.testing.assert_frame_equal(columnar, expected)
+    assert columnar["预报单号"].fillna("").tolist()[:6] == ["T1a", "T1b", "T1b", "T2a", "", "K9"]
+    assert columnar["预报单号"].tolist()[-3:] == ["T1a", "T2a", "T2a"]
@@ -0,0 +1,76 @@
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+from compare_api import ScanIndex, captured_output
+from compare_table_v3 import (
+    BACKFILL_STATUS_COLUMN,
+    RESULT_STATUS_COLUMN,
+    load_scan_data,
+    process_full_workflow,
+)
+from golden_check import generate_inputs
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return generate_inputs(tmp_path_factory.mktemp("api"), seed=3, rows_per_channel=30, extra_scans=10)
+
+
+def test_compare_matches_cli(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    pkg_file = pkg_dir / "CB操作分表.xlsx"
+    cli = process_full_workflow(str(pkg_file), load_scan_data(scan_dir), output_dir=tmp_path)
+
+    index = ScanIndex.from_workbooks(sorted(scan_dir.glob("*.xlsx")))
+    result = index.compare(pkg_file.read_bytes(), name=pkg_file.name)
+
+    assert result["name"] == cli["name"]
+    assert set(result["compare"]["箱号"]) == {"CB"}
+    columns = ["箱号", "条码匹配", "箱号对齐", "渠道对齐", RESULT_STATUS_COLUMN, BACKFILL_STATUS_COLUMN]
+    pd.testing.assert_frame_equal(result["compare"][columns].reset_index(drop=True),
+                                  cli["compare"][columns].reset_index(drop=True))
+    pd.testing.assert_series_equal(result["unreport"][RESULT_STATUS_COLUMN].reset_index(drop=True),
+                                   cli["unreport"][RESULT_STATUS_COLUMN].reset_index(drop=True))
+
+
+@pytest.mark.parametrize("name", ["操作分表", "操作分表.xlsx", ""])
+def test_compare_rejects_name_without_container(inputs, name):
+    scan_dir, pkg_dir = inputs
+    index = ScanIndex.from_workbooks(sorted(scan_dir.glob("*.xlsx")))
+    with pytest.raises(ValueError):
+        index.compare((pkg_dir / "CA操作分表.xlsx").read_bytes(), name=name)
+
+
+def test_captured_output_restores_stdout():
+    original = sys.stdout
+    started = threading.Barrier(2)
+    logs = {}
+
+    def work(label):
+        with captured_output() as log:
+            started.wait()
+            print(label)
+            # 捕获期间标准输出仍可用于需要底层流的代码
+            assert sys.stdout.fileno() == original.fileno()
+            assert sys.stdout.encoding == original.encoding
+        logs[label] = log.getvalue()
+
+    threads = [threading.Thread(target=work, args=(label,)) for label in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert logs == {"a": "a\n", "b": "b\n"}
+    assert sys.stdout is original
+
+
+def test_compare_result_fields(inputs):
+    scan_dir, pkg_dir = inputs
+    index = ScanIndex.from_workbooks(sorted(scan_dir.glob("*.xlsx")))
+    result = index.compare((pkg_dir / "CA操作分表.xlsx").read_bytes(), name="CA操作分表.xlsx", report=False)
+    assert set(result) == {"name", "compare", "unreport", "near_miss", "summary", "matched_scans", "scan_matched",
+                           "report_xlsx", "backfill_xlsx", "log"}
+    assert result["report_xlsx"] is None and result["backfill_xlsx"] is not None
@@ -0,0 +1,84 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from compare_shards import merge_shards, plan_shards, run_shard
+from compare_table_v3 import build_batch_summary, load_scan_data, process_full_workflow
+from golden_check import generate_inputs
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return generate_inputs(tmp_path_factory.mktemp("shards"), seed=4, rows_per_channel=20, extra_scans=10)
+
+
+def _summary_sheet(output_dir, sheet):
+    return pd.read_excel(output_dir / "批次汇总.xlsx", sheet_name=sheet)
+
+
+def test_merge_matches_unsharded_batch(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    manifests = plan_shards(str(scan_dir), str(pkg_dir), 2, tmp_path / "shards")
+    assert len(manifests) == 2
+    assert all(run_shard(str(m), str(tmp_path / "out")) for m in manifests)
+    assert merge_shards(tmp_path / "shards", tmp_path / "out")
+
+    df_scan = load_scan_data(scan_dir)
+    results = [process_full_workflow(str(f), df_scan, output_dir=tmp_path / "full")
+               for f in sorted(pkg_dir.glob("*.xlsx"))]
+    scan_matched = results[0]["scan_matched"].copy()
+    for result in results[1:]:
+        scan_matched |= result["scan_matched"]
+    expected = build_batch_summary([r["summary"] for r in results], df_scan, scan_matched,
+                                   [r["matched_scans"] for r in results])
+    pd.testing.assert_frame_equal(_summary_sheet(tmp_path / "out", "按文件汇总"),
+                                  expected["by_file"].rename_axis(columns=None), check_dtype=False)
+    assert len(_summary_sheet(tmp_path / "out", "全部未匹配扫描")) == len(expected["unmatched_scans"])
+
+
+def test_replan_removes_stale_shards(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    shard_dir = tmp_path / "shards"
+    for manifest in plan_shards(str(scan_dir), str(pkg_dir), 3, shard_dir):
+        run_shard(str(manifest), str(tmp_path / "out"))
+
+    manifests = plan_shards(str(scan_dir), str(pkg_dir), 1, shard_dir)
+    assert sorted(p.name for p in shard_dir.glob("shard_*")) == ["shard_000"]
+    assert not (shard_dir / "shard_000" / "result.pkl").exists()
+    # 新计划的分片尚未执行：不能合并进旧结果
+    assert not merge_shards(shard_dir, tmp_path / "out")
+    assert run_shard(str(manifests[0]), str(tmp_path / "out"))
+    assert merge_shards(shard_dir, tmp_path / "out")
+
+
+def test_merge_rejects_foreign_and_outdated_shards(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    shard_dir = tmp_path / "shards"
+    manifests = plan_shards(str(scan_dir), str(pkg_dir), 2, shard_dir)
+    for manifest in manifests:
+        run_shard(str(manifest), str(tmp_path / "out"))
+    assert merge_shards(shard_dir, tmp_path / "out")
+
+    # 计划之外的分片目录（如从旧计划拷回）被忽略，不重复计入
+    shutil.copytree(manifests[0].parent, shard_dir / "shard_099")
+    assert merge_shards(shard_dir, tmp_path / "out")
+    assert _summary_sheet(tmp_path / "out", "按文件汇总")["文件"].is_unique
+
+    # 结果早于 manifest（manifest 在执行后被重新生成）
+    result_time = (manifests[0].parent / "result.pkl").stat().st_mtime
+    os.utime(manifests[0], (result_time + 10, result_time + 10))
+    assert not merge_shards(shard_dir, tmp_path / "out")
+
+
+def test_run_shard_records_failed_files(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    manifest = plan_shards(str(scan_dir), str(pkg_dir), 1, tmp_path / "shards")[0]
+    broken = sorted((manifest.parent / "pkg").glob("*.xlsx"))[0]
+    broken.write_bytes(b"not a workbook")
+
+    assert not run_shard(str(manifest), str(tmp_path / "out"))
+    result = pd.read_pickle(manifest.parent / "result.pkl")
+    assert result["failed"] == [f"pkg/{broken.name}"]
+    assert not merge_shards(tmp_path / "shards", tmp_path / "out")
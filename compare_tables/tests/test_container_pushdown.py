@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from compare_table_v3 import (
+    RESULT_STATUS_COLUMN,
+    load_scan_data,
+    process_full_workflow,
+    scan_container_mask,
+)
+from golden_check import generate_inputs
+
+
+def test_mask_keeps_unparsed_boxes():
+    df = pd.DataFrame({"序号": range(6),
+                       "箱码": ["CA,DE01,PAL1", "CB,DE01,PAL1", "badbox", None, "CA,DE01", "CAX,DE01,PAL1"],
+                       "时间": "t", "条码": "FBA1"})
+    # 无法解析出箱号的行（格式不对或为空）可能属于任何箱号，不能筛掉
+    assert scan_container_mask(df, {"CA"}).tolist() == [True, False, True, True, True, False]
+    assert scan_container_mask(df, {"CA"}, other_containers=True).tolist() == [False, True, False, False, False, True]
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return generate_inputs(tmp_path_factory.mktemp("pushdown"), seed=5, containers=("CA", "CB"),
+                           rows_per_channel=20, extra_scans=10)
+
+
+def test_pushdown_keeps_results_for_the_loaded_containers(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    full = load_scan_data(scan_dir)
+    only_ca = load_scan_data(scan_dir, {"CA"})
+    assert len(only_ca) < len(full)
+    assert not only_ca["箱号"].isin(["CB", "OTHER"]).any()
+    # 无法解析出箱号的扫描行（如 badbox、条码作为托盘贴扫描）都保留
+    unparsed = ~full["箱号"].isin(["CA", "CB", "OTHER"])
+    assert unparsed.any()
+    assert (~only_ca["箱号"].isin(["CA"])).sum() == unparsed.sum()
+
+    # 与先加载全部扫描、再去掉其他箱号的扫描所得结果相同（扫错箱号的扫描不在本批结果中）
+    pkg_file = str(pkg_dir / "CA操作分表.xlsx")
+    expected = process_full_workflow(pkg_file, full[~full["箱号"].isin(["CB", "OTHER"])].reset_index(drop=True),
+                                     output_dir=tmp_path / "full")
+    pushed = process_full_workflow(pkg_file, only_ca, output_dir=tmp_path / "pushed")
+    columns = ["预报单号", "条码匹配", "箱号对齐", "渠道对齐", "原始扫描序号", RESULT_STATUS_COLUMN]
+    pd.testing.assert_frame_equal(pushed["compare"][columns].reset_index(drop=True),
+                                  expected["compare"][columns].reset_index(drop=True))
@@ -0,0 +1,26 @@
+import pandas as pd
+
+import compare_table_v3 as v3
+
+
+def _codes(numbers):
+    return pd.Series([f"C12XX{n:011d}ABCD" for n in numbers], dtype=object)
+
+
+def test_decode_cache_eviction_keeps_batch_results(monkeypatch):
+    """缓存超出上限被清空时，本批次中已缓存的条码仍能得到解码结果"""
+    monkeypatch.setattr(v3, "_DECODE_CACHE_LIMIT", 5)
+    v3.clear_decode_cache()
+    try:
+        first = v3.decode_barcodes(_codes(range(4)))
+        # 与上一批重叠 2 个条码，新增 3 个，超出上限
+        second = v3.decode_barcodes(_codes(range(2, 7)))
+    finally:
+        v3.clear_decode_cache()
+
+    v3.clear_decode_cache()
+    expected = v3.decode_barcodes(_codes(range(2, 7)))
+    v3.clear_decode_cache()
+    assert first.notna().all()
+    assert second.tolist() == expected.tolist()
+    assert second.notna().all()
@@ -0,0 +1,25 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from compare_table_v3 import STATUS_FILLS, write_status_sheet
+from golden_check import compare_workbooks
+
+
+def _export(path, fill_mode):
+    df = pd.DataFrame({"预报单号": ["A", "B", "C", "D", "E"], "箱号": ["CA"] * 5})
+    statuses = pd.Series(["红", "黄", "绿", "橙", ""])
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        write_status_sheet(writer, "比较结果", df, statuses, fill_mode)
+    return path
+
+
+def test_rules_mode_uses_the_same_fills_as_cells(tmp_path):
+    cells = _export(tmp_path / "cells.xlsx", "cells")
+    rules = _export(tmp_path / "rules.xlsx", "rules")
+    # 前景色与背景色都相同（橙色的背景色为 FFA500）
+    assert compare_workbooks(cells, rules) == []
+
+    ws = load_workbook(rules)["比较结果"]
+    orange = next(rule.dxf.fill for cf_range in ws.conditional_formatting for rule in cf_range.rules
+                  if rule.formula[0].endswith('"橙"'))
+    assert orange.bgColor.rgb == STATUS_FILLS["橙"].bgColor.rgb == "00FFA500"
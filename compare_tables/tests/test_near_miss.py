@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from compare_table_v3 import build_near_miss_index, lookup_near_misses
+from scan_store import open_scan_store, publish_scan_store
+
+
+@pytest.fixture(scope="module")
+def df_scan():
+    # 600 个共享前缀 FBA15 的条码：FBA / BA1 / A15 出现在过多条码中，不入索引
+    codes = [f"FBA15{i:05d}" for i in range(600)] + ["FBA15", "FBA15K7Q2M"]
+    return pd.DataFrame({"fba条码": codes})
+
+
+@pytest.fixture(scope="module", params=["memory", "store"])
+def index(request, df_scan, tmp_path_factory):
+    index = build_near_miss_index(df_scan)
+    assert {"FBA", "BA1", "A15"} <= index["stop_grams"]
+    if request.param == "store":
+        path = publish_scan_store(df_scan, tmp_path_factory.mktemp("near_miss") / "store", index)
+        index = open_scan_store(path)["near_miss_index"]
+    return index
+
+
+def _suggest(query, index, **kwargs):
+    return [(str(index["codes"][code_id]), dist) for code_id, dist in lookup_near_misses(query, index, **kwargs)]
+
+
+def test_one_digit_misread_of_common_code(index):
+    # FBA16 的 n-gram 只有公共片段或不存在的片段
+    assert _suggest("FBA16", index) == [("FBA15", 1)]
+
+
+def test_truncated_scan(index):
+    # 扫描只读到 FBA15（被截断）
+    assert _suggest("FBA15XY", index)[0] == ("FBA15", 2)
+
+
+def test_indexed_query_still_uses_postings(index):
+    assert _suggest("FBA15K7Q2N", index)[0] == ("FBA15K7Q2M", 1)
+    # 没有共享片段也没有公共片段的长条码不会逐个比较
+    assert _suggest("ZZZZZZZZZZ", index) == []
@@ -0,0 +1,82 @@
+import importlib
+import textwrap
+
+import pytest
+
+from golden_check import generate_inputs
+from pipeline import CodeIndex, build_pipeline
+
+
+def _write(path, text):
+    path.write_text(textwrap.dedent(text), encoding="utf-8")
+
+
+def test_stage_code_digest_follows_only_used_definitions(tmp_path, monkeypatch):
+    _write(tmp_path / "helpers.py", """
+        SCALE = 2
+
+        def read():
+            return 1
+
+        def layout(x):
+            return x * SCALE
+    """)
+    _write(tmp_path / "stages.py", """
+        from helpers import layout, read
+
+        def ingest():
+            return read()
+
+        def export():
+            return layout(read())
+    """)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    stages = importlib.import_module("stages")
+    before = CodeIndex(tmp_path)
+    ingest_key, export_key = before.digest(stages.ingest), before.digest(stages.export)
+
+    # 只改导出用到的常量：读取阶段的代码摘要不变
+    _write(tmp_path / "helpers.py", (tmp_path / "helpers.py").read_text(encoding="utf-8").replace("2", "3"))
+    after = CodeIndex(tmp_path)
+    assert after.digest(stages.ingest) == ingest_key
+    assert after.digest(stages.export) != export_key
+
+    # 改读取函数：两个阶段都变
+    _write(tmp_path / "helpers.py", (tmp_path / "helpers.py").read_text(encoding="utf-8").replace("1", "4"))
+    changed = CodeIndex(tmp_path)
+    assert changed.digest(stages.ingest) != ingest_key
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return generate_inputs(tmp_path_factory.mktemp("pipeline"), seed=6, containers=("CA", "CB"),
+                           rows_per_channel=20, extra_scans=10)
+
+
+def _status(pipeline):
+    status = pipeline.status()
+    return dict(zip(status["阶段"], status["状态"]))
+
+
+def test_missing_split_part_reruns_only_its_export(inputs, tmp_path):
+    scan_dir, pkg_dir = inputs
+    options = {"max_rows": 10, "split_mode": "files"}
+
+    def pipeline():
+        return build_pipeline(scan_dir, pkg_dir, tmp_path / "work", tmp_path / "out", options)
+
+    assert pipeline().run()
+    assert set(_status(pipeline()).values()) == {"最新"}
+
+    part = tmp_path / "out" / "CB操作分表_比较结果_002.xlsx"
+    assert part.exists()
+    part.unlink()
+    stale = {name for name, state in _status(pipeline()).items() if state != "最新"}
+    assert stale == {"export:CB操作分表"}
+    assert pipeline().run()
+    assert part.exists()
+
+    # 报告选项变化只影响导出阶段
+    options["fill_mode"] = "rules"
+    stale = {name for name, state in _status(pipeline()).items() if state != "最新"}
+    assert stale == {"export:CA操作分表", "export:CB操作分表"}
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+import progress as progress_module
+from progress import BatchProgress
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(progress_module.time, "time", clock)
+    return clock
+
+
+def test_running_stage_rate_uses_its_own_progress(clock):
+    progress = BatchProgress(total_files=2, stream=io.StringIO())
+    # 之前完成的同名阶段很慢：累计 100 行 / 10 秒
+    with progress.stage("比对", 100):
+        clock.now += 10
+    with progress.stage("比对", 1000):
+        clock.now += 2
+        progress.advance(800)
+        assert progress.current_rate() == 400
+        assert "(400 行/秒)" in progress.render()
+    assert progress.current_rate() is None
+    assert progress.rates()["比对"] == 1100 / 12
+
+
+def test_eta_excludes_scan_loading(clock):
+    progress = BatchProgress(stream=io.StringIO())
+    with progress.stage("加载扫描"):
+        clock.now += 100
+    progress.start_batch(3, 300.0)
+    clock.now += 10
+    progress.finish_file(True, "CA操作分表.xlsx", 100.0)
+    assert progress.eta() == 20
+
+
+def test_merge_stage_stats_from_workers(clock):
+    worker = BatchProgress(enabled=False)
+    with worker.stage("比对", 50):
+        clock.now += 5
+    progress = BatchProgress(enabled=False)
+    with progress.stage("加载扫描", 10):
+        clock.now += 1
+    progress.merge_stage_stats(worker.stage_stats())
+    progress.merge_stage_stats(worker.stage_stats())
+    assert progress.stage_rows == {"加载扫描": 10, "比对": 100}
+    assert progress.rates()["比对"] == 10
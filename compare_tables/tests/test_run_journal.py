@@ -0,0 +1,104 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import compare_table_v3 as v3
+from compare_table_v3 import journal_options, load_journal_result, record_journal_entry
+from golden_check import generate_inputs
+
+
+def _record(tmp_path, options, report_files):
+    pkg_file = tmp_path / "CA操作分表.xlsx"
+    backfill_file = tmp_path / "回填结果_CA操作分表.xlsx"
+    for path in [pkg_file, backfill_file] + report_files:
+        path.write_bytes(b"x")
+    result = {"summary": {"文件": "CA"}, "matched_scans": [], "scan_matched": np.array([True, False]),
+              "report_files": report_files, "backfill_file": backfill_file}
+    journal = {}
+    record_journal_entry(journal, tmp_path, pkg_file, "p", "s", result, options)
+    return journal, pkg_file
+
+
+def test_changed_report_options_miss(tmp_path):
+    options = journal_options({"fill_mode": "cells", "max_rows": 10, "split_mode": "sheets",
+                               "split_workers": 1, "report_format": "html"})
+    journal, pkg_file = _record(tmp_path, options, [tmp_path / "index.html"])
+
+    cached = load_journal_result(journal, pkg_file, "p", "s", 2, options)
+    assert cached is not None and cached["scan_matched"].tolist() == [True, False]
+    # split_workers 不影响输出
+    same = journal_options({**options, "split_workers": 4})
+    assert load_journal_result(journal, pkg_file, "p", "s", 2, same) is not None
+    for change in ({"report_format": "xlsx"}, {"fill_mode": "rules"}, {"max_rows": 5}, {"backend": "columnar"}):
+        assert load_journal_result(journal, pkg_file, "p", "s", 2, {**options, **change}) is None
+
+
+def test_missing_split_part_misses(tmp_path):
+    options = journal_options({"split_mode": "files"})
+    parts = [tmp_path / "CA操作分表_比较结果.xlsx", tmp_path / "CA操作分表_比较结果_001.xlsx",
+             tmp_path / "CA操作分表_比较结果_002.xlsx"]
+    journal, pkg_file = _record(tmp_path, options, parts)
+    assert load_journal_result(journal, pkg_file, "p", "s", 2, options) is not None
+    parts[2].unlink()
+    assert load_journal_result(journal, pkg_file, "p", "s", 2, options) is None
+
+
+def test_same_name_in_other_folder_has_own_entry(tmp_path):
+    options = journal_options()
+    for folder in ("day1", "day2"):
+        (tmp_path / folder).mkdir()
+    journal = {}
+    for folder in ("day1", "day2"):
+        pkg_file = tmp_path / folder / "CA操作分表.xlsx"
+        pkg_file.write_bytes(folder.encode())
+        result = {"summary": {"文件": folder}, "matched_scans": [], "scan_matched": np.array([folder == "day1"]),
+                  "report_files": [], "backfill_file": pkg_file}
+        record_journal_entry(journal, tmp_path, pkg_file, folder, "s", result, options)
+
+    for folder in ("day1", "day2"):
+        cached = load_journal_result(journal, tmp_path / folder / "CA操作分表.xlsx", folder, "s", 1, options)
+        assert cached["summary"] == {"文件": folder}
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return generate_inputs(tmp_path_factory.mktemp("journal"), seed=8, rows_per_channel=15, extra_scans=5)
+
+
+def _main(monkeypatch, capsys, *args) -> str:
+    monkeypatch.setattr(sys, "argv", ["compare_table_v3.py", *map(str, args), "--no-progress"])
+    v3.main()
+    return capsys.readouterr().out
+
+
+def test_resume_skips_completed_and_retries_failed_files(inputs, tmp_path, monkeypatch, capsys):
+    scan_dir, pkg_dir = inputs
+    monkeypatch.chdir(tmp_path)
+    workflow = v3.process_full_workflow
+
+    def fail_cb(table_b_path, *args, **kwargs):
+        return None if Path(table_b_path).name == "CB操作分表.xlsx" else workflow(table_b_path, *args, **kwargs)
+
+    monkeypatch.setattr(v3, "process_full_workflow", fail_cb)
+    assert "成功处理 2/3 个文件" in _main(monkeypatch, capsys, scan_dir, pkg_dir)
+
+    monkeypatch.setattr(v3, "process_full_workflow", workflow)
+    out = _main(monkeypatch, capsys, scan_dir, pkg_dir, "--resume")
+    assert "CA操作分表.xlsx: 输入未变化且输出已存在，跳过" in out
+    assert "CC操作分表.xlsx: 输入未变化且输出已存在，跳过" in out
+    assert "处理文件: CB操作分表.xlsx" in out
+    assert "成功处理 3/3 个文件（其中跳过 2 个）" in out
+
+    assert "成功处理 3/3 个文件（其中跳过 3 个）" in _main(monkeypatch, capsys, scan_dir, pkg_dir, "--resume")
+
+
+def test_resume_with_seen_store_skips_rerun(inputs, tmp_path, monkeypatch, capsys):
+    scan_dir, pkg_dir = inputs
+    monkeypatch.chdir(tmp_path)
+    options = ("--seen-store", tmp_path / "seen", "--run-label", "day1")
+    _main(monkeypatch, capsys, scan_dir, pkg_dir, *options)
+    # 历史扫描记录已更新，但本批扫描的标记不变：续跑时全部跳过
+    out = _main(monkeypatch, capsys, scan_dir, pkg_dir, "--resume", *options[:2], "--run-label", "day1-rerun")
+    assert "成功处理 3/3 个文件（其中跳过 3 个）" in out
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from compare_table_v3 import (compare_scan_to_pkg, compare_with_store, filter_valid_boxes, load_scan_data,
+                              preprocess_pkg_list)
+from golden_check import generate_inputs
+from scan_store import column_keys, column_text, gather_scan_rows, open_scan_store, publish_scan_store
+
+
+def _scan_frame():
+    return pd.DataFrame({
+        "条码": ["X1", "X2", "X1", np.nan],
+        "备注": ["短", "很长的备注" * 2000, np.nan, "短"],
+        "混合": ["a", 7, 2.5, pd.Timestamp("2024-05-01 08:30")],
+        "布尔": [True, False, np.nan, True],
+        "时间": pd.to_datetime(["2024-01-01", "2024-01-02", None, "2024-01-04"]),
+        "带时区": pd.to_datetime(["2024-01-01 10:00", None, "2024-03-01 09:00", "2024-01-04 00:00"]).tz_localize("Asia/Shanghai"),
+        "序号": [1, 2, 3, 4],
+    }, index=[10, 11, 12, 13])
+
+
+def test_round_trip_keeps_values_and_types(tmp_path):
+    df = _scan_frame()
+    store = open_scan_store(publish_scan_store(df, tmp_path / "store"))
+
+    restored = gather_scan_rows(store, [3, 0, 2, 1])
+    expected = df.iloc[[3, 0, 2, 1]]
+    pd.testing.assert_frame_equal(restored, expected)
+    assert isinstance(restored["混合"].iloc[0], pd.Timestamp)
+    assert restored["布尔"].iloc[1] is True
+
+
+def test_long_value_does_not_widen_other_rows(tmp_path):
+    df = _scan_frame()
+    path = publish_scan_store(df, tmp_path / "store")
+    remark = df.columns.get_loc("备注")
+    assert np.load(path / f"col_{remark}.npy").dtype == np.int32
+    # 每个不同的值只保存一次
+    assert np.load(path / f"col_{remark}.dict_data.npy").nbytes < 2 * len("很长的备注".encode("utf-8")) * 2000
+
+
+def test_column_text(tmp_path):
+    store = open_scan_store(publish_scan_store(_scan_frame(), tmp_path / "store"))
+    texts, null = column_text(store, "混合")
+    assert list(texts) == ["a", "7", "2.5", "2024-05-01 08:30:00"]
+    assert not null.any()
+    texts, null = column_text(store, "条码")
+    assert list(null) == [False, False, False, True]
+
+
+def test_column_keys_compare_typed_values(tmp_path):
+    df = pd.DataFrame({"箱号": [123, "123", 123.0, np.nan, "CA"], "序号": [1.0, 1.0, 2.0, np.nan, 3.0]})
+    store = open_scan_store(publish_scan_store(df, tmp_path / "store"))
+    keys, null = column_keys(store, "箱号")
+    # 与 pandas 相同：整数 123 与 123.0 是同一个值，文本 "123" 不同
+    assert keys[0] == keys[2] and keys[0] != keys[1]
+    assert list(null) == [False, False, False, True, False]
+    keys, null = column_keys(store, "序号")
+    assert keys[0] == keys[1] and keys[1] != keys[2] and null[3]
+
+
+def test_store_box_filter_matches_in_memory(tmp_path):
+    scan_dir, pkg_dir = generate_inputs(tmp_path, seed=9, containers=("CA", "CB"), rows_per_channel=15)
+    df_scan = load_scan_data(scan_dir)
+    df_pkg = preprocess_pkg_list(str(pkg_dir / "CA操作分表.xlsx"))
+    # 有匹配的扫描箱号写成整数 123，没有匹配的写成文本 "123"：两者不是同一个箱号
+    matched = (compare_scan_to_pkg(df_scan, df_pkg)["是否匹配"] == "是").to_numpy()
+    df_scan["箱号"] = pd.Series([123 if m else "123" for m in matched], index=df_scan.index, dtype=object)
+
+    expected = filter_valid_boxes(compare_scan_to_pkg(df_scan, df_pkg))
+    store = open_scan_store(publish_scan_store(df_scan, tmp_path / "store"))
+    _, df_unreport, _ = compare_with_store(store, df_pkg)
+    assert (expected["箱号"] == 123).any() and not (expected["箱号"] == "123").any()
+    pd.testing.assert_frame_equal(df_unreport.reset_index(drop=True), expected.reset_index(drop=True))
@@ -0,0 +1,58 @@
+import pandas as pd
+
+from compare_table_v3 import (
+    HISTORY_DUP_COLUMN,
+    HISTORY_FIRST_RUN_COLUMN,
+    mark_history_duplicates,
+    record_seen_scans,
+    scan_dataset_hash,
+)
+from seen_store import SeenStore
+
+
+def _scans(rows):
+    """rows: [(序号, 时间, 条码)]；fba条码 与 条码 相同"""
+    df = pd.DataFrame([[seq, "CA,DE01,PAL1", time, code] for seq, time, code in rows],
+                      columns=["序号", "箱码", "时间", "条码"])
+    df["fba条码"] = df["条码"]
+    return df
+
+
+def _run(store_dir, df, label):
+    """与命令行相同：加载时标记，运行结束后记入历史记录；返回标记后的扫描表"""
+    marked = mark_history_duplicates(df, SeenStore(store_dir), label)
+    record_seen_scans(marked, SeenStore(store_dir), label)
+    return marked
+
+
+DAY1 = [(1, "d1", "FBA1"), (2, "d1", "FBA2"), (3, "d1", "FBA2")]
+DAY2 = DAY1 + [(4, "d2", "FBA1"), (5, "d2", "FBA3")]
+
+
+def test_rerun_of_first_batch_is_not_flagged(tmp_path):
+    first = _run(tmp_path / "seen", _scans(DAY1), "day1")
+    again = _run(tmp_path / "seen", _scans(DAY1), "day1-rerun")
+    assert first[HISTORY_DUP_COLUMN].tolist() == [''] * 3
+    assert again[HISTORY_DUP_COLUMN].tolist() == [''] * 3
+    assert scan_dataset_hash(first) == scan_dataset_hash(again)
+
+
+def test_rerun_keeps_history_flags(tmp_path):
+    _run(tmp_path / "seen", _scans(DAY1), "day1")
+    first = _run(tmp_path / "seen", _scans(DAY2), "day2")
+    again = _run(tmp_path / "seen", _scans(DAY2), "day2")
+    # 第 4 条是 FBA1 在 day2 的新扫描；FBA3 首次出现
+    assert first[HISTORY_DUP_COLUMN].tolist() == ['', '', '', '是', '']
+    assert first[HISTORY_FIRST_RUN_COLUMN].tolist() == ['', '', '', 'day1', '']
+    pd.testing.assert_frame_equal(first, again)
+    assert scan_dataset_hash(first) == scan_dataset_hash(again)
+
+
+def test_resumed_first_batch_records_all_its_scans(tmp_path):
+    # 同一批次先处理了一部分扫描，续跑时加载全部：首次批次内的扫描都不算历史重复
+    _run(tmp_path / "seen", _scans(DAY1[:2]), "day1")
+    resumed = _run(tmp_path / "seen", _scans(DAY1), "day1")
+    # 换了批次名重跑：第 3 条已作为 day1 的扫描记录
+    rerun = _run(tmp_path / "seen", _scans(DAY1), "day1-rerun")
+    assert resumed[HISTORY_DUP_COLUMN].tolist() == ['', '', '']
+    assert rerun[HISTORY_DUP_COLUMN].tolist() == ['', '', '']
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from compare_table_v3 import REPORT_INDEX_SHEET, STATUS_FILLS, STATUS_HELPER_HEADER, export_split_report
+
+STATUSES = ["红", "黄", "绿", "橙", ""]
+
+
+def _parts():
+    df = pd.DataFrame({"预报单号": [f"FBA{i:03d}" for i in range(25)], "箱号": ["CA"] * 25})
+    statuses = pd.Series([STATUSES[i % len(STATUSES)] for i in range(25)])
+    empty = pd.DataFrame({"条码": pd.Series(dtype=object)})
+    return [("比较结果", df, statuses), ("未预报结果", empty, pd.Series(dtype=object))]
+
+
+def _index(path):
+    ws = load_workbook(path)[REPORT_INDEX_SHEET]
+    rows = [[cell.value for cell in row] for row in ws.iter_rows(min_row=2)]
+    links = [ws.cell(row=k, column=2).hyperlink for k in range(2, ws.max_row + 1)]
+    return rows, [link.location or link.target for link in links]
+
+
+def _fills(ws, n_rows):
+    return [ws.cell(row=row, column=1).fill.fgColor.rgb if ws.cell(row=row, column=1).fill.fill_type else None
+            for row in range(2, n_rows + 2)]
+
+
+def _expected_fills(statuses):
+    return [STATUS_FILLS[s].fgColor.rgb if s in STATUS_FILLS else None for s in statuses]
+
+
+def test_split_into_sheets(tmp_path):
+    report = tmp_path / "CA操作分表_比较结果.xlsx"
+    near_miss = pd.DataFrame({"预报单号": ["FBA999"], "建议扫描条码": ["FBA998"]})
+    assert export_split_report(_parts(), report, near_miss, max_rows=10) == [report]
+
+    wb = load_workbook(report)
+    assert wb.sheetnames == [REPORT_INDEX_SHEET, "比较结果", "比较结果_2", "比较结果_3", "未预报结果", "近似匹配建议"]
+    rows, links = _index(report)
+    assert rows == [["比较结果", "比较结果", 1, 10, 10], ["比较结果", "比较结果_2", 11, 20, 10],
+                    ["比较结果", "比较结果_3", 21, 25, 5], ["未预报结果", "未预报结果", 1, 0, 0]]
+    assert links == ["#'比较结果'!A1", "#'比较结果_2'!A1", "#'比较结果_3'!A1", "#'未预报结果'!A1"]
+
+    _, df, statuses = _parts()[0]
+    sheets = pd.read_excel(report, sheet_name=["比较结果", "比较结果_2", "比较结果_3"])
+    pd.testing.assert_frame_equal(pd.concat(sheets.values(), ignore_index=True), df)
+    # 各分段的着色与整表状态一致
+    fills = _fills(wb["比较结果"], 10) + _fills(wb["比较结果_2"], 10) + _fills(wb["比较结果_3"], 5)
+    assert fills == _expected_fills(statuses)
+
+
+@pytest.mark.parametrize("fill_mode", ["cells", "rules"])
+def test_split_into_files(tmp_path, fill_mode):
+    report = tmp_path / "CA操作分表_比较结果.xlsx"
+    outputs = export_split_report(_parts(), report, fill_mode=fill_mode, max_rows=10, split_mode="files")
+    parts = [tmp_path / f"CA操作分表_比较结果_{k:03d}.xlsx" for k in (1, 2, 3)]
+    assert outputs == [report] + parts + [tmp_path / "CA操作分表_未预报结果_001.xlsx"]
+    assert all(path.exists() for path in outputs)
+
+    # 主文件只有索引，链接指向各分段文件
+    assert load_workbook(report).sheetnames == [REPORT_INDEX_SHEET]
+    rows, links = _index(report)
+    assert [row[1] for row in rows] == links == [path.name for path in outputs[1:]]
+    assert [row[2:] for row in rows] == [[1, 10, 10], [11, 20, 10], [21, 25, 5], [1, 0, 0]]
+
+    _, df, _ = _parts()[0]
+    restored = pd.concat([pd.read_excel(path, sheet_name="比较结果") for path in parts], ignore_index=True)
+    # rules 方式的隐藏状态列不属于报告内容
+    pd.testing.assert_frame_equal(restored.drop(columns=[STATUS_HELPER_HEADER], errors="ignore"), df)
@@ -1,14 +1,166 @@
+import numpy as np
 import pandas as pd
 import os
 import glob
-import itertools
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import load_workbook
 
-def merge_orders():
+
+def read_header(file_path):
+    """只读取第一个工作表的首行（表头），read_only 模式按行流式读取，不解析整个工作簿"""
+    wb = load_workbook(file_path, read_only=True)
+    try:
+        ws = wb.worksheets[0]
+        for row in ws.iter_rows(min_row=1, max_row=1, values_only=True):
+            return [value for value in row if value is not None]
+        return []
+    finally:
+        wb.close()
+
+# 各月份汇总的缓存目录（位于月份文件所在目录），缓存文件名为 v<版本>_<文件 sha256>.pkl
+CACHE_DIR = '.merge_orders_cache'
+# 汇总内容或格式变化时递增，旧缓存随之失效
+CACHE_VERSION = 1
+
+
+# 有 '数量' 列时解析月份文件只读取这些列
+MONTH_COLUMNS = ('客户', '地址代码', '数量')
+# 月份汇总的列
+AGGREGATE_COLUMNS = ['客户', '地址代码', 'value']
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def aggregate_month(df_month, month_num):
+    """
+    一个月份文件汇总为 客户 / 地址代码 / value 三列：同一 (客户, 地址代码) 的数量相加（全为空时为空）。
+    数量列为 '数量'，没有时取第三列；都没有时 value 为空（组合仍保留在主表中）。
+    """
+    target_col = '数量'
+    if target_col not in df_month.columns:
+        if len(df_month.columns) >= 3:
+            target_col = df_month.columns[2]
+        else:
+            print(f"Warning: Could not find data column for {month_num}")
+            target_col = None
+
+    values = df_month[target_col] if target_col is not None else np.nan
+    month = pd.DataFrame({'客户': df_month['客户'], '地址代码': df_month['地址代码'], 'value': values})
+    # dropna=False：保留客户或地址代码为空的行，dense 时仍收集到这些行中的客户 / 地址代码
+    return month.groupby(['客户', '地址代码'], sort=False, dropna=False)['value'].sum(min_count=1).reset_index()
+
+
+def parse_month(file_path, month_num, has_quantity=True):
+    """
+    解析一个月份文件并汇总（在子进程中执行）。有 '数量' 列时只读取 客户 / 地址代码 / 数量 三列；
+    返回汇总各列（AGGREGATE_COLUMNS）的数组而不是整张表，减少进程间传输的数据。
+    """
+    usecols = (lambda column: column in MONTH_COLUMNS) if has_quantity else None
+    aggregate = aggregate_month(pd.read_excel(file_path, usecols=usecols), month_num)
+    return tuple(aggregate[column].to_numpy() for column in AGGREGATE_COLUMNS)
+
+
+def load_months(month_files, cache_dir=None, workers=None):
+    """
+    读取各月份的汇总（见 aggregate_month），返回 ({月份: 汇总}, 用到的缓存文件)，月份顺序与 month_files 相同。
+    month_files 为 {月份: (文件路径, 是否有 '数量' 列)}。
+    cache_dir 不为空时按文件内容哈希缓存，文件未变化时直接读取缓存；需要解析的文件在进程池中并行解析
+    （workers 默认为 CPU 核数）。
+    """
+    aggregates = {}
+    cache_files = {}
+    pending = []
+    for month_num, (file_path, has_quantity) in month_files.items():
+        if cache_dir is not None:
+            cache_files[month_num] = os.path.join(cache_dir, f"v{CACHE_VERSION}_{file_sha256(file_path)}.pkl")
+            if os.path.exists(cache_files[month_num]):
+                print(f"Using cached ({month_num}): {file_path}")
+                aggregates[month_num] = pd.read_pickle(cache_files[month_num])
+                continue
+        print(f"Loading ({month_num}): {file_path}...")
+        pending.append(month_num)
+
+    parse_args = [(month_files[month_num][0], month_num, month_files[month_num][1]) for month_num in pending]
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(parse_month, *zip(*parse_args)))
+    else:
+        results = [parse_month(*args) for args in parse_args]
+
+    for month_num, arrays in zip(pending, results):
+        aggregate = pd.DataFrame(dict(zip(AGGREGATE_COLUMNS, arrays)))
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # 先写临时文件再改名，中断时不会留下不完整的缓存
+            tmp_file = f"{cache_files[month_num]}.{os.getpid()}.tmp"
+            aggregate.to_pickle(tmp_file)
+            os.replace(tmp_file, cache_files[month_num])
+        aggregates[month_num] = aggregate
+
+    return {month_num: aggregates[month_num] for month_num in month_files}, set(cache_files.values())
+
+
+def prune_cache(cache_dir, used_cache_files):
+    """删除本次没有用到的缓存（对应的月份文件已修改或删除）"""
+    for cache_file in glob.glob(os.path.join(cache_dir, "*.pkl")):
+        if cache_file not in used_cache_files:
+            os.remove(cache_file)
+
+
+def month_sums(df, by, month_columns):
+    """按 by 分组对各月份列求和（全为空时和为 0），保持分组首次出现的顺序"""
+    return df.groupby(by, sort=False)[month_columns].sum(numeric_only=True).reindex(columns=month_columns)
+
+
+def add_summary_rows(master_df, month_columns, grand_total=False, address_totals=False):
+    """
+    在每个客户的最后插入 'Total' 合计行。master_df 须已按客户排序（每个客户的行连续），
+    合计由一次分组汇总得到，按各客户块的结束位置插入，不再整表重新排序。
+    address_totals=True 时在末尾追加按地址代码的合计（客户为 'Total'），grand_total=True 时再追加总计行（'Total', 'Total'）。
+    """
+    summary_df = month_sums(master_df, '客户', month_columns).reset_index()
+    summary_df.insert(1, '地址代码', 'Total')
+
+    # 每个客户块结束的位置（按出现顺序，与 summary_df 的行一一对应）
+    block_ends = np.cumsum(master_df.groupby('客户', sort=False).size().to_numpy())
+    order = np.insert(np.arange(len(master_df)), block_ends, len(master_df) + np.arange(len(summary_df)))
+    final_df = pd.concat([master_df, summary_df], ignore_index=True).iloc[order]
+
+    extra = []
+    if address_totals:
+        address_df = month_sums(master_df, '地址代码', month_columns).sort_index().reset_index()
+        address_df.insert(0, '客户', 'Total')
+        extra.append(address_df)
+    if grand_total:
+        sums = master_df[month_columns].sum(numeric_only=True).reindex(month_columns)
+        extra.append(pd.DataFrame([{'客户': 'Total', '地址代码': 'Total', **sums}]))
+    if extra:
+        final_df = pd.concat([final_df] + extra, ignore_index=True)
+    return final_df
+
+
+def merge_orders(dense=False, grand_total=False, address_totals=False, use_cache=True, workers=None):
+    """
+    合并当前目录下按数字命名的月份文件。默认只输出实际出现过的 (客户, 地址代码) 组合（稀疏）；
+    dense=True 时展开为每个客户 × 所有地址代码的完整组合（客户、地址代码很多时占用大量内存）。
+    grand_total / address_totals 见 add_summary_rows；use_cache=False 时不读写各月份汇总的缓存，
+    workers 为并行解析月份文件的进程数（见 load_months）。
+    """
     # 1. 扫描当前目录下所有的 .xlsx 文件
     current_dir = os.getcwd()
     all_files = glob.glob(os.path.join(current_dir, "*.xlsx"))
     
     valid_files = {}
+    headers = {}
     
     print(f"Scanning directory: {current_dir}")
     
@@ -20,15 +172,15 @@ def merge_orders():
             continue
             
         try:
-            # 读取表头，只读前几行以提高速度
-            df_preview = pd.read_excel(file_path, nrows=1)
-            columns = df_preview.columns.tolist()
+            # 只读取表头（pd.read_excel 的 nrows=1 仍会解析大部分工作表）；有效文件之后只完整读取一次
+            columns = read_header(file_path)
             
             # 检查必要列是否存在
             if '客户' in columns and '地址代码' in columns:
                 # 使用文件名（包含扩展名前部分）作为月份
                 month_name = os.path.splitext(filename)[0]
                 valid_files[month_name] = file_path
+                headers[file_path] = columns
             else:
                 pass
                 
@@ -50,82 +202,47 @@ def merge_orders():
     # 按数字大小排序
     sorted_months = sorted(numeric_files.keys())
     
-    # 2. 收集所有唯一的 客户 和 地址代码
-    all_customers = set()
-    all_address_codes = set()
-    
-    loaded_dfs = {}
+    # 2. 读取各月份汇总：按文件内容哈希缓存，只解析新增或修改过的文件
+    # 需要解析的文件在进程池中并行解析
+    cache_dir = os.path.join(current_dir, CACHE_DIR) if use_cache else None
+    month_files = {month_num: (numeric_files[month_num], '数量' in headers[numeric_files[month_num]])
+                   for month_num in sorted_months}
+    month_aggregates, used_cache_files = load_months(month_files, cache_dir, workers)
 
-    for month_num in sorted_months:
-        file_path = numeric_files[month_num]
-        print(f"Loading ({month_num}): {file_path}...")
-        df = pd.read_excel(file_path)
-        loaded_dfs[month_num] = df
-        
-        # 收集唯一值
-        all_customers.update(df['客户'].dropna().unique())
-        all_address_codes.update(df['地址代码'].dropna().unique())
+    if cache_dir is not None:
+        prune_cache(cache_dir, used_cache_files)
+
+    month_columns = [str(month_num) for month_num in sorted_months]
+    stacked = pd.concat([aggregate.assign(month=str(month_num)) for month_num, aggregate in month_aggregates.items()],
+                        ignore_index=True)
         
-    # 3. 构建笛卡尔积：每个客户拥有所有地址代码
-    # list(itertools.product(all_customers, all_address_codes))
-    print("Generating master list (Cartesian product)...")
-    master_data = list(itertools.product(sorted(list(all_customers)), sorted(list(all_address_codes))))
-    master_df = pd.DataFrame(master_data, columns=['客户', '地址代码'])
+    # 3. 构建主表：默认只包含各月实际出现过的 (客户, 地址代码) 组合
+    if dense:
+        # 笛卡尔积：每个客户拥有所有地址代码
+        print("Generating master list (Cartesian product)...")
+        master_index = pd.MultiIndex.from_product([sorted(stacked['客户'].dropna().unique()),
+                                                   sorted(stacked['地址代码'].dropna().unique())],
+                                                  names=['客户', '地址代码'])
+        master_df = master_index.to_frame(index=False)
+    else:
+        print("Generating master list (occurring customer/address pairs)...")
+        master_df = stacked[['客户', '地址代码']].dropna().drop_duplicates()
+        master_df = master_df.sort_values(['客户', '地址代码']).reset_index(drop=True)
     
-    # 4. 填充数据
-    month_columns = []
-    
-    for month_num in sorted_months:
-        df_month = loaded_dfs[month_num]
-        month_col_name = str(month_num) # 列名
-        month_columns.append(month_col_name)
-        
-        target_col = '数量'
-        if target_col not in df_month.columns:
-            if len(df_month.columns) >= 3:
-                target_col = df_month.columns[2]
-            else:
-                print(f"Warning: Could not find data column for {month_num}")
-                continue
-                
-        temp = df_month[['客户', '地址代码', target_col]].rename(columns={target_col: month_col_name})
-        
-        # 合并
-        master_df = pd.merge(master_df, temp, on=['客户', '地址代码'], how='left')
+    # 4. 填充数据：各月汇总纵向合并后一次透视为月份列
+    if not stacked.empty:
+        # min_count=1：该月没有数值时保持空白而不是 0
+        pivot = (stacked.groupby(['客户', '地址代码', 'month'], sort=False)['value'].sum(min_count=1)
+                 .unstack('month'))
+    else:
+        pivot = pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=['客户', '地址代码']))
+    pivot = pivot.reindex(columns=month_columns)
+    pivot.columns.name = None
+    master_df = master_df.join(pivot, on=['客户', '地址代码'])
 
-    # 5. 添加合计行
+    # 5. 添加合计行（主表已按客户、地址代码排序）
     print("Calculating summaries...")
-    
-    # 为了方便排序，我们给原始数据打标 is_summary=0
-    master_df['is_summary'] = 0
-    
-    # 计算按客户分组的合计
-    summary_dfs = []
-    grouped = master_df.groupby('客户')
-    
-    for customer, group in grouped:
-        # 计算该客户所有月份列的和
-        # min_count=0 确保全是 NaN 时和为 0 (或者保留 NaN，看需求，通常 sum 会把 NaN 视为 0)
-        sums = group[month_columns].sum(numeric_only=True)
-        
-        # 构建一行 summary
-        row = {'客户': customer, '地址代码': 'Total', 'is_summary': 1}
-        for col in month_columns:
-            row[col] = sums[col]
-            
-        summary_dfs.append(row)
-        
-    summary_df = pd.DataFrame(summary_dfs)
-    
-    # 合并原始数据和合计
-    final_df = pd.concat([master_df, summary_df], ignore_index=True)
-    
-    # 6. 排序：先按客户，再按 is_summary (0在1前)，最后按地址代码
-    # 这样 'Total' 行会出现在每个客户的最后
-    final_df = final_df.sort_values(by=['客户', 'is_summary', '地址代码'])
-    
-    # 移除辅助列 is_summary
-    final_df = final_df.drop(columns=['is_summary'])
+    final_df = add_summary_rows(master_df, month_columns, grand_total=grand_total, address_totals=address_totals)
     
     # 7. 导出
     output_filename = 'combined_orders_final.xlsx'
@@ -137,4 +254,13 @@ def merge_orders():
         print(f"Error: Could not write to {output_filename}. Please close the file if it is open.")
 
 if __name__ == "__main__":
-    merge_orders()
+    parser = argparse.ArgumentParser(description='合并按数字命名的月份订单文件')
+    parser.add_argument('--dense', action='store_true',
+                        help='输出每个客户 × 所有地址代码的完整组合（默认只输出实际出现过的组合）')
+    parser.add_argument('--grand-total', action='store_true', help='在末尾追加所有客户的总计行')
+    parser.add_argument('--address-totals', action='store_true', help='在末尾追加按地址代码的合计行')
+    parser.add_argument('--no-cache', action='store_true', help='不使用各月份汇总的缓存，重新读取所有月份文件')
+    parser.add_argument('--workers', type=int, default=None, help='并行解析月份文件的进程数（默认为 CPU 核数）')
+    args = parser.parse_args()
+    merge_orders(dense=args.dense, grand_total=args.grand_total, address_totals=args.address_totals,
+                 use_cache=not args.no_cache, workers=args.workers)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# merge_orders.py 以脚本方式运行，测试时把脚本目录加入 sys.path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
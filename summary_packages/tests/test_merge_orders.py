@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge_orders import CACHE_DIR, merge_orders
+
+OUTPUT = "combined_orders_final.xlsx"
+
+
+def _write_month(folder, name, rows, columns=("客户", "地址代码", "数量")):
+    pd.DataFrame(rows, columns=list(columns)).to_excel(folder / f"{name}.xlsx", index=False)
+
+
+def _read_output(folder):
+    # 输出以 (客户, 地址代码) 为索引，合并单元格读回时向下填充
+    return pd.read_excel(folder / OUTPUT, index_col=[0, 1]).reset_index()
+
+
+@pytest.fixture
+def months(tmp_path, monkeypatch):
+    _write_month(tmp_path, "1", [["A", "X1", 1], ["A", "X1", 2], ["B", "X2", 5]])
+    _write_month(tmp_path, "2", [["A", "X2", 3], ["C", "X1", np.nan]])
+    _write_month(tmp_path, "notes", [["A", "X1", 100]])
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_sparse_lists_only_occurring_pairs(months):
+    merge_orders(workers=1)
+    sparse = _read_output(months)
+    assert sparse[["客户", "地址代码"]].values.tolist() == [
+        ["A", "X1"], ["A", "X2"], ["A", "Total"], ["B", "X2"], ["B", "Total"], ["C", "X1"], ["C", "Total"]]
+
+    merge_orders(dense=True, workers=1)
+    dense = _read_output(months)
+    assert len(dense) == 3 * 2 + 3
+    # 出现过的组合（含 Total 行）与稀疏输出相同，其余组合各月为空
+    pd.testing.assert_frame_equal(dense.merge(sparse[["客户", "地址代码"]]), sparse)
+    extra = dense.merge(sparse[["客户", "地址代码"]], how="left", indicator=True)
+    assert extra.loc[extra["_merge"] == "left_only", ["1", "2"]].isna().all().all()
+
+
+def test_months_aggregate_into_one_pivot(months):
+    # 没有 数量 列时取第三列；月份按数字排序（10 在 2 之后）
+    _write_month(months, "10", [["B", "X2", 4], ["B", "X2", 6]], columns=("客户", "地址代码", "件数"))
+    merge_orders(workers=1)
+    result = _read_output(months).set_index(["客户", "地址代码"])
+    assert list(result.columns) == ["1", "2", "10"]
+    # 同一月份重复的组合相加；全为空时保持空白
+    assert result.loc[("A", "X1"), "1"] == 3
+    assert result.loc[("B", "X2"), ["1", "10"]].tolist() == [5, 10]
+    assert np.isnan(result.loc[("C", "X1"), "2"])
+    assert np.isnan(result.loc[("A", "X1"), "2"])
+
+
+def test_total_rows(months):
+    merge_orders(grand_total=True, address_totals=True, workers=1)
+    result = _read_output(months)
+    totals = result[result["地址代码"] == "Total"].set_index("客户")
+    # 每个客户的合计行紧跟在其最后一行之后，空值按 0 计
+    assert totals.loc["A", ["1", "2"]].tolist() == [3, 3]
+    assert totals.loc["C", ["1", "2"]].tolist() == [0, 0]
+    customers = result["客户"].tolist()
+    assert customers[:7] == ["A", "A", "A", "B", "B", "C", "C"]
+    # 末尾依次为按地址代码的合计与总计
+    tail = result.iloc[7:][["客户", "地址代码", "1", "2"]].values.tolist()
+    assert tail == [["Total", "X1", 3, 0], ["Total", "X2", 5, 3], ["Total", "Total", 8, 3]]
+
+
+def test_month_cache_hit_and_miss(months, capsys):
+    merge_orders(workers=1)
+    first = _read_output(months)
+    out = capsys.readouterr().out
+    assert out.count("Loading (") == 2 and "Using cached" not in out
+    cache_dir = months / CACHE_DIR
+    assert len(list(cache_dir.glob("*.pkl"))) == 2
+
+    # 未变化的月份读取缓存，结果相同
+    merge_orders(workers=1)
+    out = capsys.readouterr().out
+    assert out.count("Using cached (") == 2 and "Loading (" not in out
+    pd.testing.assert_frame_equal(_read_output(months), first)
+
+    # 修改的月份重新解析，旧缓存被删除
+    _write_month(months, "2", [["A", "X2", 7]])
+    merge_orders(workers=1)
+    out = capsys.readouterr().out
+    assert "Using cached (1)" in out and "Loading (2)" in out
+    assert len(list(cache_dir.glob("*.pkl"))) == 2
+    assert _read_output(months).set_index(["客户", "地址代码"]).loc[("A", "X2"), "2"] == 7
+
+    # --no-cache 不读缓存
+    merge_orders(use_cache=False, workers=1)
+    assert capsys.readouterr().out.count("Loading (") == 2